@@ -2,6 +2,7 @@
 
 import os
 import socket
+import subprocess
 import sys
 
 from keystoneauth1 import identity
@@ -34,12 +35,19 @@ from charmhelpers.core.hookenv import (
     function_set,
     log,
 )
+from neutron_services import check_restart_timestamps
+from neutron_templating import process_deferred_reloads
 from neutron_utils import (
     assess_status,
+    configure_ovs,
     pause_unit_helper,
     resume_unit_helper,
     register_configs,
 )
+import neutron_deferred
+import neutron_kv
+import neutron_packages
+import neutron_trace
 
 
 def pause(args):
@@ -73,6 +81,10 @@ def restart(args):
     if action_get('run-hooks'):
         log("Charm does not defer any hooks at present", DEBUG)
     if deferred_only:
+        # Services restarted since their restart was deferred need not be
+        # restarted again.
+        check_restart_timestamps()
+        process_deferred_reloads()
         os_utils.restart_services_action(deferred_only=True)
     else:
         os_utils.restart_services_action(services=services)
@@ -99,6 +111,42 @@ def show_deferred_events(args):
     os_utils.show_deferred_events_action_helper()
 
 
+def show_ovs_changes(args):
+    """Show the OVS changes the charm would apply without applying them.
+
+    :param args: Unused
+    :type args: List[str]
+    """
+    try:
+        plan = configure_ovs(dry_run=True)
+    except subprocess.CalledProcessError as e:
+        action_fail("Unable to read the OVS configuration, is "
+                    "openvswitch-switch running? ({})".format(e))
+        return
+    if plan is None:
+        action_fail("Charm does not manage OVS with the configured plugin")
+        return
+    function_set({'changes': '\n'.join(plan.describe()) or 'none'})
+
+
+def show_hook_stats(args):
+    """Show hook duration percentiles and the slowest call sites.
+
+    :param args: Unused
+    :type args: List[str]
+    """
+    summaries = neutron_trace.history()
+    if not summaries:
+        function_set({'message': 'No hook stats recorded, set hook-tracing '
+                                 'to record them.'})
+        return
+    hooks, sites = neutron_trace.hook_stats(summaries,
+                                            top=action_get('top') or 10)
+    function_set({'hooks': yaml.dump(hooks, default_flow_style=False),
+                  'slowest-call-sites': yaml.dump(
+                      sites, default_flow_style=False)})
+
+
 def get_neutron():
     """Return authenticated neutron client.
 
@@ -299,6 +347,8 @@ ACTIONS = {"pause": pause,
            "show-routers": get_routers,
            "show-dhcp-networks": get_dhcp_networks,
            "show-loadbalancers": get_lbaasv2_lb,
+           "show-ovs-changes": show_ovs_changes,
+           "show-hook-stats": show_hook_stats,
            }
 
 
@@ -318,4 +368,7 @@ def main(args):
 
 
 if __name__ == "__main__":
+    neutron_kv.install()
+    neutron_deferred.install()
+    neutron_packages.install()
     sys.exit(main(sys.argv))
@@ -24,7 +24,10 @@ sys.path.append('hooks/')
 import charmhelpers.core as ch_core
 import charmhelpers.contrib.openstack.utils as ch_openstack_utils
 import charmhelpers.contrib.network.ovs as ch_ovs
-import charmhelpers.contrib.network.ovs.ovsdb as ch_ovsdb
+
+import neutron_netns
+import neutron_ovs
+import neutron_ovsdb
 
 
 class BaseDocException(Exception):
@@ -56,22 +59,23 @@ def remove_patch_ports(bridge):
     :param bridge: Name of bridge to look for patch ports to remove.
     :type bridge: str
     """
-    # NOTE: We need to consume all output from the `patch_ports_on_bridge`
-    # generator prior to removing anything otherwise it will raise an error.
-    for patch in list(ch_ovs.patch_ports_on_bridge(bridge)):
-        ch_ovs.del_bridge_port(
-            patch.this_end.bridge,
-            patch.this_end.port,
-            linkdown=False)
-        ch_ovs.del_bridge_port(
-            patch.other_end.bridge,
-            patch.other_end.port,
-            linkdown=False)
+    # NOTE: The patch ports are looked up in a single snapshot of the OVSDB
+    # and both ends of all of them are deleted in one ovs-vsctl transaction.
+    patches = neutron_ovs.ovsdb_snapshot().patch_ports_on_bridge(bridge)
+    plan = neutron_ovs.OVSChangePlan()
+    for patch in patches:
+        for end in (patch.this_end, patch.other_end):
+            plan.commands.append(
+                ('--if-exists', 'del-port', end.bridge, end.port))
+    try:
+        neutron_ovs.apply_ovs_changes(plan)
+    finally:
+        neutron_ovs.reset_ovsdb_snapshot()
 
 
 def remove_per_bridge_controllers():
     """Remove per bridge controllers."""
-    bridges = ch_ovsdb.SimpleOVSDB('ovs-vsctl').bridge
+    bridges = neutron_ovsdb.simple_ovsdb('ovs-vsctl').bridge
     for bridge in bridges:
         if bridge['controller']:
             bridges.clear(str(bridge['_uuid']), 'controller')
@@ -88,27 +92,18 @@ def neutron_ipset_cleanup():
 
 
 def neutron_netns_cleanup():
-    """Perform Neutron netns cleanup."""
-    # FIXME: remove once package dependencies have been backported LP: #1881852
-    subprocess.check_call(('apt', '-y', 'install', 'net-tools'))
-    _tmp_filters = '/etc/neutron/rootwrap.d/charm-n-ovs.filters'
-    with open(_tmp_filters, 'w') as fp:
-        fp.write(
-            '[Filters]\nneutron.cmd.netns_cleanup: CommandFilter, ip, root\n')
-    subprocess.check_call(
-        (
-            'neutron-netns-cleanup',
-            '--force',
-            *[
-                # Existence of these files depend on our configuration.
-                '--config-file={}'.format(cfg) for cfg in (
-                    '/etc/neutron/neutron.conf',
-                    '/etc/neutron/l3_agent.ini',
-                    '/etc/neutron/fwaas_driver.ini',
-                    '/etc/neutron/dhcp_agent.ini',
-                ) if os.path.exists(cfg)]
-        ))
-    os.unlink(_tmp_filters)
+    """Perform Neutron netns cleanup.
+
+    :raises: RuntimeError if any namespace could not be removed
+    """
+    # As neutron-netns-cleanup --force, processes left in the namespaces
+    # are killed; the unit is paused so no agent is using them.
+    remaining = neutron_netns.teardown_namespaces(
+        neutron_netns.list_namespaces(), kill=True,
+        log=lambda msg: ch_core.hookenv.log(msg, level=ch_core.hookenv.ERROR))
+    if remaining:
+        raise RuntimeError(
+            'Unable to remove namespaces: {}'.format(', '.join(remaining)))
 
 
 def cleanup(args):
@@ -10,7 +10,10 @@ Helpers for monitoring Neutron agents, reschedule failed agents,
 cleaned resources on failed nodes.
 """
 
+import hashlib
+import heapq
 import os
+import random
 import re
 import sys
 import signal
@@ -18,14 +21,23 @@ import socket
 import subprocess
 import time
 
+from multiprocessing.pool import ThreadPool
 from oslo.config import cfg
-from neutron.agent.linux import ovs_lib
-from neutron.agent.linux import ip_lib
 from neutron.common import exceptions
 from neutron.openstack.common import log as logging
 
+import neutron_netns
+
 LOG = logging.getLogger(__name__)
 
+DHCP_AGENT = "DHCP Agent"
+L3_AGENT = "L3 Agent"
+AGENT_FIELDS = ['id', 'host', 'alive']
+# Attempts to move a resource and the delay before the first retry, doubled
+# for every further one.
+MOVE_ATTEMPTS = 3
+MOVE_RETRY_DELAY = 1
+
 
 class Daemon(object):
     """A generic daemon class.
@@ -88,6 +100,64 @@ class Daemon(object):
         pass
 
 
+class Metrics(object):
+    """Metrics written out in the Prometheus textfile format.
+
+    Names ending in _total are counters, anything else is a gauge.  The
+    file is replaced atomically so a collector never reads it half written.
+    """
+    PREFIX = 'neutron_ha_monitor_'
+
+    def __init__(self, path):
+        self.path = path
+        # {(name, ((label, value), ...)): value}
+        self.values = {}
+        self.help = {}
+
+    def _key(self, name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def set(self, name, value, help=None, **labels):
+        self.values[self._key(name, labels)] = value
+        if help:
+            self.help[name] = help
+
+    def inc(self, name, value=1, help=None, **labels):
+        key = self._key(name, labels)
+        self.set(name, self.values.get(key, 0) + value, help, **labels)
+
+    def remove(self, name, **labels):
+        self.values.pop(self._key(name, labels), None)
+
+    def render(self):
+        lines = []
+        for name in sorted(set(name for name, _ in self.values)):
+            metric = self.PREFIX + name
+            if name in self.help:
+                lines.append('# HELP %s %s' % (metric, self.help[name]))
+            lines.append('# TYPE %s %s' % (
+                metric, 'counter' if name.endswith('_total') else 'gauge'))
+            for (_name, labels), value in sorted(self.values.items()):
+                if _name != name:
+                    continue
+                label = ','.join('%s="%s"' % pair for pair in labels)
+                lines.append('%s%s %r' % (metric,
+                                          '{%s}' % label if label else '',
+                                          float(value)))
+        return '\n'.join(lines) + '\n'
+
+    def write(self):
+        if not self.path:
+            return
+        tmp = '%s.tmp' % self.path
+        try:
+            with open(tmp, 'w') as f:
+                f.write(self.render())
+            os.rename(tmp, self.path)
+        except (IOError, OSError) as e:
+            LOG.error('Failed to write metrics to %s, %s' % (self.path, e))
+
+
 class MonitorNeutronAgentsDaemon(Daemon):
     def __init__(self):
         super(MonitorNeutronAgentsDaemon, self).__init__()
@@ -95,24 +165,37 @@ class MonitorNeutronAgentsDaemon(Daemon):
         LOG.info('Monitor Neutron Agent Loop Init')
         self.hostname = None
         self.env = {}
+        self.env_checksum = None
+        self.quantum = None
+        self.quantum_checksum = None
+        self.pool = None
+        # {agent id: {'alive': bool, 'drained': bool, 'down_since': time}}
+        # as of the last loop, drained once a down agent was found to host
+        # nothing.
+        self.agent_states = {}
+        self.metrics = Metrics(cfg.CONF.metrics_file)
 
     def get_env(self):
+        """Read the credentials in the envrc file when they change.
+
+        The file is only parsed again when its checksum differs from that
+        of the content self.env was read from.
+        """
         envrc_f = '/etc/legacy_ha_envrc'
-        envrc_f_m = False
         if os.path.isfile(envrc_f):
-            ctime = time.ctime(os.stat(envrc_f).st_ctime)
-            mtime = time.ctime(os.stat(envrc_f).st_mtime)
-            if ctime != mtime:
-                envrc_f_m = True
-
-            if not self.env or envrc_f_m:
-                with open(envrc_f, 'r') as f:
-                    for line in f:
-                        data = line.strip().split('=')
-                        if data and data[0] and data[1]:
-                            self.env[data[0]] = data[1]
-                        else:
-                            raise Exception("OpenStack env data uncomplete.")
+            with open(envrc_f, 'rb') as f:
+                content = f.read()
+            checksum = hashlib.sha256(content).hexdigest()
+            if checksum != self.env_checksum:
+                env = {}
+                for line in content.decode('utf-8').splitlines():
+                    data = line.strip().split('=', 1)
+                    if len(data) == 2 and data[0] and data[1]:
+                        env[data[0]] = data[1]
+                    else:
+                        raise Exception("OpenStack env data uncomplete.")
+                self.env = env
+                self.env_checksum = checksum
         return self.env
 
     def get_hostname(self):
@@ -120,9 +203,6 @@ class MonitorNeutronAgentsDaemon(Daemon):
             self.hostname = socket.gethostname()
         return self.hostname
 
-    def get_root_helper(self):
-        return 'sudo'
-
     def list_monitor_res(self):
         # List crm resource 'cl_monitor' running node
         nodes = []
@@ -140,41 +220,13 @@ class MonitorNeutronAgentsDaemon(Daemon):
             LOG.error('Failed to get crm resource.')
             return None
 
-    def unplug_device(self, device):
-        try:
-            device.link.delete()
-        except RuntimeError:
-            root_helper = self.get_root_helper()
-            # Maybe the device is OVS port, so try to delete
-            bridge_name = ovs_lib.get_bridge_for_iface(root_helper,
-                                                       device.name)
-            if bridge_name:
-                bridge = ovs_lib.OVSBridge(bridge_name, root_helper)
-                bridge.delete_port(device.name)
-            else:
-                LOG.debug('Unable to find bridge for device: %s', device.name)
-
-    def get_pattern(self, key, text):
-        if not key or not text:
-            LOG.debug('Invalid key(%s) or text(%s)' % (key, text))
-            return None
-
-        pattern = re.compile('%s' % key)
-        result = pattern.findall(text)
-        return result
-
     def _cleanup(self, key1, key2):
         namespaces = []
         if key1:
             for k in key1.iterkeys():
                 namespaces.append(key2 + '-' + k)
         else:
-            try:
-                cmd = ['sudo', 'ip', 'netns']
-                ns = subprocess.check_output(cmd)
-                namespaces = self.get_pattern('(%s.*)' % key2, ns)
-            except RuntimeError as e:
-                LOG.error('Failed to list namespace, (%s)' % e)
+            namespaces = neutron_netns.list_namespaces([key2 + '-'])
 
         if namespaces:
             LOG.info('Namespaces: %s is going to be deleted.' % namespaces)
@@ -188,16 +240,14 @@ class MonitorNeutronAgentsDaemon(Daemon):
 
     def destroy_namespaces(self, namespaces):
         try:
-            root_helper = self.get_root_helper()
-            for namespace in namespaces:
-                ip = ip_lib.IPWrapper(root_helper, namespace)
-                if ip.netns.exists(namespace):
-                    for device in ip.get_devices(exclude_loopback=True):
-                        self.unplug_device(device)
-
-            ip.garbage_collect_namespace()
+            remaining = neutron_netns.teardown_namespaces(
+                namespaces, workers=int(cfg.CONF.api_workers),
+                log=LOG.error)
+            if remaining:
+                LOG.error('Unable to destroy namespaces: %s', remaining)
         except Exception:
-            LOG.exception('Error unable to destroy namespace: %s', namespace)
+            LOG.exception('Error unable to destroy namespaces: %s',
+                          namespaces)
 
     def is_same_host(self, host):
         return str(host).strip() == self.get_hostname()
@@ -214,56 +264,153 @@ class MonitorNeutronAgentsDaemon(Daemon):
             return False
         return True
 
-    def l3_agents_reschedule(self, l3_agents, routers, quantum):
-        if not self.validate_reschedule():
-            return
+    def place(self, resources, agents, hosted):
+        """Assign each resource to the least loaded live agent.
 
-        index = 0
-        for router_id in routers:
-            agent = index % len(l3_agents)
-            LOG.info('Moving router %s from %s to %s' %
-                     (router_id, routers[router_id], l3_agents[agent]))
+        :param resources: ids of the resources to move
+        :param agents: ids of the live agents
+        :param hosted: {agent id: [resource id, ...]} currently hosted
+        :returns: {resource id: agent id}
+        """
+        heap = [(len(hosted.get(agent, [])), index, agent)
+                for index, agent in enumerate(agents)]
+        heapq.heapify(heap)
+        placement = {}
+        for resource_id in sorted(resources):
+            load, index, agent = heapq.heappop(heap)
+            placement[resource_id] = agent
+            heapq.heappush(heap, (load + 1, index, agent))
+        return placement
+
+    def move(self, kind, resource_id, source, target, remove, add):
+        """Move a resource between agents, retrying with backoff.
+
+        A failed remove is logged and the add attempted regardless, as the
+        failed agent may already have dropped the resource.
+
+        :returns: (resource id, seconds taken, whether it was moved)
+        """
+        start = time.time()
+        delay = MOVE_RETRY_DELAY
+        for attempt in range(1, MOVE_ATTEMPTS + 1):
             try:
-                quantum.remove_router_from_l3_agent(
-                    l3_agent=routers[router_id], router_id=router_id)
-
+                remove()
             except exceptions.NeutronException as e:
-                LOG.error('Remove router raised exception: %s' % e)
+                LOG.error('Remove %s raised exception: %s' % (kind, e))
             try:
-                quantum.add_router_to_l3_agent(l3_agent=l3_agents[agent],
-                                               body={'router_id': router_id})
+                add()
             except exceptions.NeutronException as e:
-                LOG.error('Add router raised exception: %s' % e)
-            index += 1
+                LOG.error('Add %s raised exception: %s' % (kind, e))
+                if attempt < MOVE_ATTEMPTS:
+                    time.sleep(delay)
+                    delay *= 2
+                continue
+            elapsed = time.time() - start
+            LOG.info('Moved %s %s from %s to %s in %.2fs, attempt %s' %
+                     (kind, resource_id, source, target, elapsed, attempt))
+            return resource_id, elapsed, True
+        elapsed = time.time() - start
+        LOG.error('Failed to move %s %s from %s to %s after %s attempts' %
+                  (kind, resource_id, source, target, MOVE_ATTEMPTS))
+        return resource_id, elapsed, False
+
+    def reschedule(self, kind, resources, placement, remove, add):
+        """Run the moves of resources concurrently.
+
+        :param resources: {resource id: failed agent id}
+        :param placement: {resource id: target agent id}
+        :param remove: remove(resource id, agent id)
+        :param add: add(resource id, agent id)
+        :returns: [(resource id, seconds taken, whether it was moved)]
+        """
+        def _move(resource_id):
+            source = resources[resource_id]
+            target = placement[resource_id]
+            LOG.info('Moving %s %s from %s to %s' %
+                     (kind, resource_id, source, target))
+            return self.move(kind, resource_id, source, target,
+                             lambda: remove(resource_id, source),
+                             lambda: add(resource_id, target))
+
+        if not placement:
+            return []
+        start = time.time()
+        results = self.get_pool().map(_move, sorted(placement))
+        end = time.time()
+        failed = [r[0] for r in results if not r[2]]
+        LOG.info('Rescheduled %s %ss in %.2fs, %s failed%s' %
+                 (len(results) - len(failed), kind, end - start,
+                  len(failed), ': %s' % failed if failed else ''))
+        self.record_reschedule(kind, resources, results, start, end)
+        return results
+
+    def record_reschedule(self, kind, resources, results, start, end):
+        """Metrics of a reschedule, and of the failover it completes."""
+        m = self.metrics
+        m.set('last_reschedule_timestamp_seconds', end,
+              'Time the last reschedule completed.', resource=kind)
+        m.set('reschedule_duration_seconds', end - start,
+              'Duration of the last reschedule.', resource=kind)
+        m.inc('resources_rescheduled_total',
+              len([r for r in results if r[2]]),
+              'Resources moved off down agents.', resource=kind)
+        m.inc('reschedule_failures_total',
+              len([r for r in results if not r[2]]),
+              'Resources which could not be moved.', resource=kind)
+        detected = [self.agent_states.get(resources[r[0]], {}).get(
+            'down_since') for r in results if r[2]]
+        detected = [t for t in detected if t]
+        if detected:
+            m.set('failover_seconds', end - min(detected),
+                  'From an agent seen going down to its resources moved, '
+                  'for the last reschedule.', resource=kind)
+
+    def l3_agents_reschedule(self, l3_agents, routers, quantum):
+        if not self.validate_reschedule():
+            return
+
+        hosted = self.list_hosted(l3_agents, quantum.list_routers_on_l3_agent,
+                                  'routers')
+        placement = self.place(routers, l3_agents, hosted)
+        return self.reschedule(
+            'router', routers, placement,
+            lambda router_id, agent: quantum.remove_router_from_l3_agent(
+                l3_agent=agent, router_id=router_id),
+            lambda router_id, agent: quantum.add_router_to_l3_agent(
+                l3_agent=agent, body={'router_id': router_id}))
 
     def dhcp_agents_reschedule(self, dhcp_agents, networks, quantum):
         if not self.validate_reschedule():
             return
 
-        index = 0
-        for network_id in networks:
-            agent = index % len(dhcp_agents)
-            LOG.info('Moving network %s from %s to %s' % (network_id,
-                     networks[network_id], dhcp_agents[agent]))
-            try:
-                quantum.remove_network_from_dhcp_agent(
-                    dhcp_agent=networks[network_id], network_id=network_id)
-            except exceptions.NeutronException as e:
-                LOG.error('Remove network raised exception: %s' % e)
-            try:
-                quantum.add_network_to_dhcp_agent(
-                    dhcp_agent=dhcp_agents[agent],
-                    body={'network_id': network_id})
-            except exceptions.NeutronException as e:
-                LOG.error('Add network raised exception: %s' % e)
-            index += 1
+        hosted = self.list_hosted(dhcp_agents,
+                                  quantum.list_networks_on_dhcp_agent,
+                                  'networks')
+        placement = self.place(networks, dhcp_agents, hosted)
+        return self.reschedule(
+            'network', networks, placement,
+            lambda network_id, agent: quantum.remove_network_from_dhcp_agent(
+                dhcp_agent=agent, network_id=network_id),
+            lambda network_id, agent: quantum.add_network_to_dhcp_agent(
+                dhcp_agent=agent, body={'network_id': network_id}))
 
     def get_quantum_client(self):
+        """Client for the Neutron API, kept for as long as the envrc is.
+
+        With keystoneauth the client uses a session whose auth plugin caches
+        the token and fetches a new one before it expires, so a token is
+        requested once per token lifetime rather than once per loop.  Older
+        clients authenticate on first use and keep their token until the
+        API rejects it.
+        """
         env = self.get_env()
         if not env:
             LOG.info('Unable to re-assign resources at this time')
             return None
 
+        if self.quantum and self.quantum_checksum == self.env_checksum:
+            return self.quantum
+
         try:
             from quantumclient.v2_0 import client
         except ImportError:
@@ -272,60 +419,185 @@ class MonitorNeutronAgentsDaemon(Daemon):
 
         auth_url = '%(auth_protocol)s://%(keystone_host)s:%(auth_port)s/v2.0' \
                    % env
-        quantum = client.Client(username=env['service_username'],
-                                password=env['service_password'],
-                                tenant_name=env['service_tenant'],
-                                auth_url=auth_url,
-                                region_name=env['region'])
+        try:
+            from keystoneauth1 import session
+            from keystoneauth1.identity import v2
+        except ImportError:
+            session = None
+
+        if session:
+            auth = v2.Password(auth_url=auth_url,
+                               username=env['service_username'],
+                               password=env['service_password'],
+                               tenant_name=env['service_tenant'])
+            quantum = client.Client(session=session.Session(auth=auth),
+                                    region_name=env['region'])
+        else:
+            quantum = client.Client(username=env['service_username'],
+                                    password=env['service_password'],
+                                    tenant_name=env['service_tenant'],
+                                    auth_url=auth_url,
+                                    region_name=env['region'])
+        LOG.info('Created Neutron client for %s' % auth_url)
+        self.quantum = quantum
+        self.quantum_checksum = self.env_checksum
         return quantum
 
+    def get_pool(self):
+        """Thread pool bounding concurrent Neutron API calls."""
+        if not self.pool:
+            self.pool = ThreadPool(int(cfg.CONF.api_workers))
+        return self.pool
+
+    def list_hosted(self, agent_ids, list_func, key):
+        """Ids of the resources hosted on each agent, fetched concurrently.
+
+        Only ids are requested.  Agents whose resources could not be listed
+        are left out of the result.
+
+        :returns: {agent id: [resource id, ...]}
+        """
+        def _list(agent_id):
+            try:
+                return agent_id, [r['id'] for r in
+                                  list_func(agent_id, fields=['id'])[key]]
+            except exceptions.NeutronException as e:
+                LOG.error('Failed to list %s on agent %s, %s' %
+                          (key, agent_id, e))
+                return agent_id, None
+
+        if not agent_ids:
+            return {}
+        return dict((agent_id, ids) for agent_id, ids in
+                    self.get_pool().map(_list, agent_ids) if ids is not None)
+
+    def hosted_resources(self, kind, agents, list_func, key):
+        """Resources hosted on the agents which need looking at.
+
+        Alive agents are not asked for their resources, except for a local
+        agent which was not alive in the previous loop, so namespaces left
+        from while it was down get cleaned up.  A down agent found to host
+        nothing is not asked again until its state changes.
+
+        :returns: {agent id: [resource id, ...]}
+        """
+        check = []
+        for agent in agents:
+            state = self.agent_states.get(agent['id'], {})
+            if not agent['alive']:
+                if state.get('alive') is not False or not state['drained']:
+                    check.append(agent['id'])
+            elif (self.is_same_host(agent['host']) and
+                    not state.get('alive')):
+                check.append(agent['id'])
+        hosted = self.list_hosted(check, list_func, key)
+
+        now = time.time()
+        for agent in agents:
+            state = self.agent_states.setdefault(
+                agent['id'], {'alive': None, 'drained': False})
+            if agent['id'] in hosted:
+                state['drained'] = not hosted[agent['id']]
+            elif agent['alive'] != state['alive']:
+                state['drained'] = False
+            if not agent['alive'] and state['alive'] is not False:
+                state['down_since'] = now
+                self.metrics.set('last_detection_timestamp_seconds', now,
+                                 'Time an agent was last seen going down.',
+                                 resource=kind)
+                self.metrics.inc('detections_total', 1,
+                                 'Agents seen going down.', resource=kind)
+            elif agent['alive']:
+                state.pop('down_since', None)
+            state['alive'] = agent['alive']
+        self.metrics.set('agents_down',
+                         len([a for a in agents if not a['alive']]),
+                         'Agents not alive.', resource=kind)
+        return hosted
+
+    def degraded(self, now=None):
+        """Whether an agent which went down recently may still host
+        resources.
+
+        Agents down for longer than degraded_max_period no longer count,
+        e.g. when there is no live agent to move their resources to.
+        """
+        now = now or time.time()
+        max_period = float(cfg.CONF.degraded_max_period)
+        return any(not state['alive'] and not state['drained'] and
+                   now - state.get('down_since', now) < max_period
+                   for state in self.agent_states.values())
+
+    def next_interval(self):
+        """Seconds until the next loop.
+
+        check_interval while all agents are alive or drained, otherwise
+        the shorter degraded_check_interval with jitter, so the monitors of
+        all gateways do not poll in step.  Polling backs off to
+        check_interval once agents have been down for degraded_max_period.
+        """
+        if not self.degraded():
+            return float(cfg.CONF.check_interval)
+        jitter = float(cfg.CONF.check_interval_jitter)
+        return (float(cfg.CONF.degraded_check_interval) *
+                random.uniform(1 - jitter, 1 + jitter))
+
+    def list_agents(self, quantum, agent_type):
+        try:
+            return quantum.list_agents(agent_type=agent_type,
+                                       fields=AGENT_FIELDS)['agents']
+        except exceptions.NeutronException as e:
+            LOG.error('Failed to get quantum agents, %s' % e)
+            return None
+
     def reassign_agent_resources(self, quantum=None):
         """Use agent scheduler API to detect down agents and re-schedule"""
         if not quantum:
             LOG.error('Failed to get quantum client.')
             return
 
-        try:
-            DHCP_AGENT = "DHCP Agent"
-            L3_AGENT = "L3 Agent"
-            agents = quantum.list_agents(agent_type=DHCP_AGENT)
-        except exceptions.NeutronException as e:
-            LOG.error('Failed to get quantum agents, %s' % e)
+        dhcp = self.list_agents(quantum, DHCP_AGENT)
+        l3 = self.list_agents(quantum, L3_AGENT)
+        if dhcp is None or l3 is None:
             return
+        listed = set(agent['id'] for agent in dhcp + l3)
+        for agent_id in set(self.agent_states) - listed:
+            del self.agent_states[agent_id]
 
         dhcp_agents = []
         l3_agents = []
         networks = {}
-        for agent in agents['agents']:
-            hosted_networks = quantum.list_networks_on_dhcp_agent(
-                agent['id'])['networks']
+        hosted = self.hosted_resources(
+            'network', dhcp, quantum.list_networks_on_dhcp_agent, 'networks')
+        for agent in dhcp:
             if not agent['alive']:
                 LOG.info('DHCP Agent %s down' % agent['id'])
-                for network in hosted_networks:
-                    networks[network['id']] = agent['id']
-                if self.is_same_host(agent['host']):
+                for network_id in hosted.get(agent['id'], []):
+                    networks[network_id] = agent['id']
+                if agent['id'] in hosted and self.is_same_host(agent['host']):
                     self.cleanup_dhcp(networks)
             else:
                 dhcp_agents.append(agent['id'])
                 LOG.info('Active dhcp agents: %s' % agent['id'])
-                if not hosted_networks and self.is_same_host(agent['host']):
+                if (hosted.get(agent['id']) == [] and
+                        self.is_same_host(agent['host'])):
                     self.cleanup_dhcp(None)
 
-        agents = quantum.list_agents(agent_type=L3_AGENT)
         routers = {}
-        for agent in agents['agents']:
-            hosted_routers = quantum.list_routers_on_l3_agent(
-                agent['id'])['routers']
+        hosted = self.hosted_resources(
+            'router', l3, quantum.list_routers_on_l3_agent, 'routers')
+        for agent in l3:
             if not agent['alive']:
                 LOG.info('L3 Agent %s down' % agent['id'])
-                for router in hosted_routers:
-                    routers[router['id']] = agent['id']
-                if self.is_same_host(agent['host']):
+                for router_id in hosted.get(agent['id'], []):
+                    routers[router_id] = agent['id']
+                if agent['id'] in hosted and self.is_same_host(agent['host']):
                     self.cleanup_router(routers)
             else:
                 l3_agents.append(agent['id'])
                 LOG.info('Active l3 agents: %s' % agent['id'])
-                if not hosted_routers and self.is_same_host(agent['host']):
+                if (hosted.get(agent['id']) == [] and
+                        self.is_same_host(agent['host'])):
                     self.cleanup_router(None)
 
         if not networks and not routers:
@@ -416,13 +688,20 @@ class MonitorNeutronAgentsDaemon(Daemon):
 
     def run(self):
         while True:
+            start = time.time()
             LOG.info('Monitor Neutron HA Agent Loop Start')
             quantum = self.get_quantum_client()
             self.reassign_agent_resources(quantum=quantum)
             self.check_ovs_tunnel(quantum=quantum)
             self.check_local_agents()
-            LOG.info('sleep %s' % cfg.CONF.check_interval)
-            time.sleep(float(cfg.CONF.check_interval))
+            interval = self.next_interval()
+            self.metrics.set('loop_duration_seconds', time.time() - start,
+                             'Duration of the last monitor loop.')
+            self.metrics.set('check_interval_seconds', interval,
+                             'Seconds until the next monitor loop.')
+            self.metrics.write()
+            LOG.info('sleep %s' % interval)
+            time.sleep(interval)
 
 
 if __name__ == '__main__':
@@ -430,6 +709,24 @@ if __name__ == '__main__':
         cfg.StrOpt('check_interval',
                    default=8,
                    help='Check Neutron Agents interval.'),
+        cfg.IntOpt('api_workers',
+                   default=8,
+                   help='Concurrent Neutron API calls.'),
+        cfg.FloatOpt('degraded_check_interval',
+                     default=2,
+                     help='Check Neutron Agents interval while an agent '
+                          'is down.'),
+        cfg.FloatOpt('degraded_max_period',
+                     default=60,
+                     help='Seconds after an agent went down during which '
+                          'degraded_check_interval is used.'),
+        cfg.FloatOpt('check_interval_jitter',
+                     default=0.25,
+                     help='Fraction degraded_check_interval is randomly '
+                          'varied by.'),
+        cfg.StrOpt('metrics_file',
+                   default='/var/lib/neutron/neutron-ha-monitor.prom',
+                   help='Prometheus textfile metrics, empty to disable.'),
     ]
 
     cfg.CONF.register_cli_opts(opts)
@@ -0,0 +1 @@
+../hooks/neutron_netns.py
\ No newline at end of file
@@ -15,7 +15,9 @@ from charmhelpers.contrib.openstack.context import (
     NeutronAPIContext,
     NovaVendorMetadataContext,
     NovaVendorMetadataJSONContext,
+    parse_data_port_mappings,
 )
+import charmhelpers.contrib.openstack.context as ch_context
 from charmhelpers.contrib.openstack.utils import (
     os_release,
     CompareOpenStackReleases,
@@ -26,9 +28,11 @@ from charmhelpers.contrib.hahelpers.cluster import (
 
 from charmhelpers.contrib.network.ip import (
     get_address_in_network,
-    get_host_ip,
 )
 
+from neutron_dns import get_host_ip
+from neutron_interfaces import interface_inventory
+
 NEUTRON_ML2_PLUGIN = "ml2"
 NEUTRON_N1KV_PLUGIN = \
     "neutron.plugins.cisco.n1kv.n1kv_neutron_plugin.N1kvNeutronPluginV2"
@@ -273,6 +277,69 @@ class NovaMetadataJSONContext(NovaVendorMetadataJSONContext):
             return {'vendor_data_json': '{}'}
 
 
+class ExternalPortContext(ch_context.ExternalPortContext):
+    '''ExternalPortContext resolving ports from the interface inventory.'''
+
+    def resolve_ports(self, ports):
+        return interface_inventory().resolve_ports(ports)
+
+
+class DataPortContext(ch_context.DataPortContext):
+    '''DataPortContext resolving ports from the interface inventory.'''
+
+    def resolve_ports(self, ports):
+        return interface_inventory().resolve_ports(ports)
+
+    def __call__(self):
+        ports = config('data-port')
+        if ports:
+            # Map of {bridge:port/mac}
+            portmap = parse_data_port_mappings(ports)
+            ports = portmap.keys()
+            # Resolve provided ports or mac addresses and filter out those
+            # already attached to a bridge.
+            resolved = self.resolve_ports(ports)
+            # Rebuild port index using resolved and filtered ports.
+            inventory = interface_inventory()
+            normalized = {inventory.hwaddr(port): port for port in resolved
+                          if port not in ports}
+            normalized.update({port: port for port in resolved
+                               if port in ports})
+            if resolved:
+                return {
+                    normalized[port]: bridge
+                    for port, bridge in portmap.items()
+                    if port in normalized.keys()
+                }
+
+        return None
+
+
+class PhyNICMTUContext(DataPortContext):
+
+    def __call__(self):
+        ctxt = {}
+        mappings = super(PhyNICMTUContext, self).__call__()
+        if mappings and mappings.keys():
+            ports = sorted(mappings.keys())
+            napi_settings = NeutronAPIContext()()
+            mtu = napi_settings.get('network_device_mtu')
+            inventory = interface_inventory()
+            all_ports = set()
+            # If any of ports is a vlan device, its underlying device must have
+            # mtu applied first.
+            for port in ports:
+                all_ports.update(inventory.lower_devices(port))
+
+            all_ports = list(all_ports)
+            all_ports.extend(ports)
+            if mtu:
+                ctxt["devs"] = '\\n'.join(all_ports)
+                ctxt['mtu'] = mtu
+
+        return ctxt
+
+
 SHARED_SECRET = "/etc/{}/secret.txt"
 
 
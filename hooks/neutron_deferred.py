@@ -0,0 +1,192 @@
+import collections
+import os
+
+import yaml
+
+from charmhelpers.core import hookenv, unitdata
+from charmhelpers.core.hookenv import (
+    log,
+    DEBUG,
+    WARNING,
+)
+import charmhelpers.contrib.openstack.deferred_events as deferred_events
+
+import neutron_patch
+
+INDEX_KEY = 'neutron_deferred.index'
+
+
+class EventIndex(object):
+    '''Parsed deferred events, kept in step with their event directory.
+
+    Event files are written once and never modified, so an event is parsed
+    the first time its file is seen and then kept in the unit kv store.  The
+    directory is only listed again when its mtime changes, i.e. when an event
+    file was added or removed, by the charm or by the policy-rc.d script.
+    '''
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.loaded = False
+        self.mtime = None
+        # {file name: ServiceEvent}
+        self.events = {}
+        # {service: set of file names}
+        self.by_service = collections.defaultdict(set)
+        # {(service, action, reason): set of file names}, for events
+        # requested by this application.
+        self.requests = collections.defaultdict(set)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _add(self, name, event):
+        self.events[name] = event
+        self.by_service[event.service].add(name)
+        if event.policy_requestor_name == hookenv.service_name():
+            self.requests[(event.service, event.action,
+                           event.reason)].add(name)
+
+    def _remove(self, name):
+        event = self.events.pop(name, None)
+        if event is None:
+            return
+        self.by_service[event.service].discard(name)
+        self.requests[(event.service, event.action,
+                       event.reason)].discard(name)
+
+    def _load(self):
+        data = unitdata.kv().get(INDEX_KEY) or {}
+        self.mtime = data.get('mtime')
+        for name, event in data.get('events', {}).items():
+            self._add(name, deferred_events.ServiceEvent.from_dict(event))
+        self.loaded = True
+
+    def _save(self):
+        db = unitdata.kv()
+        db.set(INDEX_KEY, {
+            'mtime': self.mtime,
+            'events': {name: vars(event)
+                       for name, event in self.events.items()},
+        })
+        db.flush()
+
+    def refresh(self):
+        '''Index new event files and forget removed ones.'''
+        if not self.loaded:
+            self._load()
+        try:
+            mtime = os.stat(self.directory).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime == self.mtime and mtime is not None:
+            return
+        try:
+            names = set(n for n in os.listdir(self.directory)
+                        if n.endswith('.deferred'))
+        except OSError:
+            names = set()
+        for name in set(self.events) - names:
+            self._remove(name)
+        for name in names - set(self.events):
+            try:
+                self._add(name,
+                          deferred_events.read_event_file(self.path(name)))
+            except (OSError, yaml.YAMLError, KeyError, TypeError) as e:
+                # Possibly still being written, retried on the next refresh.
+                log('Unable to read deferred event {}: {}'.format(name, e),
+                    level=WARNING)
+                mtime = None
+        self.mtime = mtime
+        self._save()
+
+    def deferred_events(self):
+        '''deferred_events.deferred_events() from the index.
+
+        :returns: [(file name, ServiceEvent)] requested by this application
+        :rtype: list
+        '''
+        self.refresh()
+        service_name = hookenv.service_name()
+        return [(self.path(name), event)
+                for name, event in sorted(self.events.items())
+                if event.policy_requestor_name == service_name]
+
+    def save_event(self, event):
+        '''deferred_events.save_event() with an indexed duplicate check.
+
+        :param event: Event to save
+        :type event: deferred_events.ServiceEvent
+        '''
+        self.refresh()
+        if self.requests[(event.service, event.action, event.reason)]:
+            log('Not writing new event, existing event found. {} {} {}'
+                .format(event.service, event.action, event.reason),
+                level=DEBUG)
+            return
+        requestor_name = hookenv.service_name()
+        requestor_type = 'charm'
+        deferred_events.init_policy_log_dir()
+        record_file = deferred_events.get_event_record_file(
+            policy_requestor_type=requestor_type,
+            policy_requestor_name=requestor_name)
+        data = {
+            'timestamp': event.timestamp,
+            'service': event.service,
+            'action': event.action,
+            'reason': event.reason,
+            'policy_requestor_type': requestor_type,
+            'policy_requestor_name': requestor_name}
+        with open(record_file, 'w') as f:
+            yaml.dump(data, f)
+        self._add(os.path.basename(record_file),
+                  deferred_events.ServiceEvent.from_dict(data))
+        self._save()
+
+    def clear_deferred_events(self, svcs, action):
+        '''deferred_events.clear_deferred_events() from the index.
+
+        As in charmhelpers, action is not taken into account.
+
+        :param svcs: Services to remove events of
+        :type svcs: List[str]
+        :param action: Action to remove
+        :type action: str
+        '''
+        self.refresh()
+        removed = False
+        for service in svcs:
+            for name in list(self.by_service.get(service, ())):
+                try:
+                    os.remove(self.path(name))
+                except FileNotFoundError:
+                    pass
+                self._remove(name)
+                removed = True
+        if removed:
+            self._save()
+
+
+_index = None
+
+
+def install():
+    '''Serve charmhelpers deferred events from an EventIndex.
+
+    deferred_events.deferred_events, save_event and clear_deferred_events
+    are replaced, in deferred_events and in any module that imported them by
+    name, so the status message, the deferred restart checks and the
+    deferred events actions all use the index.
+
+    :returns: EventIndex
+    '''
+    global _index
+    if _index is not None:
+        return _index
+    _index = EventIndex(deferred_events.DEFERRED_EVENTS_DIR)
+    names = ('deferred_events', 'save_event', 'clear_deferred_events')
+    neutron_patch.replace(
+        neutron_patch.references(
+            [getattr(deferred_events, name) for name in names], names),
+        lambda name, func: getattr(_index, name))
+    return _index
@@ -0,0 +1,117 @@
+import socket
+import threading
+import time
+
+from charmhelpers.core.hookenv import (
+    config,
+    log,
+    DEBUG,
+    WARNING,
+)
+from charmhelpers.core import unitdata
+from charmhelpers.contrib.network.ip import (
+    is_ip,
+    ns_query,
+)
+
+# Seconds a resolved address, or a failure to resolve, is reused for.
+POSITIVE_TTL = 300
+NEGATIVE_TTL = 30
+# Used when dns-query-timeout is not set.
+DEFAULT_TIMEOUT = 5.0
+LAST_KNOWN_GOOD_KEY = 'neutron_dns.last_known_good'
+
+# {hostname: (expiry, address or None)}
+_cache = {}
+
+
+def _timeout():
+    return config('dns-query-timeout') or DEFAULT_TIMEOUT
+
+
+def _gethostbyname(hostname, timeout):
+    '''socket.gethostbyname giving up after timeout seconds.
+
+    The system resolver cannot be interrupted, so the lookup runs in a
+    daemon thread which is left behind on timeout.
+    '''
+    result = []
+
+    def _resolve():
+        try:
+            result.append(socket.gethostbyname(hostname))
+        except Exception:
+            pass
+
+    thread = threading.Thread(target=_resolve, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    return result[0] if result else None
+
+
+def resolve(hostname):
+    '''Resolve hostname with bounded DNS and system resolver lookups.
+
+    :param hostname: name to resolve
+    :returns: address or None
+    '''
+    try:
+        address = ns_query(hostname)
+    except Exception as e:
+        log("DNS query for '{}' failed: {}".format(hostname, e),
+            level=DEBUG)
+        address = None
+    return address or _gethostbyname(hostname, _timeout())
+
+
+def _remember(hostname, address):
+    db = unitdata.kv()
+    known = db.get(LAST_KNOWN_GOOD_KEY, {})
+    if known.get(hostname) != address:
+        known[hostname] = address
+        db.set(LAST_KNOWN_GOOD_KEY, known)
+        db.flush()
+
+
+def _last_known_good(hostname):
+    return unitdata.kv().get(LAST_KNOWN_GOOD_KEY, {}).get(hostname)
+
+
+def get_host_ip(hostname, fallback=None):
+    '''charmhelpers.contrib.network.ip.get_host_ip with caching.
+
+    Addresses are reused for POSITIVE_TTL seconds and failures for
+    NEGATIVE_TTL seconds.  Successful lookups are stored in the unit kv
+    store; when resolution fails the last known good address is returned,
+    so a resolver outage does not stall or break the hook.
+
+    :param hostname: hostname or IP address
+    :param fallback: returned when hostname cannot be resolved and was never
+                     resolved before
+    :returns: IP address
+    '''
+    if is_ip(hostname):
+        return hostname
+    now = time.monotonic()
+    expiry, address = _cache.get(hostname, (0, None))
+    if expiry <= now:
+        address = resolve(hostname)
+        if address:
+            _cache[hostname] = (now + POSITIVE_TTL, address)
+            _remember(hostname, address)
+        else:
+            _cache[hostname] = (now + NEGATIVE_TTL, None)
+            address = _last_known_good(hostname)
+            log("Failed to resolve hostname '{}', using {}".format(
+                hostname, address or fallback), level=WARNING)
+            return address or fallback
+    elif address is None:
+        log("Hostname '{}' recently failed to resolve".format(hostname),
+            level=DEBUG)
+        return _last_known_good(hostname) or fallback
+    return address
+
+
+def reset_cache():
+    '''Forget addresses resolved by this process.'''
+    _cache.clear()
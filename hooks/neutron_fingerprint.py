@@ -0,0 +1,250 @@
+import functools
+import hashlib
+import json
+
+from charmhelpers.contrib.hahelpers import cluster
+from charmhelpers.core import hookenv, unitdata
+from charmhelpers.core.hookenv import (
+    log,
+    DEBUG,
+    INFO,
+)
+
+import neutron_contexts
+import neutron_dns
+import neutron_interfaces
+import neutron_patch
+
+KEY_PREFIX = 'neutron_fingerprint.'
+# hookenv functions whose results make up the inputs of a hook.
+RECORDED_FUNCTIONS = ('config', 'relation_get', 'relation_ids',
+                      'related_units', 'is_leader', 'unit_get',
+                      'network_get_primary_address', 'network_get')
+# Charm functions whose results are inputs too: DNS lookups and the
+# metadata shared secret kept on disk.
+RECORDED_CHARM_FUNCTIONS = ('get_host_ip', 'get_shared_secret')
+# Names the recorded functions are imported under, e.g. by hahelpers.
+ALIASES = ('config_get', 'relation_list', 'juju_is_leader')
+# Functions whose answers cannot be replayed: pacemaker leadership and the
+# network interfaces of the machine.
+UNCAPTURED_FUNCTIONS = ('is_crm_leader', 'is_crm_dc', 'interface_inventory')
+
+
+def recorded_functions():
+    '''{name: function} of the functions whose results are recorded.'''
+    functions = {name: getattr(hookenv, name) for name in RECORDED_FUNCTIONS}
+    functions['get_host_ip'] = neutron_dns.get_host_ip
+    functions['get_shared_secret'] = neutron_contexts.get_shared_secret
+    return functions
+
+
+def uncaptured_functions():
+    '''Functions whose use prevents a hook from being skipped.'''
+    return [cluster.is_crm_leader, cluster.is_crm_dc,
+            neutron_interfaces.interface_inventory]
+
+
+def _call(name, scope=None, attribute=None, unit=None, rid=None, app=None,
+          reltype=None, relid=None, binding=None, endpoint=None,
+          relation_id=None, hostname=None, fallback=None):
+    '''Key of a recorded call, with the defaults taken from the hook
+    environment filled in so it can be replayed from any hook.'''
+    if name == 'config':
+        return [name, scope]
+    if name == 'relation_get':
+        if app is None:
+            unit = unit or hookenv.remote_unit()
+        return [name, attribute, unit, rid or hookenv.relation_id(), app]
+    if name == 'relation_ids':
+        return [name, reltype or hookenv.relation_type()]
+    if name == 'related_units':
+        return [name, relid or hookenv.relation_id()]
+    if name == 'is_leader':
+        return [name]
+    if name == 'unit_get':
+        return [name, attribute]
+    if name == 'network_get_primary_address':
+        return [name, binding]
+    if name == 'get_host_ip':
+        return [name, hostname, fallback]
+    if name == 'get_shared_secret':
+        return [name]
+    return [name, endpoint, relation_id]
+
+
+_ARGS = {
+    'config': ('scope',),
+    'relation_get': ('attribute', 'unit', 'rid', 'app'),
+    'relation_ids': ('reltype',),
+    'related_units': ('relid',),
+    'is_leader': (),
+    'unit_get': ('attribute',),
+    'network_get_primary_address': ('binding',),
+    'network_get': ('endpoint', 'relation_id'),
+    'get_host_ip': ('hostname', 'fallback'),
+    'get_shared_secret': (),
+}
+
+
+def _raised(exc):
+    '''Recorded result of a call which raised exc.'''
+    return {'raised': type(exc).__name__}
+
+
+def _encode(value):
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+class InputRecorder(object):
+    '''Config, relation, leadership, network and DNS data and the shared
+    secret read while recording is active.'''
+
+    def __init__(self):
+        # {encoded call: encoded result}
+        self.reads = {}
+        # False once an input which cannot be replayed was read.
+        self.complete = True
+        self._targets = []
+
+    def wrap(self, name, func):
+        @functools.wraps(func)
+        def recorded(*args, **kwargs):
+            key = dict(kwargs)
+            key.update(zip(_ARGS[name], args))
+            key = _encode(_call(name, **key))
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                # e.g. network-get on a Juju without it, whose callers fall
+                # back to other inputs.
+                self.reads[key] = _encode(_raised(e))
+                raise
+            self.reads[key] = _encode(result)
+            return result
+        return recorded
+
+    def wrap_uncaptured(self, func):
+        @functools.wraps(func)
+        def uncaptured(*args, **kwargs):
+            self.complete = False
+            return func(*args, **kwargs)
+        return uncaptured
+
+    def start(self):
+        originals = {func: name
+                     for name, func in recorded_functions().items()}
+        self._targets = neutron_patch.references(
+            list(originals) + uncaptured_functions(),
+            RECORDED_FUNCTIONS + RECORDED_CHARM_FUNCTIONS + ALIASES +
+            UNCAPTURED_FUNCTIONS)
+        neutron_patch.replace(
+            self._targets,
+            lambda name, func: (self.wrap(originals[func], func)
+                                if func in originals
+                                else self.wrap_uncaptured(func)))
+
+    def stop(self):
+        neutron_patch.restore(self._targets)
+        self._targets = []
+
+    def fingerprint(self):
+        '''Recorded calls and the digest of their results.
+
+        :returns: dict, as stored in the unit kv store
+        '''
+        calls = sorted(self.reads)
+        return {
+            'calls': calls,
+            'digest': digest([self.reads[c] for c in calls]),
+        }
+
+
+def digest(results):
+    return hashlib.sha256('\n'.join(results).encode('UTF-8')).hexdigest()
+
+
+def replay(call):
+    '''Result of a recorded call, as it would be now.
+
+    Attributes of a unit are read from all of its relation data, which is
+    fetched once per unit for all replayed attributes.
+
+    :param call: decoded call key
+    :returns: result
+    '''
+    name, args = call[0], call[1:]
+    if name == 'relation_get':
+        attribute, unit, rid, app = args
+        if attribute is not None and unit is not None:
+            data = hookenv.relation_get(unit=unit, rid=rid) or {}
+            return data.get(attribute)
+        return hookenv.relation_get(attribute=attribute, unit=unit, rid=rid,
+                                    app=app)
+    return recorded_functions()[name](*args)
+
+
+def inputs_unchanged(key):
+    '''Whether the inputs recorded for key still have the same values.
+
+    :param key: kv key of the fingerprint
+    :returns: bool
+    '''
+    previous = unitdata.kv().get(key)
+    if not previous:
+        return False
+    results = []
+    for call in previous['calls']:
+        try:
+            results.append(_encode(replay(json.loads(call))))
+        except Exception as e:
+            log('Unable to replay {} of {}: {}'.format(call, key, e),
+                level=DEBUG)
+            results.append(_encode(_raised(e)))
+    return digest(results) == previous['digest']
+
+
+def skip_if_inputs_unchanged(f):
+    '''Skip the decorated hook when its inputs did not change.
+
+    The config and relation data read by the hook, including that read by
+    the contexts it renders, are recorded when it completes.  When the same
+    reads give the same values on the next run the hook would do the same
+    thing again, so it is skipped.
+
+    Relation data is compared per attribute, so a change of an attribute
+    the hook never reads, e.g. a peer's ingress-address, does not cause a
+    run.  Leadership, the addresses from unit-get and network-get, DNS
+    lookups and the metadata shared secret are recorded as well.  A hook
+    asking pacemaker for leadership or reading the network interfaces of the
+    machine is never skipped, as those answers cannot be replayed.
+    '''
+    key = KEY_PREFIX + f.__name__
+
+    @functools.wraps(f)
+    def wrapped(*args, **kwargs):
+        if inputs_unchanged(key):
+            log('Inputs of {} unchanged since its last run, skipping.'
+                .format(f.__name__), level=INFO)
+            return
+        db = unitdata.kv()
+        # A run failing half way must not leave the previous fingerprint.
+        db.unset(key)
+        db.flush()
+        recorder = InputRecorder()
+        recorder.start()
+        try:
+            result = f(*args, **kwargs)
+        finally:
+            recorder.stop()
+        if recorder.reads and recorder.complete:
+            db.set(key, recorder.fingerprint())
+            db.flush()
+        return result
+    return wrapped
+
+
+def forget_inputs():
+    '''Drop recorded inputs so every hook runs in full next time.'''
+    db = unitdata.kv()
+    db.unsetrange(prefix=KEY_PREFIX)
+    db.flush()
@@ -3,11 +3,12 @@
 from base64 import b64decode
 
 from charmhelpers.core.hookenv import (
-    log, ERROR, WARNING,
+    log, DEBUG, ERROR, WARNING,
     config,
     relation_get,
     relation_set,
     relation_ids,
+    relation_type,
     Hooks,
     UnregisteredHookError,
     status_set,
@@ -37,7 +38,6 @@ from charmhelpers.contrib.openstack.utils import (
     configure_installation_source,
     openstack_upgrade_available,
     is_unit_paused_set,
-    os_restart_on_change as restart_on_change,
     series_upgrade_prepare,
     series_upgrade_complete,
 )
@@ -48,6 +48,8 @@ from charmhelpers.core.kernel import modprobe
 from charmhelpers.contrib.charmsupport import nrpe
 from charmhelpers.contrib.hardening.harden import harden
 
+import functools
+import os
 import sys
 from neutron_utils import (
     L3HA_PACKAGES,
@@ -69,6 +71,7 @@ from neutron_utils import (
     use_l3ha,
     NEUTRON_COMMON,
     assess_status,
+    status_unchanged,
     install_systemd_override,
     configure_apparmor,
     pause_unit_helper,
@@ -80,9 +83,26 @@ from neutron_utils import (
     remove_old_packages,
     deprecated_services,
     deferrable_services,
+    option_diff_paths,
+    reload_options,
+    service_sections,
 )
+from neutron_templating import os_restart_on_change
+from neutron_deferred import install as install_deferred_index
+from neutron_fingerprint import (
+    forget_inputs,
+    skip_if_inputs_unchanged,
+)
+from neutron_kv import install as install_kv
+from neutron_packages import install as install_package_cache
+from neutron_log import install as install_log_sink
+from neutron_trace import trace_hook
 
 hooks = Hooks()
+restart_on_change = functools.partial(os_restart_on_change,
+                                      option_diff_paths=option_diff_paths,
+                                      reload_options=reload_options,
+                                      service_sections=service_sections)
 # Note that CONFIGS is now set up via resolve_CONFIGS so that it is not a
 # module load time constraint.
 CONFIGS = None
@@ -205,6 +225,8 @@ def config_changed():
 @hooks.hook('upgrade-charm')
 @harden()
 def upgrade_charm():
+    # The new charm may read different inputs or render them differently.
+    forget_inputs()
     install()
     packages_removed = remove_old_packages()
     if packages_removed and not is_unit_paused_set():
@@ -235,44 +257,49 @@ def amqp_joined(relation_id=None):
 
 @hooks.hook('amqp-nova-relation-departed')
 @hooks.hook('amqp-nova-relation-changed')
+@skip_if_inputs_unchanged
 @restart_on_change(restart_map)
 def amqp_nova_changed():
     if 'amqp-nova' not in CONFIGS.complete_contexts():
         log('amqp relation incomplete. Peer not ready?')
         return
-    CONFIGS.write_all()
+    CONFIGS.write_for(interfaces=['amqp-nova'])
 
 
 @hooks.hook('amqp-relation-departed')
+@skip_if_inputs_unchanged
 @restart_on_change(restart_map)
 def amqp_departed():
     if 'amqp' not in CONFIGS.complete_contexts():
         log('amqp relation incomplete. Peer not ready?')
         return
-    CONFIGS.write_all()
+    CONFIGS.write_for(interfaces=['amqp'])
 
 
 @hooks.hook('amqp-relation-changed',
             'cluster-relation-changed',
             'cluster-relation-joined')
+@skip_if_inputs_unchanged
 @restart_on_change(restart_map)
 def amqp_changed():
-    CONFIGS.write_all()
+    CONFIGS.write_for(interfaces=[relation_type()])
 
 
 @hooks.hook('neutron-plugin-api-relation-changed')
+@skip_if_inputs_unchanged
 @restart_on_change(restart_map)
 def neutron_plugin_api_changed():
     if use_l3ha():
         apt_update()
         apt_install(L3HA_PACKAGES, fatal=True)
-    CONFIGS.write_all()
+    CONFIGS.write_for(interfaces=['neutron-plugin-api'])
 
 
 @hooks.hook('quantum-network-service-relation-changed')
+@skip_if_inputs_unchanged
 @restart_on_change(restart_map)
 def nm_changed():
-    CONFIGS.write_all()
+    CONFIGS.write_for(interfaces=['quantum-network-service'])
     if relation_get('ca_cert'):
         ca_crt = b64decode(relation_get('ca_cert'))
         install_ca_cert(ca_crt)
@@ -407,13 +434,25 @@ def post_series_upgrade():
 
 
 def main():
-    try:
-        hooks.execute(sys.argv)
-    except UnregisteredHookError as e:
-        log('Unknown hook {} - skipping.'.format(e))
-    assess_status(CONFIGS)
+    hook_name = os.path.basename(sys.argv[0])
+    install_log_sink(debug=config('debug'))
+    with trace_hook(hook_name, enabled=config('hook-tracing')):
+        try:
+            hooks.execute(sys.argv)
+        except UnregisteredHookError as e:
+            log('Unknown hook {} - skipping.'.format(e))
+        # update-status only needs a full assessment when something it
+        # depends on changed since the last one.
+        if hook_name == 'update-status' and status_unchanged():
+            log('Workload status unchanged.', level=DEBUG)
+        else:
+            assess_status(resolve_CONFIGS())
 
 
 if __name__ == '__main__':
-    resolve_CONFIGS()
+    install_kv()
+    install_deferred_index()
+    install_package_cache()
+    if os.path.basename(sys.argv[0]) != 'update-status':
+        resolve_CONFIGS()
     main()
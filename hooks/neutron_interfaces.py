@@ -0,0 +1,264 @@
+import collections
+import os
+import re
+import subprocess
+
+from charmhelpers.core.hookenv import (
+    cached,
+    flush,
+    log,
+    DEBUG,
+    WARNING,
+)
+
+SYS_CLASS_NET = '/sys/class/net'
+
+MAC_REGEX = re.compile(r'([0-9A-F]{2}[:-]){5}([0-9A-F]{2})', re.I)
+
+# Interface flags as exposed in /sys/class/net/<iface>/flags
+IFF_UP = 0x1
+IFF_PROMISC = 0x100
+
+Interface = collections.namedtuple(
+    'Interface',
+    ['name', 'index', 'hwaddr', 'mtu', 'physical', 'master', 'bond_master',
+     'bridge_member', 'linux_bridge', 'lower', 'flags'],
+    defaults=(0,))
+
+
+def _read_sysfs(path, default=None):
+    try:
+        with open(path, 'r') as f:
+            return f.read().strip()
+    except (IOError, OSError):
+        return default
+
+
+def _load_interface(sys_net, name):
+    '''Build an Interface record from the sysfs entry for name.
+
+    :param sys_net: sysfs directory holding the network interfaces
+    :param name: name of the interface
+    :returns: Interface or None if the interface vanished meanwhile
+    '''
+    path = os.path.join(sys_net, name)
+    realpath = os.path.realpath(path)
+    if not os.path.isdir(realpath):
+        return None
+    physical = '/virtual/' not in realpath
+
+    master = None
+    bond_master = None
+    master_path = os.path.join(path, 'master')
+    if os.path.exists(master_path):
+        master_path = os.path.realpath(master_path)
+        master = os.path.basename(master_path)
+        # NOTE: only physical bond slaves are replaced by their master, as
+        #       done by charmhelpers.core.host.get_bond_master.
+        if physical and os.path.exists(os.path.join(master_path, 'bonding')):
+            bond_master = master
+
+    try:
+        entries = os.listdir(path)
+    except OSError:
+        entries = []
+    lower = sorted(e[len('lower_'):] for e in entries
+                   if e.startswith('lower_'))
+
+    index = _read_sysfs(os.path.join(path, 'ifindex'), '0')
+    mtu = _read_sysfs(os.path.join(path, 'mtu'), '')
+    try:
+        flags = int(_read_sysfs(os.path.join(path, 'flags'), '0'), 16)
+    except ValueError:
+        flags = 0
+    return Interface(
+        name=name,
+        index=int(index) if index.isdigit() else 0,
+        hwaddr=_read_sysfs(os.path.join(path, 'address'), ''),
+        mtu=int(mtu) if mtu.isdigit() else None,
+        physical=physical,
+        master=master,
+        bond_master=bond_master,
+        bridge_member='brport' in entries,
+        linux_bridge='bridge' in entries,
+        lower=lower,
+        flags=flags)
+
+
+def _load_addresses():
+    '''Return addresses configured on the unit keyed by interface name.
+
+    Uses a single ``ip -o addr show`` dump. IPv4 addresses are always
+    reported, IPv6 addresses only when they are scope global, dynamic and
+    not temporary, matching charmhelpers.contrib.network.ip.get_ipv6_addr.
+
+    :returns: {iface: [address, ...]}
+    '''
+    addresses = collections.defaultdict(list)
+    try:
+        output = subprocess.check_output(
+            ['ip', '-o', 'addr', 'show']).decode('UTF-8', errors='replace')
+    except (OSError, subprocess.CalledProcessError) as e:
+        log('Unable to list interface addresses: {}'.format(e),
+            level=WARNING)
+        return addresses
+
+    for line in output.split('\n'):
+        words = line.split()
+        if len(words) < 4:
+            continue
+        iface = words[1].partition('@')[0]
+        family, address = words[2], words[3].split('/')[0]
+        if family == 'inet':
+            addresses[iface].append(address)
+        elif family == 'inet6':
+            if ('global' in words and 'dynamic' in words and
+                    'temporary' not in words):
+                addresses[iface].append(address)
+    return addresses
+
+
+class InterfaceInventory(object):
+    '''Snapshot of the network interfaces present on the unit.
+
+    Port resolution used to fork ``ip`` several times per NIC, which gets
+    expensive once ovs-use-veth leaves thousands of tap devices in the root
+    namespace.  The inventory is instead built from one walk of
+    /sys/class/net and one address dump, and answers all lookups from
+    memory.
+    '''
+
+    def __init__(self, interfaces, addresses=None):
+        '''
+        :param interfaces: iterable of Interface records
+        :param addresses: dict of interface name to list of addresses
+        '''
+        self.interfaces = collections.OrderedDict(
+            (i.name, i) for i in sorted(interfaces,
+                                        key=lambda i: (i.index, i.name)))
+        self.addresses = dict(addresses or {})
+
+    def __contains__(self, name):
+        return name in self.interfaces
+
+    def __iter__(self):
+        return iter(self.interfaces)
+
+    def __len__(self):
+        return len(self.interfaces)
+
+    def get(self, name):
+        return self.interfaces.get(name)
+
+    def hwaddr(self, name):
+        iface = self.interfaces.get(name)
+        return iface.hwaddr if iface else ''
+
+    def mtu(self, name):
+        iface = self.interfaces.get(name)
+        return iface.mtu if iface else None
+
+    def get_addresses(self, name):
+        return list(self.addresses.get(name, []))
+
+    def physical_nics(self):
+        return [n for n, i in self.interfaces.items() if i.physical]
+
+    def bond_master(self, name):
+        iface = self.interfaces.get(name)
+        return iface.bond_master if iface else None
+
+    def is_bridge_member(self, name):
+        iface = self.interfaces.get(name)
+        return bool(iface and iface.bridge_member)
+
+    def is_linux_bridge(self, name):
+        iface = self.interfaces.get(name)
+        return bool(iface and iface.linux_bridge)
+
+    def is_up(self, name):
+        iface = self.interfaces.get(name)
+        return bool(iface and iface.flags & IFF_UP)
+
+    def is_promisc(self, name):
+        iface = self.interfaces.get(name)
+        return bool(iface and iface.flags & IFF_PROMISC)
+
+    def lower_devices(self, name):
+        iface = self.interfaces.get(name)
+        return list(iface.lower) if iface else []
+
+    def resolve_ports(self, ports):
+        '''Resolve NICs not yet bound to bridge(s)
+
+        Equivalent of NeutronPortContext.resolve_ports answered from the
+        inventory.  If hwaddress provided then returns resolved hwaddress
+        otherwise NIC.
+
+        :param ports: list of interface names and/or MAC addresses
+        :returns: list of resolved interface names or None
+        '''
+        if not ports:
+            return None
+
+        hwaddr_to_nic = {}
+        hwaddr_to_ip = {}
+        for nic in self.physical_nics():
+            _nic = self.bond_master(nic)
+            if _nic:
+                log("Replacing iface '%s' with bond master '%s'" % (nic, _nic),
+                    level=DEBUG)
+                nic = _nic
+
+            hwaddr = self.hwaddr(nic)
+            hwaddr_to_nic[hwaddr] = nic
+            hwaddr_to_ip[hwaddr] = self.get_addresses(nic)
+
+        resolved = []
+        for entry in ports:
+            if re.match(MAC_REGEX, entry):
+                # NIC is in known NICs and does NOT have an IP address
+                if entry in hwaddr_to_nic and not hwaddr_to_ip[entry]:
+                    # If the nic is part of a bridge then don't use it
+                    if self.is_bridge_member(hwaddr_to_nic[entry]):
+                        continue
+                    resolved.append(hwaddr_to_nic[entry])
+            elif entry in self:
+                # Not a MAC address but an existing interface, trust that
+                # the user put it there on purpose.
+                resolved.append(entry)
+
+        # Ensure no duplicates
+        return list(set(resolved))
+
+
+def load_interface_inventory(sys_net=SYS_CLASS_NET):
+    '''Build an InterfaceInventory from sysfs and the kernel address table.
+
+    :param sys_net: sysfs directory holding the network interfaces
+    :returns: InterfaceInventory
+    '''
+    interfaces = []
+    try:
+        names = os.listdir(sys_net)
+    except OSError:
+        names = []
+    for name in names:
+        iface = _load_interface(sys_net, name)
+        if iface:
+            interfaces.append(iface)
+    inventory = InterfaceInventory(interfaces, _load_addresses())
+    log('Loaded inventory of {} network interfaces'.format(len(inventory)),
+        level=DEBUG)
+    return inventory
+
+
+@cached
+def interface_inventory():
+    '''Return the InterfaceInventory for the current hook execution.'''
+    return load_interface_inventory()
+
+
+def reset_interface_inventory():
+    '''Drop the cached inventory, e.g. after interfaces were reconfigured.'''
+    flush(interface_inventory.__name__)
@@ -0,0 +1,112 @@
+import json
+
+from charmhelpers.core import unitdata
+
+
+class Storage(unitdata.Storage):
+    '''unitdata.Storage with WAL journaling, a read cache and bulk updates.
+
+    The database is switched to write-ahead logging with synchronous=NORMAL,
+    so a flush appends to the log rather than syncing the rollback journal
+    and the database.  Values read or written are cached as their JSON
+    encoding, repeated get() calls do not query the database and set() only
+    writes values which changed.  update() writes all changed keys with a
+    single executemany.
+
+    Only one process uses the unit state database at a time, as hooks and
+    actions run under the machine lock, so the cache cannot go stale.
+    '''
+
+    def __init__(self, path=None, keep_revisions=False):
+        # {key: JSON encoded value or None when the key is not set}
+        self._cache = {}
+        super(Storage, self).__init__(path, keep_revisions)
+        if self.db_path != ':memory:':
+            self.cursor.execute('pragma journal_mode=WAL')
+        self.cursor.execute('pragma synchronous=NORMAL')
+
+    def _load(self, key):
+        if key not in self._cache:
+            self.cursor.execute('select data from kv where key=?', [key])
+            result = self.cursor.fetchone()
+            self._cache[key] = result[0] if result else None
+        return self._cache[key]
+
+    def get(self, key, default=None, record=False):
+        data = self._load(key)
+        if data is None:
+            return default
+        if record:
+            return unitdata.Record(json.loads(data))
+        return json.loads(data)
+
+    def getrange(self, key_prefix, strip=False):
+        self.cursor.execute("select key, data from kv where key like ?",
+                            ['%s%%' % key_prefix])
+        result = self.cursor.fetchall()
+        self._cache.update(result)
+        if not strip:
+            key_prefix = ''
+        return dict([
+            (k[len(key_prefix):], json.loads(v)) for k, v in result])
+
+    def set(self, key, value):
+        if self.keep_revisions and self.revision:
+            self._cache.pop(key, None)
+            return super(Storage, self).set(key, value)
+        self.update({key: value})
+        return value
+
+    def update(self, mapping, prefix=""):
+        if self.keep_revisions and self.revision:
+            return super(Storage, self).update(mapping, prefix)
+        changed = []
+        for k, v in mapping.items():
+            key = "%s%s" % (prefix, k)
+            serialized = json.dumps(v)
+            if self._load(key) != serialized:
+                changed.append((key, serialized))
+        if changed:
+            self.cursor.executemany(
+                'insert or replace into kv (key, data) values (?, ?)',
+                changed)
+            self._cache.update(changed)
+
+    def unset(self, key):
+        super(Storage, self).unset(key)
+        self._cache[key] = None
+
+    def unsetrange(self, keys=None, prefix=""):
+        super(Storage, self).unsetrange(keys, prefix)
+        if keys is not None:
+            for key in keys:
+                self._cache["%s%s" % (prefix, key)] = None
+        else:
+            for key in [k for k in self._cache if k.startswith(prefix)]:
+                self._cache[key] = None
+
+    def flush(self, save=True):
+        if not save:
+            # Rolled back changes must not be served from the cache.
+            self._cache.clear()
+        super(Storage, self).flush(save)
+
+
+def install(path=None):
+    '''Make unitdata.kv() return a Storage for the rest of the process.
+
+    Changes made through a previously opened unit state database are
+    committed first.
+
+    :param path: database path, defaults to that of unitdata.kv()
+    :returns: Storage
+    '''
+    current = unitdata._KV
+    if isinstance(current, Storage):
+        return current
+    if current is not None:
+        current.flush()
+        current.close()
+        path = path or current.db_path
+    unitdata._KV = Storage(path)
+    return unitdata._KV
@@ -0,0 +1,118 @@
+import atexit
+import errno
+import subprocess
+import sys
+
+from charmhelpers.core import hookenv
+
+import neutron_patch
+
+SEVERITY = {
+    hookenv.TRACE: 0,
+    hookenv.DEBUG: 1,
+    hookenv.INFO: 2,
+    hookenv.WARNING: 3,
+    hookenv.ERROR: 4,
+    hookenv.CRITICAL: 5,
+}
+# Messages at or above this level flush the buffer straight away.
+FLUSH_LEVEL = hookenv.WARNING
+# Buffered characters after which the buffer is flushed.
+MAX_BUFFER = 64 * 1024
+
+
+class BufferedLog(object):
+    '''juju-log sink sending buffered messages in a few juju-log calls.
+
+    Consecutive messages of the same level are joined into one juju-log
+    call.  The buffer is flushed when it grows past MAX_BUFFER, when a
+    message at FLUSH_LEVEL or above is logged and on exit.  Messages below
+    floor are dropped.
+    '''
+
+    def __init__(self, floor=hookenv.DEBUG):
+        self.floor = SEVERITY[floor]
+        self.buffer = []
+        self.size = 0
+
+    def log(self, message, level=None):
+        '''Drop-in replacement for hookenv.log.'''
+        level = level if level in SEVERITY else hookenv.INFO
+        if SEVERITY[level] < self.floor:
+            return
+        if not isinstance(message, str):
+            message = repr(message)
+        self.buffer.append((level, message))
+        self.size += len(message)
+        if SEVERITY[level] >= SEVERITY[FLUSH_LEVEL] or self.size > MAX_BUFFER:
+            self.flush()
+
+    def flush(self):
+        '''Send buffered messages to juju-log.'''
+        buffer, self.buffer, self.size = self.buffer, [], 0
+        for level, messages in _batches(buffer):
+            self._send(level, messages)
+
+    @staticmethod
+    def _send(level, messages):
+        try:
+            subprocess.call(['juju-log', '-l', level, '\n'.join(messages)])
+        except OSError as e:
+            # Missing juju-log should not cause failures in unit tests
+            if e.errno != errno.ENOENT:
+                raise
+            for line in messages:
+                print('juju-log: {}: {}'.format(level, line),
+                      file=sys.stderr)
+
+
+def _batches(buffer):
+    '''Group (level, message) entries into juju-log calls.
+
+    Consecutive messages of the same level share a call as long as, joined
+    by newlines, they fit in one command line argument.  Longer messages
+    are split over several calls rather than truncated.
+
+    :param buffer: [(level, message), ...]
+    :returns: iterator of (level, [message, ...])
+    '''
+    limit = hookenv.SH_MAX_ARG
+    level, batch, size = None, [], 0
+    for entry_level, message in buffer:
+        pieces = [message[i:i + limit]
+                  for i in range(0, len(message), limit)] or ['']
+        for piece in pieces:
+            if batch and (entry_level != level or
+                          size + 1 + len(piece) > limit):
+                yield level, batch
+                batch = []
+            size = size + 1 + len(piece) if batch else len(piece)
+            level = entry_level
+            batch.append(piece)
+    if batch:
+        yield level, batch
+
+
+_sink = None
+
+
+def install(debug=False):
+    '''Route hookenv.log through a BufferedLog for the rest of the process.
+
+    Modules that imported log by name are switched over as well.  Without
+    debug, DEBUG and INFO messages are dropped.
+
+    :param debug: keep DEBUG and INFO messages
+    :returns: BufferedLog
+    '''
+    global _sink
+    if _sink is not None:
+        return _sink
+    _sink = BufferedLog(floor=hookenv.DEBUG if debug else hookenv.WARNING)
+    neutron_patch.replace(neutron_patch.references([hookenv.log], ['log']),
+                          lambda name, func: _sink.log)
+    # atexit hooks run when the hook completes, the interpreter exit
+    # handler covers hooks ending with an exception.
+    hookenv.atexit(_sink.flush)
+    atexit.register(_sink.flush)
+    return _sink
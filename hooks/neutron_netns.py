@@ -0,0 +1,209 @@
+# Teardown of the network namespaces of Neutron agents.
+#
+# Shared by the charm and the legacy HA monitor, which runs outside of the
+# charm, so only the standard library is used.
+
+import errno
+import logging
+import os
+import signal
+import subprocess
+
+from multiprocessing.pool import ThreadPool
+
+NETNS_DIR = '/run/netns'
+PROC_DIR = '/proc'
+# Namespaces created by the l3, dhcp and lbaas agents.
+NEUTRON_PREFIXES = ('qrouter-', 'qdhcp-', 'snat-', 'fip-', 'qlbaas-')
+WORKERS = 8
+
+LOG = logging.getLogger(__name__)
+
+
+def list_namespaces(prefixes=NEUTRON_PREFIXES):
+    """Network namespaces whose name starts with any of prefixes.
+
+    :param prefixes: name prefixes
+    :type prefixes: Iterable[str]
+    :returns: namespace names
+    :rtype: List[str]
+    """
+    try:
+        names = os.listdir(NETNS_DIR)
+    except OSError:
+        return []
+    return sorted(n for n in names if n.startswith(tuple(prefixes)))
+
+
+def namespace_devices(namespace):
+    """Network devices in namespace, other than the loopback device.
+
+    :param namespace: namespace name
+    :type namespace: str
+    :returns: device names
+    :rtype: List[str]
+    """
+    output = subprocess.check_output(
+        ['ip', '-netns', namespace, '-oneline', 'link', 'show'])
+    devices = []
+    for line in output.decode('UTF-8').splitlines():
+        fields = line.split(':', 2)
+        if len(fields) < 3:
+            continue
+        name = fields[1].strip().split('@')[0]
+        if name != 'lo':
+            devices.append(name)
+    return devices
+
+
+def namespace_pids(namespaces):
+    """Processes running in each of namespaces.
+
+    Namespaces are matched on the inode of /proc/<pid>/ns/net, so /proc is
+    read once for all namespaces.
+
+    :param namespaces: namespace names
+    :type namespaces: List[str]
+    :returns: {namespace: [pid, ...]}
+    :rtype: Dict[str, List[int]]
+    """
+    inodes = {}
+    for namespace in namespaces:
+        try:
+            st = os.stat(os.path.join(NETNS_DIR, namespace))
+        except OSError:
+            continue
+        inodes[(st.st_dev, st.st_ino)] = namespace
+    pids = dict((namespace, []) for namespace in inodes.values())
+    for pid in os.listdir(PROC_DIR):
+        if not pid.isdigit():
+            continue
+        try:
+            st = os.stat(os.path.join(PROC_DIR, pid, 'ns', 'net'))
+        except OSError:
+            continue
+        namespace = inodes.get((st.st_dev, st.st_ino))
+        if namespace:
+            pids[namespace].append(int(pid))
+    return pids
+
+
+def kill_processes(pids, log=LOG.warning):
+    """SIGKILL each of pids, ignoring processes which are already gone."""
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except OSError as e:
+            if e.errno != errno.ESRCH:
+                log('Unable to kill process %s: %s' % (pid, e))
+
+
+def delete_ovs_ports(names):
+    """Delete any of names which are OVS ports, in one OVSDB transaction.
+
+    Names which are not OVS ports are ignored.
+
+    :param names: port names
+    :type names: Iterable[str]
+    """
+    cmd = ['ovs-vsctl']
+    for name in sorted(set(names)):
+        cmd.extend(['--', '--if-exists', 'del-port', name])
+    if len(cmd) > 1:
+        subprocess.check_call(cmd)
+
+
+def ip_batch(commands, namespace=None):
+    """Run ip commands from a single ip process.
+
+    Commands keep being run after one fails.
+
+    :param commands: ip commands, without the leading ip
+    :type commands: List[str]
+    :param namespace: namespace to run the commands in
+    :type namespace: Optional[str]
+    :returns: error output, empty if all commands succeeded
+    :rtype: str
+    """
+    cmd = ['ip']
+    if namespace:
+        cmd.extend(['-netns', namespace])
+    cmd.extend(['-force', '-batch', '-'])
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _, err = proc.communicate(
+        ''.join('%s\n' % c for c in commands).encode('UTF-8'))
+    if proc.returncode:
+        return err.decode('UTF-8', 'replace').strip() or 'ip failed'
+    return ''
+
+
+def teardown_namespaces(namespaces, workers=WORKERS, kill=False,
+                        log=LOG.warning):
+    """Remove namespaces and the devices in them.
+
+    Rather than a few commands per device, the work is done in a handful of
+    batches:
+
+    1. processes in the namespaces are killed, when kill is set;
+    2. devices in each namespace are listed, on a pool of workers;
+    3. those which are OVS ports are deleted in one OVSDB transaction;
+    4. the rest are deleted with one ip batch per namespace, on the pool;
+    5. the namespaces are deleted with one ip batch.
+
+    :param namespaces: namespace names, those which do not exist are ignored
+    :type namespaces: List[str]
+    :param workers: namespaces handled concurrently
+    :type workers: int
+    :param kill: whether to SIGKILL processes running in the namespaces
+                 first, e.g. keepalived and dnsmasq.  Only safe when no
+                 agent may be using them.
+    :type kill: bool
+    :param log: called with a message for each failure
+    :type log: Callable[[str], None]
+    :returns: namespaces which still exist
+    :rtype: List[str]
+    """
+    namespaces = [ns for ns in sorted(set(namespaces))
+                  if os.path.exists(os.path.join(NETNS_DIR, ns))]
+    if not namespaces:
+        return []
+    if kill:
+        pids = namespace_pids(namespaces)
+        kill_processes([p for ns in sorted(pids) for p in pids[ns]], log)
+
+    def _devices(namespace):
+        try:
+            return namespace, namespace_devices(namespace)
+        except (OSError, subprocess.CalledProcessError) as e:
+            log('Unable to list devices of namespace %s: %s' % (namespace, e))
+            return namespace, []
+
+    def _delete_devices(item):
+        namespace, devices = item
+        err = ip_batch(['link delete dev %s' % d for d in devices],
+                       namespace)
+        if err:
+            log('Unable to delete devices of namespace %s: %s' %
+                (namespace, err))
+
+    pool = ThreadPool(max(1, min(workers, len(namespaces))))
+    try:
+        devices = dict(pool.map(_devices, namespaces))
+        try:
+            delete_ovs_ports(d for ns in devices.values() for d in ns)
+        except (OSError, subprocess.CalledProcessError) as e:
+            log('Unable to delete OVS ports: %s' % e)
+        # Listed again as OVS internal ports are gone now.
+        remaining = [(ns, d) for ns, d in pool.map(
+            _devices, [ns for ns in namespaces if devices[ns]]) if d]
+        pool.map(_delete_devices, remaining)
+    finally:
+        pool.close()
+        pool.join()
+
+    err = ip_batch(['netns delete %s' % ns for ns in namespaces])
+    if err:
+        log('Unable to delete namespaces: %s' % err)
+    return [ns for ns in namespaces
+            if os.path.exists(os.path.join(NETNS_DIR, ns))]
@@ -0,0 +1,417 @@
+import collections
+import json
+import subprocess
+import uuid
+
+from charmhelpers.core.hookenv import (
+    cached,
+    flush,
+    log,
+    DEBUG,
+    INFO,
+)
+from charmhelpers.contrib.network.ovs import (
+    add_ovsbridge_linuxbridge,
+    Patch,
+    PatchPort,
+)
+
+OVS_VSCTL = 'ovs-vsctl'
+
+# Tables and columns loaded when taking a snapshot of the local OVSDB.
+SNAPSHOT_TABLES = collections.OrderedDict([
+    ('Bridge', ('_uuid', 'name', 'ports', 'external_ids', 'ipfix')),
+    ('Port', ('_uuid', 'name', 'interfaces', 'external_ids')),
+    ('Interface', ('_uuid', 'name', 'type', 'options', 'external_ids')),
+    ('IPFIX', ('_uuid', 'targets', 'sampling', 'cache_active_timeout',
+               'cache_max_flows')),
+])
+
+# Matches the defaults of charmhelpers.contrib.network.ovs.enable_ipfix
+IPFIX_SETTINGS = collections.OrderedDict([
+    ('sampling', 64),
+    ('cache_active_timeout', 60),
+    ('cache_max_flows', 128),
+])
+
+
+def decode_ovsdb(value):
+    '''Decode a value in RFC 7047 section 5.1 notation.
+
+    :param value: JSON decoded OVSDB value
+    :returns: uuid.UUID for uuids, list for sets, dict for maps, or the
+              atom itself.
+    '''
+    if isinstance(value, list) and len(value) == 2:
+        kind, data = value
+        if kind in ('uuid', 'named-uuid'):
+            return uuid.UUID(data)
+        if kind == 'set':
+            return [decode_ovsdb(v) for v in data]
+        if kind == 'map':
+            return {decode_ovsdb(k): decode_ovsdb(v) for k, v in data}
+    return value
+
+
+def as_list(value):
+    '''Return value of an OVSDB set column as a list.
+
+    OVSDB presents single element sets as the bare element, ref:
+    juju/charm-helpers#510.
+    '''
+    if isinstance(value, list):
+        return value
+    return [value]
+
+
+def _load_json_tables(output):
+    decoder = json.JSONDecoder()
+    pos = 0
+    output = output.strip()
+    while pos < len(output):
+        table, pos = decoder.raw_decode(output, pos)
+        while pos < len(output) and output[pos].isspace():
+            pos += 1
+        yield table
+
+
+class OVSDBSnapshot(object):
+    '''Point in time copy of the bridge related OVSDB tables.
+
+    The rows are indexed once on load so that lookups which used to list
+    and scan whole tables per call, e.g. ovs.bridge_for_port, are answered
+    from dicts.  The snapshot is not updated by writes; load a new one (or
+    call reset_ovsdb_snapshot) after changing the OVSDB.
+
+    :param tables: {table: [{column: value}, ...]} with decoded values
+    '''
+
+    def __init__(self, tables):
+        self.tables = {t: list(rows) for t, rows in tables.items()}
+        self._rows_by_uuid = {t: {row['_uuid']: row for row in rows}
+                              for t, rows in self.tables.items()}
+        self._bridges = {row['name']: row for row in self.rows('Bridge')}
+        self._ports = {row['name']: row for row in self.rows('Port')}
+        self._interfaces = {row['name']: row
+                            for row in self.rows('Interface')}
+
+        # port uuid -> bridge name
+        self._port_bridge = {}
+        for row in self.rows('Bridge'):
+            for port_uuid in as_list(row['ports']):
+                self._port_bridge[port_uuid] = row['name']
+
+        # interface name -> port row
+        ifaces = self._by_uuid('Interface')
+        self._iface_port = {}
+        for row in self.rows('Port'):
+            for iface_uuid in as_list(row.get('interfaces', [])):
+                if iface_uuid in ifaces:
+                    self._iface_port[ifaces[iface_uuid]['name']] = row
+
+        # patch interface name -> peer interface name
+        self._peers = {
+            row['name']: row['options']['peer']
+            for row in self.rows('Interface')
+            if row.get('type') == 'patch' and
+            'peer' in (row.get('options') or {})}
+
+    def rows(self, table):
+        return self.tables.get(table, [])
+
+    def _by_uuid(self, table):
+        return self._rows_by_uuid.get(table, {})
+
+    def bridges(self):
+        '''Bridge rows keyed by bridge name.'''
+        return self._bridges
+
+    def ports(self):
+        '''Port rows keyed by port name.'''
+        return self._ports
+
+    def interfaces(self):
+        '''Interface rows keyed by interface name.'''
+        return self._interfaces
+
+    def ipfix(self, bridge):
+        '''IPFIX row referenced by bridge or None.'''
+        row = self._bridges.get(bridge)
+        if not row or not as_list(row['ipfix']):
+            return None
+        return self._by_uuid('IPFIX').get(as_list(row['ipfix'])[0])
+
+    def bridges_and_ports_map(self):
+        '''Equivalent of ovs.get_bridges_and_ports_map from the snapshot.
+
+        :returns: {bridge: [port, ...]}
+        :rtype: Dict[str, List[str]]
+        '''
+        ports = self._by_uuid('Port')
+        return {
+            row['name']: sorted(ports[p]['name']
+                                for p in as_list(row['ports'])
+                                if p in ports)
+            for row in self.rows('Bridge')}
+
+    def port_bridges(self):
+        '''Name of the bridge each port is attached to keyed by port name.'''
+        ports = self._by_uuid('Port')
+        return {ports[p]['name']: br
+                for p, br in self._port_bridge.items() if p in ports}
+
+    def uuid_for_port(self, port_name):
+        '''Equivalent of ovs.uuid_for_port from the snapshot.
+
+        :param port_name: Name of port.
+        :type port_name: str
+        :returns: Port UUID.
+        :rtype: Optional[uuid.UUID]
+        '''
+        row = self._ports.get(port_name)
+        return row['_uuid'] if row else None
+
+    def bridge_for_port(self, port_uuid):
+        '''Equivalent of ovs.bridge_for_port from the snapshot.
+
+        :param port_uuid: UUID of port.
+        :type port_uuid: uuid.UUID
+        :returns: Name of bridge or None.
+        :rtype: Optional[str]
+        '''
+        return self._port_bridge.get(port_uuid)
+
+    def port_for_interface(self, iface_name):
+        '''Port row holding the named interface or None.'''
+        return self._iface_port.get(iface_name)
+
+    def peer(self, iface_name):
+        '''Name of the peer of a patch interface or None.'''
+        return self._peers.get(iface_name)
+
+    def patch_ports_on_bridge(self, bridge):
+        '''Equivalent of ovs.patch_ports_on_bridge from the snapshot.
+
+        :param bridge: Name of bridge
+        :type bridge: str
+        :returns: Bridge and port name for both ends of each patch.
+        :rtype: List[Patch[PatchPort[str,str],PatchPort[str,str]]]
+        :raises: ValueError
+        '''
+        patches = []
+        for iface in sorted(self._peers):
+            port = self._iface_port.get(iface)
+            if port is None:
+                raise ValueError('Port for interface named "{}" does '
+                                 'unexpectedly not exist.'.format(iface))
+            if self.bridge_for_port(port['_uuid']) != bridge:
+                continue
+            peer = self._peers[iface]
+            patches.append(Patch(
+                PatchPort(bridge, port['name']),
+                PatchPort(self.bridge_for_port(self.uuid_for_port(peer)),
+                          peer)))
+        return patches
+
+
+def load_ovsdb_snapshot(tables=SNAPSHOT_TABLES):
+    '''Load a snapshot of the local OVSDB with a single ovs-vsctl call.
+
+    :param tables: {table: (column, ...)} to load
+    :returns: OVSDBSnapshot
+    :raises: subprocess.CalledProcessError
+    '''
+    cmd = [OVS_VSCTL, '--format=json']
+    for table, columns in tables.items():
+        cmd.extend(['--', '--columns={}'.format(','.join(columns)),
+                    'list', table])
+    output = subprocess.check_output(cmd).decode('UTF-8')
+    result = {}
+    for table, data in zip(tables, _load_json_tables(output)):
+        result[table] = [
+            {k: decode_ovsdb(v) for k, v in zip(data['headings'], row)}
+            for row in data['data']]
+    return OVSDBSnapshot(result)
+
+
+@cached
+def ovsdb_snapshot():
+    '''Return the OVSDBSnapshot for the current hook or action execution.'''
+    return load_ovsdb_snapshot()
+
+
+def reset_ovsdb_snapshot():
+    '''Drop the cached snapshot, call after writing to the OVSDB.'''
+    flush(ovsdb_snapshot.__name__)
+
+
+DesiredPort = collections.namedtuple(
+    'DesiredPort',
+    ['name', 'bridge', 'external_ids', 'promisc', 'linuxbridge', 'data_port'])
+
+
+class OVSDesiredState(object):
+    '''Bridges, ports and IPFIX settings the charm wants on the unit.'''
+
+    def __init__(self, ipfix_target=None):
+        self.bridges = collections.OrderedDict()
+        self.ports = collections.OrderedDict()
+        self.ipfix_target = ipfix_target
+
+    def add_bridge(self, name, external_ids=None):
+        self.bridges.setdefault(name, {}).update(external_ids or {})
+
+    def add_port(self, bridge, name, external_ids=None, promisc=None,
+                 linuxbridge=False, data_port=False):
+        self.ports[name] = DesiredPort(
+            name=name, bridge=bridge, external_ids=dict(external_ids or {}),
+            promisc=promisc, linuxbridge=linuxbridge, data_port=data_port)
+
+
+class OVSChangePlan(object):
+    '''Changes needed to move the OVSDB to the desired state.
+
+    ``commands`` are applied in a single ovs-vsctl transaction, ``links``
+    are ``ip link set`` invocations for the affected netdevs and
+    ``linuxbridges`` are (ovs bridge, linux bridge, external ids) tuples
+    handled by ovs.add_ovsbridge_linuxbridge.
+    '''
+
+    def __init__(self):
+        self.commands = []
+        self.links = []
+        self.linuxbridges = []
+        self.data_ports_changed = False
+
+    def __bool__(self):
+        return bool(self.commands or self.links or self.linuxbridges)
+
+    def vsctl_cmd(self):
+        cmd = [OVS_VSCTL]
+        for command in self.commands:
+            cmd.append('--')
+            cmd.extend(command)
+        return cmd
+
+    def describe(self):
+        '''Human readable list of the planned changes.'''
+        lines = [' '.join(c) for c in self.commands]
+        lines.extend('ip link set {}'.format(' '.join(link))
+                     for link in self.links)
+        lines.extend('add linuxbridge {} to {}'.format(lb, br)
+                     for br, lb, _ in self.linuxbridges)
+        return lines
+
+
+def _external_id_cmds(table, entity, wanted, current=None):
+    current = current or {}
+    return [('set', table, entity, 'external-ids:{}={}'.format(k, v))
+            for k, v in sorted(wanted.items()) if current.get(k) != v]
+
+
+def _ipfix_matches(row, target):
+    if not row or as_list(row['targets']) != [target]:
+        return False
+    return all(row.get(k) == v for k, v in IPFIX_SETTINGS.items())
+
+
+def plan_ovs_changes(desired, snapshot, inventory):
+    '''Compute the changes needed to reach desired from snapshot.
+
+    :param desired: OVSDesiredState
+    :param snapshot: OVSDBSnapshot of the current state
+    :param inventory: neutron_interfaces.InterfaceInventory
+    :returns: OVSChangePlan
+    '''
+    plan = OVSChangePlan()
+    bridges = snapshot.bridges()
+    ports = snapshot.ports()
+    interfaces = snapshot.interfaces()
+    port_bridges = snapshot.port_bridges()
+
+    for name, external_ids in desired.bridges.items():
+        if name in bridges:
+            plan.commands.extend(_external_id_cmds(
+                'bridge', name, external_ids, bridges[name]['external_ids']))
+        else:
+            plan.commands.append(('--may-exist', 'add-br', name))
+            plan.commands.extend(_external_id_cmds(
+                'bridge', name, external_ids))
+
+    for port in desired.ports.values():
+        if port.linuxbridge:
+            # NOTE: ovs.add_ovsbridge_linuxbridge skips linux bridges that
+            #       are already directly attached to an OVS bridge.
+            if port.name not in port_bridges:
+                plan.linuxbridges.append(
+                    (port.bridge, port.name, port.external_ids))
+                plan.data_ports_changed |= port.data_port
+            continue
+
+        added = port_bridges.get(port.name) != port.bridge
+        if added:
+            plan.commands.append(
+                ('--may-exist', 'add-port', port.bridge, port.name))
+            plan.commands.extend(_external_id_cmds(
+                'Interface', port.name, port.external_ids))
+            plan.commands.extend(_external_id_cmds(
+                'Port', port.name, port.external_ids))
+            plan.data_ports_changed |= port.data_port
+        else:
+            plan.commands.extend(_external_id_cmds(
+                'Interface', port.name, port.external_ids,
+                interfaces.get(port.name, {}).get('external_ids')))
+            plan.commands.extend(_external_id_cmds(
+                'Port', port.name, port.external_ids,
+                ports[port.name]['external_ids']))
+
+        if added or not inventory.is_up(port.name):
+            plan.links.append((port.name, 'up'))
+        if port.promisc and (added or not inventory.is_promisc(port.name)):
+            plan.links.append((port.name, 'promisc', 'on'))
+        elif port.promisc is False and added:
+            plan.links.append((port.name, 'promisc', 'off'))
+
+    for index, bridge in enumerate(desired.bridges):
+        ipfix = snapshot.ipfix(bridge)
+        if desired.ipfix_target:
+            if _ipfix_matches(ipfix, desired.ipfix_target):
+                continue
+            ref = '@ipfix{}'.format(index)
+            plan.commands.append(
+                ('set', 'Bridge', bridge, 'ipfix={}'.format(ref)))
+            plan.commands.append(
+                ('--id={}'.format(ref), 'create', 'IPFIX',
+                 'targets="{}"'.format(desired.ipfix_target)) +
+                tuple('{}={}'.format(k, v)
+                      for k, v in IPFIX_SETTINGS.items()))
+        elif ipfix:
+            plan.commands.append(('clear', 'Bridge', bridge, 'ipfix'))
+
+    return plan
+
+
+def apply_ovs_changes(plan):
+    '''Apply an OVSChangePlan.
+
+    :param plan: OVSChangePlan
+    :raises: subprocess.CalledProcessError
+    '''
+    if plan.commands:
+        log('Applying {} OVS changes in one transaction'
+            .format(len(plan.commands)), level=INFO)
+        try:
+            subprocess.check_call(plan.vsctl_cmd())
+        finally:
+            reset_ovsdb_snapshot()
+    for link in plan.links:
+        subprocess.check_call(['ip', 'link', 'set'] + list(link))
+    for bridge, linuxbridge, external_ids in plan.linuxbridges:
+        # NOTE(lourot): this will raise on focal+ and/or if the system has no
+        # `ifup`. See lp:1877594
+        data = {'external-ids': external_ids}
+        add_ovsbridge_linuxbridge(bridge, linuxbridge, ifdata=data,
+                                  portdata=data)
+        reset_ovsdb_snapshot()
+    if not plan:
+        log('OVS already in desired state', level=DEBUG)
@@ -0,0 +1,466 @@
+import codecs
+import collections
+import json
+import os
+import re
+import socket
+import uuid
+
+from charmhelpers.core.hookenv import (
+    log,
+    DEBUG,
+    WARNING,
+)
+import charmhelpers.contrib.network.ovs.ovsdb as ch_ovsdb
+
+OVSDB_SOCKET = '/var/run/openvswitch/db.sock'
+
+# Database served on OVSDB_SOCKET for each SimpleOVSDB command line tool.
+# The OVN databases are served on other sockets, so the OVN tools always
+# use the command line backend.
+TOOL_DATABASES = {
+    'ovs-vsctl': 'Open_vSwitch',
+}
+
+# Characters delimiting JSON values outside and inside strings.
+_STRUCTURE = re.compile(r'[{}\[\]"]')
+_STRING = re.compile(r'["\\]')
+
+BACKEND_CLI = 'cli'
+BACKEND_NATIVE = 'native'
+
+
+class OVSDBError(RuntimeError):
+    """Error returned by the OVSDB server."""
+    pass
+
+
+class OVSDBConnection(object):
+    """Persistent RFC 7047 JSON-RPC connection to an OVSDB server.
+
+    Each ``ovs-vsctl`` invocation costs a process start and a fresh
+    connection including a full schema download.  This keeps a single
+    unix socket connection open for the lifetime of the object instead.
+    """
+
+    def __init__(self, path=OVSDB_SOCKET, timeout=30):
+        """
+        :param path: Path to the OVSDB server unix socket
+        :type path: str
+        :param timeout: Socket timeout in seconds
+        :type timeout: Optional[float]
+        """
+        self.path = path
+        self.timeout = timeout
+        self._sock = None
+        # Characters may be split across reads.
+        self._utf8 = codecs.getincrementaldecoder('UTF-8')()
+        self._reset_framing()
+        self._next_id = 0
+        self._schemas = {}
+        # Notifications (e.g. monitor updates) received while waiting for a
+        # reply, in arrival order.
+        self.updates = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def connect(self):
+        if self._sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.path)
+            except OSError:
+                sock.close()
+                raise
+            self._sock = sock
+        return self
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+            self._utf8.reset()
+            self._reset_framing()
+
+    def _reset_framing(self):
+        # Pieces of the message being received, and where the end of the
+        # received text stands in it.
+        self._parts = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        # Messages received but not processed yet.
+        self._messages = collections.deque()
+
+    def _feed(self, text):
+        """Queue the messages completed by text.
+
+        Messages are delimited by tracking the nesting of the received text,
+        carried over from one read to the next, so each character is only
+        looked at once however many reads a large reply takes.
+        """
+        pos = start = 0
+        while pos < len(text):
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    pos += 1
+                    continue
+                match = _STRING.search(text, pos)
+                if not match:
+                    break
+                pos = match.end()
+                if match.group() == '\\':
+                    self._escape = True
+                else:
+                    self._in_string = False
+                continue
+            match = _STRUCTURE.search(text, pos)
+            if not match:
+                break
+            pos = match.end()
+            char = match.group()
+            if char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._depth += 1
+            else:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._parts.append(text[start:pos])
+                    self._messages.append(json.loads(''.join(self._parts)))
+                    self._parts = []
+                    start = pos
+        if self._depth:
+            self._parts.append(text[start:])
+
+    def _send(self, msg):
+        self.connect()
+        self._sock.sendall(json.dumps(msg).encode('UTF-8'))
+
+    def _recv(self):
+        while not self._messages:
+            chunk = self._sock.recv(65536)
+            if not chunk:
+                self.close()
+                raise OVSDBError('connection to {} closed'.format(self.path))
+            self._feed(self._utf8.decode(chunk))
+        return self._messages.popleft()
+
+    def _handle(self, msg):
+        """Deal with requests and notifications sent by the server."""
+        if msg.get('method') == 'echo':
+            self._send({'id': msg['id'], 'result': msg['params'],
+                        'error': None})
+        elif msg.get('method'):
+            self.updates.append((msg['method'], msg['params']))
+
+    def call(self, method, *params):
+        """Send a request and wait for its reply.
+
+        :param method: JSON-RPC method name
+        :type method: str
+        :param params: Request parameters
+        :returns: The ``result`` member of the reply
+        :raises: OVSDBError
+        """
+        self._next_id += 1
+        request_id = self._next_id
+        self._send({'method': method, 'params': list(params),
+                    'id': request_id})
+        while True:
+            msg = self._recv()
+            if msg.get('method'):
+                self._handle(msg)
+            elif msg.get('id') == request_id:
+                if msg.get('error'):
+                    raise OVSDBError('{}: {}'.format(method, msg['error']))
+                return msg['result']
+
+    def poll(self):
+        """Process any messages already sent by the server.
+
+        :returns: Notifications received so far, which are then forgotten.
+        :rtype: List[Tuple[str, List]]
+        """
+        self.connect()
+        self._sock.setblocking(False)
+        try:
+            while True:
+                try:
+                    chunk = self._sock.recv(65536)
+                except BlockingIOError:
+                    break
+                if not chunk:
+                    break
+                self._feed(self._utf8.decode(chunk))
+        finally:
+            self._sock.settimeout(self.timeout)
+        while self._messages:
+            self._handle(self._messages.popleft())
+        updates, self.updates = self.updates, []
+        return updates
+
+    def get_schema(self, database):
+        """Return the schema for database, fetched once per connection."""
+        if database not in self._schemas:
+            self._schemas[database] = self.call('get_schema', database)
+        return self._schemas[database]
+
+    def transact(self, database, *operations):
+        """Execute operations in a single transaction.
+
+        :param database: Name of the database
+        :type database: str
+        :param operations: RFC 7047 section 5.2 operations
+        :type operations: Dict
+        :returns: Result of each operation
+        :rtype: List[Dict]
+        :raises: OVSDBError if any of the operations failed
+        """
+        result = self.call('transact', database, *operations)
+        for res in result:
+            if res and res.get('error'):
+                raise OVSDBError('transaction failed: {}: {}'.format(
+                    res['error'], res.get('details', '')))
+        return result
+
+    def select(self, database, table, where=None, columns=None):
+        """Return rows from table matching where.
+
+        :returns: Rows in RFC 7047 section 5.1 notation
+        :rtype: List[Dict[str, any]]
+        """
+        op = {'op': 'select', 'table': table, 'where': where or []}
+        if columns:
+            op['columns'] = list(columns)
+        return self.transact(database, op)[0]['rows']
+
+    def monitor(self, database, monitor_id, requests):
+        """Start monitoring tables.
+
+        Later changes are delivered as ``update`` notifications which can
+        be collected with ``poll``.
+
+        :param requests: {table: {'columns': [...]}}
+        :type requests: Dict[str, Dict]
+        :returns: Initial table contents as table-updates
+        :rtype: Dict[str, Dict[str, Dict]]
+        """
+        return self.call('monitor', database, monitor_id, requests)
+
+    def monitor_cancel(self, monitor_id):
+        return self.call('monitor_cancel', monitor_id)
+
+
+def _column_type(schema, table, column):
+    """Return (key type, value type or None, max) for a column."""
+    if column == '_uuid':
+        return 'uuid', None, 1
+    ctype = schema['tables'][table]['columns'][column]['type']
+    if not isinstance(ctype, dict):
+        return ctype, None, 1
+    key = ctype['key']
+    value = ctype.get('value')
+    return (key['type'] if isinstance(key, dict) else key,
+            value['type'] if isinstance(value, dict) else value,
+            ctype.get('max', 1))
+
+
+def _value(value, ktype):
+    """Convert a column value from ovs-vsctl syntax to RFC 7047."""
+    if value == '[]':
+        return ['set', []]
+    if value == '{}':
+        return ['map', []]
+    return _atom(value, ktype)
+
+
+def _atom(value, atype):
+    """Convert value from ovs-vsctl syntax to an RFC 7047 atom."""
+    if not isinstance(value, str):
+        return ['uuid', str(value)] if atype == 'uuid' else value
+    if len(value) > 1 and value[0] == value[-1] == '"':
+        value = value[1:-1]
+    if atype == 'integer':
+        return int(value)
+    if atype == 'real':
+        return float(value)
+    if atype == 'boolean':
+        return value == 'true'
+    if atype == 'uuid':
+        return ['uuid', value]
+    return value
+
+
+class NativeOVSDB(ch_ovsdb.SimpleOVSDB):
+    """SimpleOVSDB speaking JSON-RPC to the database server directly.
+
+    Tables keep the SimpleOVSDB.Table interface and return rows decoded the
+    same way, so callers can switch backend without other changes.
+
+    Example:
+    ovsdb = NativeOVSDB('ovs-vsctl')
+    for br in ovsdb.bridge.find('name=br-int'):
+        ovsdb.bridge.set(br['_uuid'], 'external_ids:charm', 'managed')
+    """
+
+    def __init__(self, tool, args=None, path=OVSDB_SOCKET, connection=None):
+        """NativeOVSDB constructor.
+
+        :param tool: Tool whose database to operate on, as for SimpleOVSDB
+        :type tool: str
+        :param args: Unused, accepted for compatibility with SimpleOVSDB
+        :type args: Optional[List[str]]
+        :param path: Path to the database server unix socket
+        :type path: str
+        :param connection: Connection to share with other instances
+        :type connection: Optional[OVSDBConnection]
+        """
+        super(NativeOVSDB, self).__init__(tool, args=args)
+        self._database = TOOL_DATABASES[tool]
+        self._connection = connection or OVSDBConnection(path)
+
+    @property
+    def connection(self):
+        return self._connection
+
+    def close(self):
+        self._connection.close()
+
+    def __getattr__(self, table):
+        if table.startswith('_'):
+            raise AttributeError(table)
+        if table not in self._tool_table_map[self._tool]:
+            raise AttributeError(
+                'table "{}" not known for use with "{}"'
+                .format(table, self._tool))
+        schema = self._connection.get_schema(self._database)
+        for name in schema['tables']:
+            if name.lower() == table:
+                return self.Table(self._connection, self._database, name,
+                                  schema)
+        raise AttributeError(
+            'table "{}" not present in database "{}"'
+            .format(table, self._database))
+
+    class Table(ch_ovsdb.SimpleOVSDB.Table):
+        """Methods to interact with contents of OVSDB tables."""
+
+        def __init__(self, connection, database, table, schema):
+            super(NativeOVSDB.Table, self).__init__(None, table)
+            self._connection = connection
+            self._database = database
+            self._schema = schema
+
+        def _deserialize_row(self, row):
+            row.pop('_version', None)
+            return {
+                k: (self._deserialize_ovsdb(v)
+                    if isinstance(v, list) and len(v) > 1 else v)
+                for k, v in row.items()}
+
+        def _select(self, where=None):
+            return [self._deserialize_row(row)
+                    for row in self._connection.select(
+                        self._database, self._table, where=where)]
+
+        def _condition(self, condition):
+            """Translate an ovs-vsctl ``find`` condition to RFC 7047."""
+            column, sep, value = condition.partition('=')
+            if not sep:
+                raise ValueError(
+                    'unsupported condition "{}"'.format(condition))
+            column, _, key = column.partition(':')
+            ktype, vtype, _ = _column_type(self._schema, self._table, column)
+            if key:
+                return [column, 'includes',
+                        ['map', [[_atom(key, ktype), _atom(value, vtype)]]]]
+            return [column, '==', _value(value, ktype)]
+
+        def _where(self, rec):
+            try:
+                return [['_uuid', '==', ['uuid', str(uuid.UUID(str(rec)))]]]
+            except ValueError:
+                return [['name', '==', rec]]
+
+        def _mutate(self, rec, mutations):
+            return self._connection.transact(self._database, {
+                'op': 'mutate', 'table': self._table,
+                'where': self._where(rec), 'mutations': mutations})
+
+        def _find_tbl(self, condition=None):
+            where = [self._condition(condition)] if condition else []
+            return iter(self._select(where))
+
+        def _list_tbl_record(self, record):
+            rows = self._select(self._where(record))
+            if not rows:
+                raise KeyError(record)
+            return rows[0]
+
+        def clear(self, rec, col):
+            _, vtype, _ = _column_type(self._schema, self._table, col)
+            self._connection.transact(self._database, {
+                'op': 'update', 'table': self._table,
+                'where': self._where(rec),
+                'row': {col: ['map' if vtype else 'set', []]}})
+
+        def remove(self, rec, col, value):
+            ktype, vtype, _ = _column_type(self._schema, self._table, col)
+            if vtype and '=' in value:
+                key, _, val = value.partition('=')
+                arg = ['map', [[_atom(key, ktype), _atom(val, vtype)]]]
+            else:
+                arg = ['set', [_atom(value, ktype)]]
+            self._mutate(rec, [[col, 'delete', arg]])
+
+        def set(self, rec, col, value):
+            col, _, key = col.partition(':')
+            ktype, vtype, _ = _column_type(self._schema, self._table, col)
+            if key:
+                key = _atom(key, ktype)
+                self._mutate(rec, [
+                    [col, 'delete', ['set', [key]]],
+                    [col, 'insert', ['map', [[key, _atom(value, vtype)]]]]])
+                return
+            self._connection.transact(self._database, {
+                'op': 'update', 'table': self._table,
+                'where': self._where(rec),
+                'row': {col: _value(value, ktype)}})
+
+
+def simple_ovsdb(tool='ovs-vsctl', backend=None, path=OVSDB_SOCKET):
+    """Return a SimpleOVSDB instance using the requested backend.
+
+    :param tool: Tool whose database to operate on, tools not in
+                 TOOL_DATABASES always use the command line backend
+    :type tool: str
+    :param backend: One of BACKEND_CLI, BACKEND_NATIVE or None to use the
+                    native backend when the server socket is reachable.
+    :type backend: Optional[str]
+    :param path: Path to the database server unix socket
+    :type path: str
+    :returns: SimpleOVSDB or NativeOVSDB
+    :rtype: ch_ovsdb.SimpleOVSDB
+    """
+    if backend == BACKEND_CLI or tool not in TOOL_DATABASES:
+        return ch_ovsdb.SimpleOVSDB(tool)
+    if backend is None and not os.path.exists(path):
+        return ch_ovsdb.SimpleOVSDB(tool)
+    connection = OVSDBConnection(path)
+    try:
+        connection.connect()
+    except OSError as e:
+        if backend == BACKEND_NATIVE:
+            raise
+        log('Unable to connect to {}, falling back to {}: {}'
+            .format(path, tool, e), level=WARNING)
+        return ch_ovsdb.SimpleOVSDB(tool)
+    log('Using native OVSDB backend on {}'.format(path), level=DEBUG)
+    return NativeOVSDB(tool, path=path, connection=connection)
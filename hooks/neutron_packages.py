@@ -0,0 +1,140 @@
+import os
+
+import charmhelpers.contrib.openstack.utils as os_utils
+import charmhelpers.fetch as fetch
+from charmhelpers.core import unitdata
+from charmhelpers.core.hookenv import (
+    log,
+    DEBUG,
+)
+from charmhelpers.fetch import ubuntu_apt_pkg
+
+import neutron_patch
+
+# Changes whenever packages are installed, upgraded or removed.
+DPKG_STATUS = '/var/lib/dpkg/status'
+CACHE_KEY = 'neutron_packages.cache'
+
+
+def dpkg_stamp():
+    '''(mtime, size) of the dpkg status file, None if it is missing.'''
+    try:
+        st = os.stat(DPKG_STATUS)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+class PackageCache(object):
+    '''Installed package versions and release codenames, per dpkg state.
+
+    Loading the apt cache to look up a few installed versions takes seconds
+    and was done several times in every hook: for os_release, the workload
+    version and filtering packages to install or purge.  Versions are read
+    with a single dpkg-query for all packages not known yet, and kept with
+    the codenames derived from them in the unit kv store.  Everything is
+    dropped as soon as the dpkg status file changes.
+    '''
+
+    def __init__(self, original_codename):
+        self.original_codename = original_codename
+        self.data = None
+
+    def _current(self):
+        stamp = dpkg_stamp()
+        if self.data is None:
+            self.data = unitdata.kv().get(CACHE_KEY)
+        if (stamp is None or not self.data or
+                self.data.get('dpkg') != stamp):
+            self.data = {'dpkg': stamp, 'versions': {}, 'codenames': {}}
+        return self.data
+
+    def _save(self):
+        if self.data['dpkg'] is None:
+            return
+        db = unitdata.kv()
+        db.set(CACHE_KEY, self.data)
+        db.flush()
+
+    def installed_versions(self, packages):
+        '''Installed version of each of packages.
+
+        :param packages: package names
+        :type packages: List[str]
+        :returns: {package: version string, None if not installed}
+        :rtype: Dict[str, Optional[str]]
+        '''
+        versions = self._current()['versions']
+        missing = sorted(set(p for p in packages if p not in versions))
+        if missing:
+            installed = fetch.apt_cache().dpkg_list(missing)
+            versions.update(
+                (p, installed.get(p, {}).get('version')) for p in missing)
+            self._save()
+        return {p: versions[p] for p in packages}
+
+    def filter_installed_packages(self, packages):
+        '''fetch.filter_installed_packages from installed_versions.'''
+        versions = self.installed_versions(packages)
+        return [p for p in packages if not versions[p]]
+
+    def filter_missing_packages(self, packages):
+        '''fetch.filter_missing_packages from installed_versions.'''
+        versions = self.installed_versions(packages)
+        return list(set(p for p in packages if versions[p]))
+
+    def get_upstream_version(self, package):
+        '''fetch.get_upstream_version from installed_versions.'''
+        version = self.installed_versions([package])[package]
+        if not version:
+            return None
+        return ubuntu_apt_pkg.upstream_version(version)
+
+    def get_os_codename_package(self, package, fatal=True):
+        '''os_utils.get_os_codename_package, cached per dpkg state.
+
+        Snap installs are not tracked by dpkg, so they are not cached.
+        '''
+        if os_utils.snap_install_requested():
+            return self.original_codename(package, fatal=fatal)
+        codenames = self._current()['codenames']
+        if package not in codenames:
+            codename = self.original_codename(package, fatal=fatal)
+            # openstack-release may have been installed to work it out, so
+            # the codename is stored against the dpkg state after that.
+            codenames = self._current()['codenames']
+            codenames[package] = codename
+            self._save()
+            log('Release of {} is {}.'.format(package, codename),
+                level=DEBUG)
+        return codenames[package]
+
+
+_cache = None
+REPLACED = ('filter_installed_packages', 'filter_missing_packages',
+            'get_upstream_version', 'get_os_codename_package')
+
+
+def install():
+    '''Answer package queries from a PackageCache for the rest of the process.
+
+    The charmhelpers functions are replaced in every module that imported
+    them by name, so os_release, os_application_version_set and the
+    package filters all use the cache.
+
+    :returns: PackageCache
+    '''
+    global _cache
+    if _cache is not None:
+        return _cache
+    _cache = PackageCache(os_utils.get_os_codename_package)
+    originals = {
+        fetch.filter_installed_packages: 'filter_installed_packages',
+        fetch.filter_missing_packages: 'filter_missing_packages',
+        fetch.get_upstream_version: 'get_upstream_version',
+        os_utils.get_os_codename_package: 'get_os_codename_package',
+    }
+    neutron_patch.replace(
+        neutron_patch.references(originals, REPLACED),
+        lambda name, func: getattr(_cache, originals[func]))
+    return _cache
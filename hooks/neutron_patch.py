@@ -0,0 +1,46 @@
+import sys
+import types
+
+
+def references(originals, names):
+    '''Module globals named any of names which refer to any of originals.
+
+    charmhelpers modules import each other's functions by name, so replacing
+    a function for the rest of the process means replacing each of these
+    references.  Only the namespace of each loaded module is read, lazy
+    module attributes are not resolved.
+
+    :param originals: functions to look for, compared by identity
+    :param names: global names to look at in each module
+    :returns: [(module, name, function), ...]
+    '''
+    ids = set(id(func) for func in originals)
+    found = []
+    for module in list(sys.modules.values()):
+        if not isinstance(module, types.ModuleType):
+            continue
+        namespace = vars(module)
+        for name in names:
+            func = namespace.get(name)
+            if func is not None and id(func) in ids:
+                found.append((module, name, func))
+    return found
+
+
+def replace(found, replacement):
+    '''Point references at replacement(name, function).
+
+    :param found: references() result
+    :param replacement: callable returning the new value of a reference
+    '''
+    for module, name, func in found:
+        setattr(module, name, replacement(name, func))
+
+
+def restore(found):
+    '''Point references back at their original function.
+
+    :param found: references() result passed to replace()
+    '''
+    for module, name, func in found:
+        setattr(module, name, func)
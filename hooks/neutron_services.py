@@ -0,0 +1,148 @@
+import collections
+import contextlib
+import datetime
+import subprocess
+
+from charmhelpers.core import host
+from charmhelpers.core.hookenv import (
+    log,
+    DEBUG,
+    WARNING,
+)
+import charmhelpers.contrib.openstack.deferred_events as deferred_events
+import charmhelpers.contrib.openstack.utils as os_utils
+
+# systemd unit properties fetched for every service.
+PROPERTIES = ('ActiveState', 'SubState', 'ActiveEnterTimestamp')
+# Format of ActiveEnterTimestamp, as parsed by deferred_events.
+TIMESTAMP_FORMAT = '%a %Y-%m-%d %H:%M:%S %Z'
+
+
+class ServiceState(collections.namedtuple(
+        'ServiceState', ['active_state', 'sub_state', 'active_enter'])):
+    '''State of a service as reported by systemctl show.'''
+
+    __slots__ = ()
+
+    @property
+    def running(self):
+        return self.active_state == 'active'
+
+    def started(self):
+        '''Time the service last entered the active state.
+
+        :returns: datetime.datetime or None if unknown
+        '''
+        if not self.active_enter:
+            return None
+        try:
+            return datetime.datetime.strptime(self.active_enter,
+                                              TIMESTAMP_FORMAT)
+        except ValueError:
+            return None
+
+
+UNKNOWN = ServiceState('unknown', 'unknown', '')
+
+
+def parse_show(output, services):
+    '''Map systemctl show output for several units to their services.
+
+    systemctl show prints the properties of each unit in the order the units
+    were given, separated by an empty line.
+
+    :param output: systemctl show output
+    :param services: services passed to systemctl show
+    :returns: {service: ServiceState}
+    '''
+    states = dict.fromkeys(services, UNKNOWN)
+    for service, block in zip(services, output.strip('\n').split('\n\n')):
+        props = dict(line.split('=', 1) for line in block.splitlines()
+                     if '=' in line)
+        states[service] = ServiceState(
+            props.get('ActiveState', UNKNOWN.active_state),
+            props.get('SubState', UNKNOWN.sub_state),
+            props.get('ActiveEnterTimestamp', UNKNOWN.active_enter))
+    return states
+
+
+def service_states(services):
+    '''State of services, from a single systemctl call.
+
+    Hosts not running systemd fall back to a service_running check per
+    service.
+
+    :param services: service names
+    :returns: {service: ServiceState}
+    '''
+    services = list(services)
+    if not services:
+        return {}
+    if not host.init_is_systemd():
+        return {s: ServiceState('active' if host.service_running(s)
+                                else 'inactive', '', '')
+                for s in services}
+    cmd = ['systemctl', 'show', '--property={}'.format(','.join(PROPERTIES)),
+           '--'] + services
+    try:
+        output = subprocess.check_output(cmd, universal_newlines=True)
+    except subprocess.CalledProcessError as e:
+        log('Unable to query state of {}: {}'.format(', '.join(services), e),
+            level=WARNING)
+        output = e.output or ''
+    return parse_show(output, services)
+
+
+@contextlib.contextmanager
+def batched_service_checks(services):
+    '''Answer charmhelpers service_running checks from one systemctl call.
+
+    Within the block charmhelpers.contrib.openstack.utils.service_running
+    returns the state of services as they were on entry; other services are
+    still checked individually.
+
+    :param services: service names
+    :returns: {service: ServiceState}
+    '''
+    states = service_states(services)
+    original = os_utils.service_running
+
+    def service_running(service_name, **kwargs):
+        if service_name in states:
+            return states[service_name].running
+        return original(service_name, **kwargs)
+
+    os_utils.service_running = service_running
+    try:
+        yield states
+    finally:
+        os_utils.service_running = original
+
+
+def check_restart_timestamps():
+    '''deferred_events.check_restart_timestamps with one systemctl call.
+
+    Deferred restarts of services which are running and were started after
+    the restart was requested are cleared. Those of stopped or failed
+    services, or of services with no known start time, are kept.
+    '''
+    if not host.init_is_systemd():
+        return
+    events = deferred_events.get_deferred_restarts()
+    if not events:
+        return
+    states = service_states(sorted(set(e.service for e in events)))
+    for event in events:
+        state = states[event.service]
+        start_time = state.started()
+        deferred_restart_time = datetime.datetime.fromtimestamp(
+            event.timestamp)
+        if state.running and start_time and \
+                start_time >= deferred_restart_time:
+            deferred_events.clear_deferred_restarts([event.service])
+        else:
+            log('Restart still required, {} is {} and was started at {}, '
+                'restart was requested at {}'.format(
+                    event.service, state.active_state, start_time,
+                    deferred_restart_time),
+                level=DEBUG)
@@ -0,0 +1,607 @@
+import collections
+import contextlib
+import copy
+import functools
+import hashlib
+import itertools
+import os
+import stat
+import subprocess
+import tempfile
+import time
+import types
+
+import charmhelpers.contrib.openstack.deferred_events as deferred_events
+import charmhelpers.contrib.openstack.templating as templating
+import charmhelpers.contrib.openstack.utils as os_utils
+from charmhelpers.core import host
+from charmhelpers.core.hookenv import (
+    log,
+    DEBUG,
+    ERROR,
+    INFO,
+    WARNING,
+)
+
+# Every path registered with a NeutronConfigRenderer in this process.
+_registered = set()
+# (path, previous content) for each file replaced by
+# NeutronConfigRenderer.write, in write order.
+_written = []
+# {path: ((st_ino, st_size, st_mtime_ns), sha256)} of content on disk.
+_digests = {}
+
+
+def context_key(ctxt):
+    '''Identity of a context generator.
+
+    Generators of the same class constructed with the same arguments produce
+    the same context, so they share a key.  Anything that cannot be
+    compared this way (e.g. plain functions) is keyed on its id.
+
+    :param ctxt: context generator
+    :returns: hashable key
+    '''
+    if isinstance(ctxt, types.FunctionType) or not hasattr(ctxt, '__dict__'):
+        return id(ctxt)
+    return (type(ctxt), repr(sorted(vars(ctxt).items())))
+
+
+def _stat_key(path):
+    st = os.stat(path)
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def file_digest(path):
+    '''sha256 of the content of path.
+
+    The digest is kept until the file's inode, size or mtime change, so a
+    file written or read once is not read again.
+
+    :param path: file to hash
+    :returns: hex digest or None if path does not exist
+    '''
+    try:
+        key = _stat_key(path)
+    except FileNotFoundError:
+        return None
+    cached = _digests.get(path)
+    if cached and cached[0] == key:
+        return cached[1]
+    with open(path, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    _digests[path] = (key, digest)
+    return digest
+
+
+def write_atomic(path, content):
+    '''Replace path with content.
+
+    content goes to a temporary file in the same directory which is synced
+    and renamed over path, so readers see either the old or the new file.
+    Mode and ownership of an existing file are kept.
+
+    :param path: file to write
+    :param content: bytes to write
+    '''
+    dirname, basename = os.path.split(path)
+    fd, tmp = tempfile.mkstemp(prefix='.{}.'.format(basename), dir=dirname)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            out.write(content)
+            out.flush()
+            os.fsync(out.fileno())
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp, 0o666 & ~umask)
+        else:
+            os.chmod(tmp, stat.S_IMODE(st.st_mode))
+            os.chown(tmp, st.st_uid, st.st_gid)
+        os.rename(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def parse_ini(content):
+    '''Parse INI content the way oslo.config reads it.
+
+    Comments, blank lines and the order of options and sections do not
+    matter; repeated options keep all their values in order.
+
+    :param content: file content
+    :type content: bytes or str
+    :returns: {section: {option: [value, ...]}}
+    '''
+    if isinstance(content, bytes):
+        content = content.decode('UTF-8', 'replace')
+    sections = {}
+    options = sections.setdefault('DEFAULT', {})
+    values = None
+    for line in content.splitlines():
+        if not line.strip() or line.lstrip()[0] in '#;':
+            continue
+        if line[0] in ' \t' and values is not None:
+            values[-1] = '{}\n{}'.format(values[-1], line.strip())
+            continue
+        line = line.strip()
+        if line.startswith('[') and line.endswith(']'):
+            options = sections.setdefault(line[1:-1].strip(), {})
+            values = None
+            continue
+        sep = min((i for i in (line.find('='), line.find(':')) if i > 0),
+                  default=len(line))
+        values = options.setdefault(line[:sep].strip(), [])
+        values.append(line[sep + 1:].strip())
+    return {name: opts for name, opts in sections.items() if opts}
+
+
+def changed_options(old, new):
+    '''Options whose values differ between two INI files.
+
+    :param old: previous content, None if there was no file
+    :param new: current content, None if there is no file
+    :returns: set of (section, option)
+    '''
+    old = parse_ini(old) if old is not None else {}
+    new = parse_ini(new) if new is not None else {}
+    changed = set()
+    for section in set(old) | set(new):
+        before = old.get(section, {})
+        after = new.get(section, {})
+        changed.update((section, option)
+                       for option in set(before) | set(after)
+                       if before.get(option) != after.get(option))
+    return changed
+
+
+def options_changed(old, new):
+    '''Whether two INI files differ in any option value.
+
+    :param old: previous content, None if there was no file
+    :param new: current content, None if there is no file
+    :returns: bool
+    '''
+    if old is None or new is None:
+        return old is not new
+    return parse_ini(old) != parse_ini(new)
+
+
+class SharedContext(object):
+    '''Proxy for a context generator registered with NeutronConfigRenderer.
+
+    While the renderer has an evaluation cache active the wrapped generator
+    is called at most once, and every template using it gets a copy of the
+    same result.  Attributes used for status reporting (interfaces,
+    missing_data, get_related...) are those of the wrapped generator.
+    '''
+
+    def __init__(self, renderer, context):
+        self._renderer = renderer
+        self.context = context
+
+    def __getattr__(self, name):
+        return getattr(self.context, name)
+
+    def __call__(self):
+        cache = self._renderer.context_cache
+        if cache is None:
+            return self.context()
+        key = id(self.context)
+        if key not in cache:
+            cache[key] = self.context()
+        return copy.copy(cache[key])
+
+
+class NeutronConfigRenderer(templating.OSConfigRenderer):
+    '''OSConfigRenderer evaluating each distinct context once per pass.
+
+    Most contexts are registered on several config files, e.g.
+    NeutronGatewayContext on about ten of them, and each evaluation scans
+    relations and resolves addresses.  Generators with the same identity
+    (see context_key) are replaced by one shared instance at registration
+    and write_all evaluates each of them once.  Results are only kept for
+    the duration of the write_all call so changes to config or relation
+    data between calls are always picked up.
+
+    The interfaces each config file is rendered from are those declared by
+    its contexts, plus any context_relations lists for contexts reading
+    relations they do not declare.  write_for renders only the files of the
+    given interfaces, evaluating only their contexts.
+    '''
+
+    def __init__(self, templates_dir, openstack_release,
+                 context_relations=None):
+        super(NeutronConfigRenderer, self).__init__(templates_dir,
+                                                    openstack_release)
+        self._shared_contexts = {}
+        self.context_cache = None
+        # {context generator class: [interface, ...]}
+        self.context_relations = context_relations or {}
+        # {config_file: {interface, ...}}
+        self.file_interfaces = {}
+
+    def _share(self, ctxt):
+        key = context_key(ctxt)
+        if key not in self._shared_contexts:
+            self._shared_contexts[key] = SharedContext(self, ctxt)
+        return self._shared_contexts[key]
+
+    def register(self, config_file, contexts, config_template=None):
+        if hasattr(contexts, '__call__'):
+            contexts = [contexts]
+        super(NeutronConfigRenderer, self).register(
+            config_file, [self._share(c) for c in contexts],
+            config_template=config_template)
+        _registered.add(config_file)
+        self.file_interfaces[config_file] = set(itertools.chain.from_iterable(
+            self.context_interfaces(c) for c in contexts))
+
+    def context_interfaces(self, ctxt):
+        '''Interfaces whose relation data ctxt is generated from.
+
+        :param ctxt: context generator
+        :returns: list of interfaces
+        '''
+        interfaces = list(getattr(ctxt, 'interfaces', None) or [])
+        for cls, relations in self.context_relations.items():
+            if isinstance(ctxt, cls):
+                interfaces.extend(relations)
+        return interfaces
+
+    def files_for(self, interfaces):
+        '''Registered config files rendered from any of interfaces.
+
+        :param interfaces: relation interfaces
+        :type interfaces: List[str]
+        :returns: config files, in registration order
+        :rtype: List[str]
+        '''
+        interfaces = set(interfaces)
+        return [config_file for config_file in self.templates
+                if self.file_interfaces.get(config_file, set()) & interfaces]
+
+    def write(self, config_file):
+        """Write a single config file if its content changed.
+
+        The template is rendered in memory and only written, atomically, when
+        it differs from what is on disk.  Written paths are recorded for
+        restart_on_change.
+
+        :param config_file: registered config file
+        :type config_file: str
+        :raises: templating.OSConfigException if config_file is not registered
+        """
+        if config_file not in self.templates:
+            log('Config not registered: %s' % config_file, level=ERROR)
+            raise templating.OSConfigException
+
+        _out = self.render(config_file).encode('UTF-8')
+        digest = hashlib.sha256(_out).hexdigest()
+        path = os.path.realpath(config_file)
+        if file_digest(path) == digest:
+            log('Template %s unchanged.' % config_file, level=DEBUG)
+            return
+
+        previous = None
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                previous = f.read()
+        write_atomic(path, _out)
+        _digests[path] = (_stat_key(path), digest)
+        _written.append((config_file, previous))
+        log('Wrote template %s.' % config_file, level=INFO)
+
+    @contextlib.contextmanager
+    def evaluation_cache(self):
+        '''Evaluate each distinct context at most once within the block.'''
+        if self.context_cache is not None:
+            yield
+            return
+        self.context_cache = {}
+        try:
+            yield
+        finally:
+            self.context_cache = None
+
+    def write_all(self):
+        with self.evaluation_cache():
+            super(NeutronConfigRenderer, self).write_all()
+
+    def write_for(self, interfaces):
+        """Write the config files rendered from any of interfaces.
+
+        Files not depending on interfaces are neither rendered nor written,
+        and contexts only used by them are not evaluated.  A hook only
+        changing the data of interfaces gets the same files as from
+        write_all.
+
+        :param interfaces: relation interfaces whose data changed
+        :type interfaces: List[str]
+        """
+        with self.evaluation_cache():
+            for config_file in self.files_for(interfaces):
+                self.write(config_file)
+
+    def complete_contexts(self):
+        with self.evaluation_cache():
+            return super(NeutronConfigRenderer, self).complete_contexts()
+
+
+def reload_service(service_name):
+    '''Reload a service so it re-reads its configuration.
+
+    Services whose unit has no reload command are sent SIGHUP instead.
+
+    :param service_name: service to reload
+    :returns: bool: whether the service was reloaded
+    '''
+    if host.service('reload', service_name):
+        return True
+    if not host.init_is_systemd() or not host.service_running(service_name):
+        return False
+    return subprocess.call(['systemctl', 'kill', '--signal=HUP',
+                            '--kill-who=main', service_name]) == 0
+
+
+def check_and_record_reload_request(service, changed_files):
+    """Check if reloads are permitted, if they are not log the request.
+
+    Reloads are permitted when restarts are.  A deferred reload is recorded
+    with action 'reload', see process_deferred_reloads.
+
+    :param service: Service to be reloaded
+    :type service: str
+    :param changed_files: Files that have changed to trigger the reload.
+    :type changed_files: List[str]
+    :returns: Whether reloads are permitted
+    :rtype: bool
+    """
+    permitted = deferred_events.is_restart_permitted()
+    if not permitted:
+        deferred_events.save_event(deferred_events.ServiceEvent(
+            timestamp=round(time.time()),
+            service=service,
+            reason='Reloadable option(s) changed: {}'.format(
+                ', '.join(sorted(set(changed_files)))),
+            action='reload'))
+    return permitted
+
+
+def deferred_reloads():
+    """Services with a deferred reload and no deferred restart.
+
+    A deferred restart also picks up the options of a deferred reload.
+
+    :returns: Service names
+    :rtype: List[str]
+    """
+    events = deferred_events.get_deferred_events()
+    restarts = set(e.service for e in events if e.action == 'restart')
+    return sorted(set(e.service for e in events
+                      if e.action == 'reload') - restarts)
+
+
+def process_deferred_reloads():
+    """Reload the services which have a deferred reload.
+
+    Services which also have a deferred restart are left to that restart.
+    A service failing to reload is restarted.
+
+    :returns: Services reloaded
+    :rtype: List[str]
+    """
+    reloads = deferred_reloads()
+    for service_name in reloads:
+        if not reload_service(service_name):
+            log('Reload of %s failed, restarting it.' % service_name,
+                level=WARNING)
+            host.service_restart(service_name)
+    # Only reload events are left for these services.
+    deferred_events.clear_deferred_events(reloads, 'reload')
+    return reloads
+
+
+def _reloadable(service, paths, changed, reload_options):
+    '''Whether only options service reloads changed in paths.'''
+    options = reload_options.get(service, {})
+    return all(changed[path] is not None and path in options and
+               changed[path] <= options[path] for path in paths)
+
+
+def _reads_changes(service, path, changed, service_sections):
+    '''Whether the changes made to path concern service.'''
+    options = changed[path]
+    sections = service_sections.get(service, {}).get(path)
+    if options is None or sections is None:
+        return True
+    return any(section.lower() in sections for section, _ in options)
+
+
+def restart_changed_services(restart_map, changed, stopstart=False,
+                             restart_functions=None, can_restart_now_f=None,
+                             post_svc_restart_f=None,
+                             pre_restarts_wait_f=None, reload_options=None,
+                             can_reload_now_f=None, service_sections=None):
+    """Restart, or reload, the services of changed paths.
+
+    Same ordering and hooks as charmhelpers' _post_restart_on_change_helper,
+    with the changed paths given rather than worked out from checksums.
+    A service is reloaded instead when every option changed in its files is
+    one it reloads; if the reload fails it is restarted.  A service is left
+    alone when none of the sections it reads changed in any of its files.
+
+    :param restart_map: {file: [service, ...]}
+    :type restart_map: Dict[str, List[str,]]
+    :param changed: changed paths and the (section, option) pairs that
+                    changed in them, None when unknown
+    :type changed: Dict[str, Optional[Set[Tuple[str, str]]]]
+    :param stopstart: whether to stop, start or restart a service
+    :type stopstart: bool
+    :param restart_functions: nonstandard functions to use to restart services
+    :type restart_functions: Dict[str, Callable[[str], None]]
+    :param can_restart_now_f: check if the restart is permitted
+    :type can_restart_now_f: Callable[[str, List[str]], bool]
+    :param post_svc_restart_f: run after a service has restarted
+    :type post_svc_restart_f: Callable[[str], None]
+    :param pre_restarts_wait_f: called before any restarts
+    :type pre_restarts_wait_f: Callable[None, None]
+    :param reload_options: {service: {file: {(section, option), ...}}} of
+                           options services pick up on reload
+    :type reload_options: Dict[str, Dict[str, Set[Tuple[str, str]]]]
+    :param can_reload_now_f: check if the reload is permitted
+    :type can_reload_now_f: Callable[[str, List[str]], bool]
+    :param service_sections: {service: {file: {section, ...}}} of the
+                             lower-cased sections services read, for files
+                             they do not read all of
+    :type service_sections: Dict[str, Dict[str, Set[str]]]
+    """
+    restart_functions = restart_functions or {}
+    reload_options = reload_options or {}
+    service_sections = service_sections or {}
+    changed_files = collections.defaultdict(list)
+    restarts = []
+    for path, services in restart_map.items():
+        if path in changed:
+            services = [svc for svc in services
+                        if _reads_changes(svc, path, changed,
+                                          service_sections)]
+            if len(services) < len(restart_map[path]):
+                log('Sections changed in %s are not read by %s.' %
+                    (path, ', '.join(sorted(set(restart_map[path]) -
+                                            set(services)))),
+                    level=DEBUG)
+            restarts.append(services)
+            for svc in services:
+                changed_files[svc].append(path)
+    services_list = list(
+        collections.OrderedDict.fromkeys(itertools.chain(*restarts)))
+    if not services_list:
+        return
+    if pre_restarts_wait_f:
+        pre_restarts_wait_f()
+    actions = ('stop', 'start') if stopstart else ('restart',)
+    for service_name in services_list:
+        paths = changed_files[service_name]
+        if (service_name not in restart_functions and
+                _reloadable(service_name, paths, changed, reload_options)):
+            if can_reload_now_f and not can_reload_now_f(service_name, paths):
+                continue
+            log('Reloading %s, only reloadable options changed in %s.' %
+                (service_name, ', '.join(paths)), level=INFO)
+            if reload_service(service_name):
+                continue
+            log('Reload of %s failed, restarting it.' % service_name,
+                level=WARNING)
+        elif can_restart_now_f:
+            if not can_restart_now_f(service_name, paths):
+                continue
+        if service_name in restart_functions:
+            restart_functions[service_name](service_name)
+        else:
+            for action in actions:
+                host.service(action, service_name)
+        if post_svc_restart_f:
+            post_svc_restart_f(service_name)
+
+
+def _rendered_changes(written, option_paths, option_diff_paths):
+    '''Paths written by the renderer that should restart services.
+
+    :param written: (path, previous content) entries, oldest first
+    :param option_paths: paths to work out the changed options of
+    :param option_diff_paths: paths only counted as changed when an option
+                              value differs from the previous content
+    :returns: {path: {(section, option), ...} or None if not worked out}
+    '''
+    previous = {}
+    for path, content in written:
+        previous.setdefault(path, content)
+    changed = {}
+    for path, content in previous.items():
+        options = None
+        if path in option_paths or path in option_diff_paths:
+            with open(os.path.realpath(path), 'rb') as f:
+                current = f.read()
+            if (path in option_diff_paths and
+                    not options_changed(content, current)):
+                log('No option values changed in %s, not restarting its '
+                    'services.' % path, level=INFO)
+                continue
+            options = changed_options(content, current)
+        changed[path] = options
+    return changed
+
+
+def restart_on_change(restart_map, stopstart=False, restart_functions=None,
+                      can_restart_now_f=None, post_svc_restart_f=None,
+                      pre_restarts_wait_f=None, option_diff_paths=None,
+                      reload_options=None, can_reload_now_f=None,
+                      service_sections=None):
+    """pausable_restart_on_change using the paths NeutronConfigRenderer wrote.
+
+    Files registered with a NeutronConfigRenderer count as changed when the
+    renderer replaced them during the call, so they are neither read nor
+    hashed here.  Other files in the restart map are compared by checksum
+    before and after, as charmhelpers does.  Other arguments are those of
+    charmhelpers.contrib.openstack.utils.pausable_restart_on_change.
+
+    :param option_diff_paths: Optionally callable, registered INI files whose
+                              services are only restarted when an option
+                              value changed, not for comments or ordering.
+    :type option_diff_paths: Union[Callable[[], List[str]], List[str]]
+    :param reload_options: Optionally callable, options each service picks
+                           up on reload, see restart_changed_services.
+    :type reload_options: Union[Callable[[], Dict], Dict]
+    :param can_reload_now_f: check if a reload is permitted
+    :type can_reload_now_f: Callable[[str, List[str]], bool]
+    :param service_sections: Optionally callable, sections services read of
+                             the files they do not read all of, see
+                             restart_changed_services.
+    :type service_sections: Union[Callable[[], Dict], Dict]
+    :returns: decorator
+    :rtype: Callable
+    """
+    def _resolve(value, default):
+        value = value or default
+        return value() if callable(value) else value
+
+    def wrap(f):
+        @functools.wraps(f)
+        def wrapped_f(*args, **kwargs):
+            if os_utils.is_unit_paused_set():
+                return f(*args, **kwargs)
+            _map = restart_map() if callable(restart_map) else restart_map
+            mark = len(_written)
+            checksums = {path: host.path_hash(path) for path in _map
+                         if path not in _registered}
+            result = f(*args, **kwargs)
+            written = _written[mark:]
+            diff_paths = _resolve(option_diff_paths, []) if written else []
+            _reload = _resolve(reload_options, {}) if written else {}
+            _sections = _resolve(service_sections, {}) if written else {}
+            option_paths = set(itertools.chain.from_iterable(
+                itertools.chain(_reload.values(), _sections.values())))
+            changed = _rendered_changes(written, option_paths, diff_paths)
+            changed.update((path, None) for path, checksum in checksums.items()
+                           if host.path_hash(path) != checksum)
+            restart_changed_services(
+                _map, changed, stopstart, restart_functions,
+                can_restart_now_f, post_svc_restart_f, pre_restarts_wait_f,
+                _reload, can_reload_now_f, _sections)
+            return result
+        return wrapped_f
+    return wrap
+
+
+os_restart_on_change = functools.partial(
+    restart_on_change,
+    can_restart_now_f=deferred_events.check_and_record_restart_request,
+    post_svc_restart_f=deferred_events.process_svc_restart,
+    can_reload_now_f=check_and_record_reload_request)
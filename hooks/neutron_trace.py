@@ -0,0 +1,197 @@
+import collections
+import contextlib
+import functools
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from charmhelpers.core import unitdata
+
+import neutron_patch
+
+HISTORY_KEY = 'neutron_trace.history'
+# Number of hook executions kept in the unit kv store.
+HISTORY_SIZE = 200
+# subprocess functions wrapped while a hook is traced.
+TRACED_FUNCTIONS = ('call', 'check_call', 'check_output', 'run')
+
+Span = collections.namedtuple('Span', ['command', 'duration', 'returncode',
+                                       'caller'])
+
+
+def command_name(args):
+    '''Name of the program run by a subprocess call.
+
+    Arguments are left out, they may carry credentials (e.g. relation-set).
+
+    :param args: args passed to the subprocess function
+    :returns: str: basename of the executable
+    '''
+    if isinstance(args, (str, bytes)):
+        args = args.split()
+    if isinstance(args, (list, tuple)) and args:
+        name = args[0]
+        if isinstance(name, bytes):
+            name = name.decode('UTF-8', 'replace')
+        return os.path.basename(str(name))
+    return '?'
+
+
+class HookTrace(object):
+    '''Spans of the commands run by one hook execution.'''
+
+    def __init__(self, hook):
+        self.hook = hook
+        self.start = time.time()
+        self.spans = []
+        # Nesting of traced calls, per thread as commands may be run from
+        # thread pools.
+        self._local = threading.local()
+
+    def wrap(self, func):
+        @functools.wraps(func)
+        def traced(*args, **kwargs):
+            # check_output and check_call are implemented with run and call,
+            # only the outermost call is a span.
+            if getattr(self._local, 'depth', 0):
+                return func(*args, **kwargs)
+            frame = sys._getframe(1)
+            while frame.f_back and frame.f_globals.get('__name__') in (
+                    'subprocess', __name__):
+                frame = frame.f_back
+            caller = '{}.{}'.format(frame.f_globals.get('__name__'),
+                                    frame.f_code.co_name)
+            command = command_name(args[0] if args else kwargs.get('args'))
+            returncode = None
+            self._local.depth = 1
+            start = time.time()
+            try:
+                result = func(*args, **kwargs)
+                if func.__name__ == 'call':
+                    returncode = result
+                else:
+                    returncode = getattr(result, 'returncode', 0)
+                return result
+            except subprocess.CalledProcessError as e:
+                returncode = e.returncode
+                raise
+            finally:
+                self._local.depth = 0
+                self.spans.append(Span(command, time.time() - start,
+                                       returncode, caller))
+        return traced
+
+    def summary(self):
+        '''Totals for the hook, as stored in the history.
+
+        :returns: dict
+        '''
+        sites = {}
+        for span in self.spans:
+            key = '{} {}'.format(span.caller, span.command)
+            calls, total, longest = sites.get(key, (0, 0.0, 0.0))
+            sites[key] = [calls + 1, round(total + span.duration, 4),
+                          round(max(longest, span.duration), 4)]
+        return {
+            'hook': self.hook,
+            'timestamp': round(self.start),
+            'duration': round(time.time() - self.start, 4),
+            'subprocess': round(sum(s.duration for s in self.spans), 4),
+            'calls': len(self.spans),
+            'failed': len([s for s in self.spans if s.returncode != 0]),
+            'sites': sites,
+        }
+
+
+def record(summary):
+    '''Add a hook summary to the history in the unit kv store.
+
+    :param summary: HookTrace.summary() result
+    '''
+    db = unitdata.kv()
+    history = db.get(HISTORY_KEY, [])
+    history.append(summary)
+    db.set(HISTORY_KEY, history[-HISTORY_SIZE:])
+    db.flush()
+
+
+def history():
+    '''Recorded hook summaries, oldest first.
+
+    :returns: list of dict
+    '''
+    return unitdata.kv().get(HISTORY_KEY, [])
+
+
+@contextlib.contextmanager
+def trace_hook(hook, enabled=True):
+    '''Record the commands run within the block as spans of hook.
+
+    :param hook: hook name
+    :param enabled: when False the block runs untraced
+    :returns: HookTrace or None when not enabled
+    '''
+    if not enabled:
+        yield None
+        return
+    trace = HookTrace(hook)
+    # Modules doing "from subprocess import check_output" hold their own
+    # reference, so those are wrapped as well.
+    targets = neutron_patch.references(
+        [getattr(subprocess, name) for name in TRACED_FUNCTIONS],
+        TRACED_FUNCTIONS)
+    neutron_patch.replace(targets, lambda name, func: trace.wrap(func))
+    try:
+        yield trace
+    finally:
+        neutron_patch.restore(targets)
+        record(trace.summary())
+
+
+def percentile(values, pct):
+    '''Nearest-rank percentile of values.
+
+    :param values: list of numbers
+    :param pct: percentile, 0 to 100
+    :returns: number or None if values is empty
+    '''
+    if not values:
+        return None
+    values = sorted(values)
+    rank = max(int(-(-pct * len(values) // 100)), 1)
+    return values[rank - 1]
+
+
+def hook_stats(summaries, top=10):
+    '''Duration percentiles per hook and the slowest call sites.
+
+    :param summaries: hook summaries, as returned by history()
+    :param top: number of call sites to return
+    :returns: tuple of ({hook: stats}, [call site stats, slowest first])
+    '''
+    durations = collections.defaultdict(list)
+    subprocess_time = collections.defaultdict(list)
+    sites = {}
+    for summary in summaries:
+        durations[summary['hook']].append(summary['duration'])
+        subprocess_time[summary['hook']].append(summary['subprocess'])
+        for key, (calls, total, longest) in summary['sites'].items():
+            site = sites.setdefault(key, {'site': key, 'calls': 0,
+                                          'total': 0.0, 'max': 0.0})
+            site['calls'] += calls
+            site['total'] = round(site['total'] + total, 4)
+            site['max'] = max(site['max'], longest)
+    hooks = {}
+    for hook, values in durations.items():
+        hooks[hook] = {
+            'count': len(values),
+            'p50': percentile(values, 50),
+            'p90': percentile(values, 90),
+            'p99': percentile(values, 99),
+            'max': max(values),
+            'subprocess-p50': percentile(subprocess_time[hook], 50),
+        }
+    slowest = sorted(sites.values(), key=lambda s: s['total'], reverse=True)
+    return hooks, slowest[:top]
@@ -1,3 +1,5 @@
+import collections
+import functools
 import os
 import shutil
 import subprocess
@@ -14,7 +16,9 @@ from charmhelpers.core.host import (
     init_is_systemd,
     CompareHostReleases,
 )
+from charmhelpers.core import hookenv, unitdata
 from charmhelpers.core.hookenv import (
+    flush,
     log,
     DEBUG,
     INFO,
@@ -25,6 +29,7 @@ from charmhelpers.core.hookenv import (
     relation_ids,
     related_units,
     relation_get,
+    status_set,
 )
 from charmhelpers.fetch import (
     apt_upgrade,
@@ -35,14 +40,7 @@ from charmhelpers.fetch import (
     filter_missing_packages,
 )
 from charmhelpers.contrib.network.ovs import (
-    add_bridge,
-    add_bridge_port,
-    add_ovsbridge_linuxbridge,
-    enable_ipfix,
-    disable_ipfix,
     full_restart,
-    get_bridges_and_ports_map,
-    is_linuxbridge_interface,
     generate_external_ids,
 )
 from charmhelpers.contrib.hahelpers.cluster import (
@@ -52,7 +50,8 @@ from charmhelpers.contrib.openstack.utils import (
     CompareOpenStackReleases,
     configure_installation_source,
     get_os_codename_install_source,
-    make_assess_status_func,
+    is_unit_paused_set,
+    _determine_os_workload_status,
     os_application_version_set,
     os_release,
     pause_unit,
@@ -70,13 +69,9 @@ from charmhelpers.contrib.openstack.context import (
     SyslogContext,
     NeutronAPIContext,
     NetworkServiceContext,
-    ExternalPortContext,
-    PhyNICMTUContext,
-    DataPortContext,
     validate_ovs_use_veth,
     DHCPAgentContext,
 )
-import charmhelpers.contrib.openstack.templating as templating
 from charmhelpers.contrib.openstack.neutron import headers_package
 from neutron_contexts import (
     CORE_PLUGIN, OVS, NSX, N1KV, OVS_ODL,
@@ -84,13 +79,99 @@ from neutron_contexts import (
     L3AgentContext,
     NovaMetadataContext,
     NovaMetadataJSONContext,
+    ExternalPortContext,
+    DataPortContext,
+    PhyNICMTUContext,
 )
 from charmhelpers.contrib.openstack.neutron import (
     parse_bridge_mappings,
 )
+from neutron_interfaces import (
+    interface_inventory,
+    reset_interface_inventory,
+)
+import neutron_netns
+from neutron_packages import dpkg_stamp
+from neutron_templating import (
+    NeutronConfigRenderer,
+    deferred_reloads,
+    file_digest,
+)
+from neutron_services import (
+    batched_service_checks,
+    service_states,
+)
+from neutron_ovs import (
+    OVSDesiredState,
+    apply_ovs_changes,
+    load_ovsdb_snapshot,
+    plan_ovs_changes,
+)
 
 from copy import deepcopy
 
+# Prefix of the hookenv.cache keys used by memoize_derived.
+DERIVED_CACHE_KEY = 'neutron_utils.derived'
+
+
+def _derived_state():
+    '''Inputs the derived maps (restart_map, services, ...) depend on.
+
+    These take several hook tool calls and a NeutronAPIContext to work out
+    and do not change during a hook, so they are worked out once per hook
+    and kept until reset_derived_maps.
+    '''
+    key = DERIVED_CACHE_KEY + '.state'
+    try:
+        return hookenv.cache[key]
+    except KeyError:
+        pass
+    release = os_release('neutron-common')
+    cmp_release = CompareOpenStackReleases(release)
+    no_nova_metadata = disable_nova_metadata(cmp_release)
+    state = hookenv.cache[key] = (
+        release,
+        config('plugin'),
+        lsb_release()['DISTRIB_CODENAME'],
+        disable_neutron_lbaas(cmp_release),
+        no_nova_metadata,
+        # only consulted by resolve_config_files for nova metadata
+        not no_nova_metadata and is_relation_made('amqp-nova'),
+        use_l3ha())
+    return state
+
+
+def memoize_derived(copier=None):
+    '''Memoize a function for the duration of the hook execution.
+
+    Results are keyed on the function arguments and on the release, plugin,
+    configuration and relation state returned by _derived_state.  That
+    state is only worked out once per hook, so anything changing it during
+    a hook, e.g. an upgrade, must call reset_derived_maps to drop it along
+    with all memoized values.
+
+    :param copier: function applied to the memoized value before returning
+                   it, for results callers are allowed to modify.
+    '''
+    def wrap(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            key = str((DERIVED_CACHE_KEY, f.__name__, args,
+                       sorted(kwargs.items()), _derived_state()))
+            try:
+                res = hookenv.cache[key]
+            except KeyError:
+                res = hookenv.cache[key] = f(*args, **kwargs)
+            return copier(res) if copier else res
+        return wrapper
+    return wrap
+
+
+def reset_derived_maps():
+    '''Drop values memoized by memoize_derived and the state they were
+    derived from.'''
+    flush(DERIVED_CACHE_KEY)
+
 
 def valid_plugin():
     return config('plugin') in CORE_PLUGIN
@@ -151,6 +232,16 @@ NEUTRON_METERING_AA_PROFILE_PATH = ('/etc/apparmor.d/{}'
 NOVA_API_METADATA_AA_PROFILE_PATH = ('/etc/apparmor.d/{}'
                                      ''.format(NOVA_API_METADATA_AA_PROFILE))
 
+APPARMOR_DIR = '/etc/apparmor.d'
+# Symlinks to a profile in these subdirectories of APPARMOR_DIR disable it or
+# load it in complain mode.
+APPARMOR_MODE_DIRS = {
+    'disable': 'disable',
+    'complain': 'force-complain',
+}
+# unit kv key of the {profile: [content digest, mode]} last loaded.
+APPARMOR_STATE_KEY = 'neutron_utils.apparmor'
+
 GATEWAY_PKGS = {
     OVS: [
         "neutron-plugin-openvswitch-agent",
@@ -228,6 +319,9 @@ LEGACY_FILES_MAP = {
     'neutron-ha-monitor.conf': {
         'path': '/var/lib/juju-neutron-ha/',
     },
+    'neutron_netns.py': {
+        'path': '/usr/local/bin/',
+    },
     'NeutronAgentMon': {
         'path': '/usr/lib/ocf/resource.d/canonical',
         'permissions': 0o755
@@ -244,6 +338,9 @@ REQUIRED_INTERFACES = {
     'network-service': ['quantum-network-service'],
 }
 
+# unit kv key of the inputs of the last full status assessment.
+STATUS_DIGEST_KEY = 'neutron_utils.status_digest'
+
 
 def get_early_packages():
     '''Return a list of package for pre-install based on configured plugin'''
@@ -258,6 +355,7 @@ def get_early_packages():
     return pkgs
 
 
+@memoize_derived(copier=list)
 def get_packages():
     '''Return a list of packages for install based on the configured plugin'''
     plugin = config('plugin')
@@ -377,6 +475,50 @@ NOVA_CONF_DIR = '/etc/nova'
 NOVA_CONF = "/etc/nova/nova.conf"
 VENDORDATA_FILE = '%s/vendor_data.json' % NOVA_CONF_DIR
 
+# Files whose services are only restarted for option value changes when
+# restart-on-option-change is set. metadata_agent.ini is deliberately left
+# out, its quantum_url comment is there to trigger restarts.
+OPTION_DIFF_FILES = [
+    NEUTRON_CONF,
+    NEUTRON_L3_AGENT_CONF,
+    NEUTRON_DHCP_AGENT_CONF,
+    NEUTRON_OVS_AGENT_CONF,
+    NOVA_CONF,
+]
+
+# Options neutron agents and nova-api-metadata re-read from these files on
+# reload (mutable oslo.config options). dnsmasq.conf is left out: dnsmasq
+# only reads its configuration file when started, and reloading the dhcp
+# agent does not respawn the dnsmasq processes it manages.
+RELOADABLE_OPTIONS = {
+    NEUTRON_CONF: {('DEFAULT', 'debug')},
+    NEUTRON_DHCP_AGENT_CONF: {('DEFAULT', 'debug')},
+    NOVA_CONF: {('DEFAULT', 'debug')},
+}
+
+# Sections of shared config files read by services which do not read all
+# of them, lower-cased. With restart-on-option-change set these services
+# are only restarted for changes to those sections; services not listed are
+# restarted for a change in any section. The metadata agent proxies
+# requests and reports its state over RPC: it takes no external locks and
+# sends no notifications.
+SERVICE_SECTIONS = {
+    NEUTRON_CONF: {
+        'neutron-metadata-agent': {'default', 'agent',
+                                   'oslo_messaging_rabbit'},
+    },
+}
+
+# Relations read by context generators besides the interfaces they declare,
+# e.g. through a NeutronAPIContext evaluated in __call__ or the peer units
+# consulted by eligible_leader.
+CONTEXT_RELATIONS = {
+    L3AgentContext: ['neutron-plugin-api', 'cluster'],
+    PhyNICMTUContext: ['neutron-plugin-api'],
+    DHCPAgentContext: ['neutron-plugin-api'],
+    context.NotificationDriverContext: ['amqp', 'zeromq-configuration'],
+}
+
 __NOVA_CONFIG_FILES = None
 __CONFIG_FILES = None
 
@@ -675,10 +817,14 @@ def remap_service(service_name):
     return service_name
 
 
+@memoize_derived()
 def resolve_config_files(plugin, release):
     '''
     Resolve configuration files and contexts
 
+    The result is shared for the duration of the hook and must not be
+    modified by callers.
+
     :param plugin: shortname of plugin e.g. ovs
     :param release: openstack release codename
     :returns: dict of configuration files, contexts
@@ -749,8 +895,9 @@ def register_configs(release=None):
     release = release or os_release('neutron-common')
     plugin = config('plugin')
     config_files = resolve_config_files(plugin, release)
-    configs = templating.OSConfigRenderer(templates_dir=TEMPLATES,
-                                          openstack_release=release)
+    configs = NeutronConfigRenderer(templates_dir=TEMPLATES,
+                                    openstack_release=release,
+                                    context_relations=CONTEXT_RELATIONS)
     for conf in config_files[plugin]:
         configs.register(conf,
                          config_files[plugin][conf]['hook_contexts'])
@@ -769,6 +916,7 @@ def stop_services():
         service_stop(svc)
 
 
+@memoize_derived(copier=lambda m: {k: list(v) for k, v in m.items()})
 def restart_map(release=None):
     '''
     Determine the correct resource map to be passed to
@@ -808,10 +956,57 @@ def restart_map(release=None):
     return _map
 
 
+def option_diff_paths():
+    '''
+    Config files whose services restart_on_change only restarts when an
+    option value changed, as configured by restart-on-option-change and
+    always-restart-files.
+
+    :returns: list: config file paths
+    '''
+    if not config('restart-on-option-change'):
+        return []
+    always = (config('always-restart-files') or '').split()
+    return [f for f in OPTION_DIFF_FILES if f not in always]
+
+
+def service_sections():
+    '''
+    Sections each service reads of the files it does not read all of, for
+    restart_on_change. Only files restarted on option value changes are
+    included, see option_diff_paths.
+
+    :returns: dict: {service: {config file: set of sections}}
+    '''
+    _map = {}
+    paths = option_diff_paths()
+    for conf, svcs in SERVICE_SECTIONS.items():
+        if conf in paths:
+            for svc, sections in svcs.items():
+                _map.setdefault(svc, {})[conf] = sections
+    return _map
+
+
+def reload_options():
+    '''
+    Options each service picks up on reload rather than restart, for
+    restart_on_change.
+
+    :returns: dict: {service: {config file: set of (section, option)}}
+    '''
+    _map = {}
+    for conf, svcs in restart_map().items():
+        if conf in RELOADABLE_OPTIONS:
+            for svc in svcs:
+                _map.setdefault(svc, {})[conf] = RELOADABLE_OPTIONS[conf]
+    return _map
+
+
 INT_BRIDGE = "br-int"
 EXT_BRIDGE = "br-ex"
 
 
+@memoize_derived(copier=list)
 def services():
     ''' Returns a list of services associate with this charm '''
     _services = []
@@ -867,8 +1062,10 @@ def do_openstack_upgrade(configs):
                 fatal=True, dist=True)
 
     # The cached version of os_release will now be invalid as the pkg version
-    # should have changed during the upgrade.
+    # should have changed during the upgrade, and with it anything derived
+    # from the release.
     reset_os_release()
+    reset_derived_maps()
     apt_install(get_early_packages(), fatal=True)
     apt_install(get_packages(), fatal=True)
 
@@ -881,12 +1078,11 @@ def do_openstack_upgrade(configs):
         service_restart('neutron-metadata-agent')
 
 
-def configure_ovs():
-    """Configure the OVS plugin.
+def get_ovs_desired_state():
+    """Build the OVS bridge and port layout requested by the charm config.
 
-    This function uses the config.yaml parameters ext-port, data-port and
-    bridge-mappings to configure the bridges and ports on the ovs on the
-    unit.
+    This uses the config.yaml parameters ext-port, data-port, bridge-mappings
+    and ipfix-target.
 
     Note that the ext-port is deprecated and data-port/bridge-mappings are
     preferred.
@@ -895,81 +1091,95 @@ def configure_ovs():
     it is removed from the set of bridges unless it is defined in
     bridge-mappings/data-port).  A warning is issued, if both data-port and
     ext-port are set.
+
+    :returns: desired OVS state
+    :rtype: neutron_ovs.OVSDesiredState
     """
-    if config('plugin') in [OVS, OVS_ODL]:
-        if not service_running('openvswitch-switch'):
-            full_restart()
-        # Get existing set of bridges and ports
-        current_bridges_and_ports = get_bridges_and_ports_map()
-        log("configure OVS: Current bridges and ports map: {}"
-            .format(", ".join("{}: {}".format(b, ",".join(v))
-                              for b, v in current_bridges_and_ports.items())))
-
-        add_bridge(INT_BRIDGE, brdata=generate_external_ids())
-        add_bridge(EXT_BRIDGE, brdata=generate_external_ids())
-
-        ext_port_ctx = ExternalPortContext()()
-        portmaps = DataPortContext()()
-        bridgemaps = parse_bridge_mappings(config('bridge-mappings'))
-
-        # if we have portmaps, then we ignore its value and log an
-        # error/warning to the unit's log.
-        if config('data-port') and config('ext-port'):
-            log("Both ext-port and data-port are set.  ext-port is deprecated"
-                " and is not used when data-port is set", level=ERROR)
-
-        # only use ext-port if data-port is not set
-        if not portmaps and ext_port_ctx and ext_port_ctx['ext_port']:
-            _port = ext_port_ctx['ext_port']
-            add_bridge_port(EXT_BRIDGE, _port,
-                            ifdata=generate_external_ids(EXT_BRIDGE),
-                            portdata=generate_external_ids(EXT_BRIDGE))
-            log("DEPRECATION: using ext-port to set the port {} on the "
-                "EXT_BRIDGE ({}) is deprecated.  Please use data-port instead."
-                .format(_port, EXT_BRIDGE),
-                level=WARNING)
-
-        for br in bridgemaps.values():
-            add_bridge(br, brdata=generate_external_ids())
-            if not portmaps:
-                continue
-
-            for port, _br in portmaps.items():
-                if _br == br:
-                    if not is_linuxbridge_interface(port):
-                        add_bridge_port(br, port, promisc=True,
-                                        ifdata=generate_external_ids(br),
-                                        portdata=generate_external_ids(br))
-                    else:
-                        # NOTE(lourot): this will raise on focal+ and/or if the
-                        # system has no `ifup`. See lp:1877594
-                        add_ovsbridge_linuxbridge(
-                            br, port, ifdata=generate_external_ids(br),
-                            portdata=generate_external_ids(br))
-
-        target = config('ipfix-target')
-        bridges = [INT_BRIDGE, EXT_BRIDGE]
-        bridges.extend(bridgemaps.values())
-
-        if target:
-            for bridge in bridges:
-                disable_ipfix(bridge)
-                enable_ipfix(bridge, target)
-        else:
-            # NOTE: removing ipfix setting from a bridge is idempotent and
-            #       will pass regardless of the existence of the setting
-            for bridge in bridges:
-                disable_ipfix(bridge)
-
-        new_bridges_and_ports = get_bridges_and_ports_map()
-        log("configure OVS: Final bridges and ports map: {}"
-            .format(", ".join("{}: {}".format(b, ",".join(v))
-                              for b, v in new_bridges_and_ports.items())),
-            level=DEBUG)
-
-        # Ensure this runs so that mtu is applied to data-port interfaces if
-        # provided.
+    desired = OVSDesiredState(ipfix_target=config('ipfix-target'))
+    managed = generate_external_ids()['external-ids']
+    desired.add_bridge(INT_BRIDGE, managed)
+    desired.add_bridge(EXT_BRIDGE, managed)
+
+    ext_port_ctx = ExternalPortContext()()
+    portmaps = DataPortContext()()
+    bridgemaps = parse_bridge_mappings(config('bridge-mappings'))
+
+    # if we have portmaps, then we ignore its value and log an
+    # error/warning to the unit's log.
+    if config('data-port') and config('ext-port'):
+        log("Both ext-port and data-port are set.  ext-port is deprecated"
+            " and is not used when data-port is set", level=ERROR)
+
+    # only use ext-port if data-port is not set
+    if not portmaps and ext_port_ctx and ext_port_ctx['ext_port']:
+        _port = ext_port_ctx['ext_port']
+        desired.add_port(
+            EXT_BRIDGE, _port,
+            external_ids=generate_external_ids(EXT_BRIDGE)['external-ids'],
+            promisc=False)
+        log("DEPRECATION: using ext-port to set the port {} on the "
+            "EXT_BRIDGE ({}) is deprecated.  Please use data-port instead."
+            .format(_port, EXT_BRIDGE),
+            level=WARNING)
+
+    inventory = interface_inventory()
+    for br in bridgemaps.values():
+        desired.add_bridge(br, managed)
+        if not portmaps:
+            continue
+
+        for port, _br in portmaps.items():
+            if _br == br:
+                desired.add_port(
+                    br, port,
+                    external_ids=generate_external_ids(br)['external-ids'],
+                    promisc=True,
+                    linuxbridge=inventory.is_linux_bridge(port),
+                    data_port=True)
+    return desired
+
+
+def configure_ovs(dry_run=False):
+    """Configure the OVS plugin.
+
+    The desired bridges and ports (see get_ovs_desired_state) are compared
+    with a single snapshot of the local OVSDB and only the differences are
+    applied, in one ovs-vsctl transaction.
+
+    :param dry_run: only compute and log the changes, do not apply them.
+    :type dry_run: bool
+    :returns: the computed changes or None if OVS is not in use.
+    :rtype: Optional[neutron_ovs.OVSChangePlan]
+    """
+    if config('plugin') not in [OVS, OVS_ODL]:
+        return None
+
+    if not dry_run and not service_running('openvswitch-switch'):
+        full_restart()
+    snapshot = load_ovsdb_snapshot()
+    log("configure OVS: Current bridges and ports map: {}"
+        .format(", ".join("{}: {}".format(b, ",".join(v))
+                          for b, v in snapshot.bridges_and_ports_map()
+                          .items())))
+
+    plan = plan_ovs_changes(get_ovs_desired_state(), snapshot,
+                            interface_inventory())
+    log("configure OVS: {}planned changes: {}"
+        .format('dry-run ' if dry_run else '',
+                "; ".join(plan.describe()) or 'none'),
+        level=INFO if plan else DEBUG)
+    if dry_run:
+        return plan
+
+    apply_ovs_changes(plan)
+    if plan:
+        reset_interface_inventory()
+
+    # Ensure this runs so that mtu is applied to data-port interfaces if
+    # provided.
+    if plan.data_ports_changed:
         service_restart('os-charm-phy-nic-mtu')
+    return plan
 
 
 def copy_file(src, dst, perms=None, force=False):
@@ -1117,9 +1327,14 @@ def stop_neutron_ha_monitor_daemon():
 def cleanup_ovs_netns():
     try:
         subprocess.call('neutron-ovs-cleanup')
-        subprocess.call('neutron-netns-cleanup')
     except subprocess.CalledProcessError as e:
         log('Faild to cleanup ovs and netns, %s' % e, level=ERROR)
+    remaining = neutron_netns.teardown_namespaces(
+        neutron_netns.list_namespaces(),
+        log=lambda msg: log(msg, level=ERROR))
+    if remaining:
+        log('Unable to remove namespaces: %s' % ', '.join(remaining),
+            level=ERROR)
 
 
 def get_optional_interfaces():
@@ -1183,19 +1398,88 @@ def assess_status(configs):
     """
     assess_status_func(configs)()
     os_application_version_set(VERSION_PACKAGE)
+    save_status_digest()
+
+
+def _status_inputs(services, interfaces):
+    """Volatile state the workload status depends on.
+
+    :param services: services expected to be running
+    :type services: list
+    :param interfaces: relation names the status depends on
+    :type interfaces: list
+    :returns: JSON serialisable dict
+    :rtype: dict
+    """
+    return {
+        'paused': is_unit_paused_set(),
+        'running': {s: [state.active_state, state.active_enter]
+                    for s, state in service_states(services).items()},
+        'relations': {i: sorted(relation_ids(i)) for i in interfaces},
+        'deferred': sorted([e.service, e.action] for e in
+                           deferred_events.get_deferred_events()),
+        'dpkg': dpkg_stamp(),
+    }
+
+
+def save_status_digest():
+    """Record the inputs of the workload status just set by assess_status.
+
+    status_unchanged() compares them against the current state so that
+    update-status can skip the full assessment.
+    """
+    if not init_is_systemd():
+        return
+    interfaces = set(['ha'])
+    for names in REQUIRED_INTERFACES.values():
+        interfaces.update(names)
+    active_services = [s for s in services() if s not in STOPPED_SERVICES]
+    digest = {
+        'services': active_services,
+        'interfaces': sorted(interfaces),
+        'release': os_release('neutron-common'),
+        'inputs': _status_inputs(active_services, sorted(interfaces)),
+    }
+    db = unitdata.kv()
+    db.set(STATUS_DIGEST_KEY, digest)
+    db.flush()
+
+
+def status_unchanged():
+    """Whether the workload status set by the last full assessment holds.
+
+    Only the state which changes without a hook being run is checked:
+    service state and start time, relation presence, pause and deferred
+    restarts and installed packages.  Configuration and relation data
+    changes run hooks which assess status in full and refresh the digest.
+
+    :returns: True if assess_status would set the same status
+    :rtype: bool
+    """
+    if not init_is_systemd():
+        return False
+    digest = unitdata.kv().get(STATUS_DIGEST_KEY)
+    if not digest:
+        return False
+    inputs = _status_inputs(digest['services'], digest['interfaces'])
+    if inputs != digest['inputs']:
+        log('Status inputs changed since the last assessment', level=DEBUG)
+        return False
+    return True
 
 
 def assess_status_func(configs):
     """Helper function to create the function that will assess_status() for
     the unit.
-    Uses charmhelpers.contrib.openstack.utils.make_assess_status_func() to
-    create the appropriate status function and then returns it.
+    Works like charmhelpers.contrib.openstack.utils.make_assess_status_func()
+    and also lists services with a deferred reload in the status message,
+    next to those with a deferred restart.
     Used directly by assess_status() and also for pausing and resuming
     the unit.
 
     NOTE: REQUIRED_INTERFACES is augmented with the optional interfaces
     depending on the current config before being passed to the
-    make_assess_status_func() function.
+    _determine_os_workload_status() function.
 
     NOTE(ajkavanagh) ports are not checked due to race hazards with services
     that don't behave sychronously w.r.t their service scripts.  e.g.
@@ -1208,10 +1492,23 @@ def assess_status_func(configs):
     active_services = [s for s in services() if s not in STOPPED_SERVICES]
     charm_func = sequence_status_check_functions(
         check_optional_relations, check_ext_port_data_port_config)
-    return make_assess_status_func(
-        configs, required_interfaces,
-        charm_func=charm_func,
-        services=active_services, ports=None)
+
+    def _assess_status():
+        # One systemctl call for all services rather than one per service.
+        with batched_service_checks(active_services):
+            state, message = _determine_os_workload_status(
+                configs, required_interfaces,
+                charm_func=charm_func,
+                services=active_services, ports=None)
+        reloads = deferred_reloads()
+        if reloads:
+            message = "{}. Services queued for reload: {}".format(
+                message, ', '.join(reloads))
+        status_set(state, message)
+        if state not in ['maintenance', 'active']:
+            return message
+        return None
+    return _assess_status
 
 
 def pause_unit_helper(configs):
@@ -1235,9 +1532,9 @@ def resume_unit_helper(configs):
 
 
 def _pause_resume_helper(f, configs):
-    """Helper function that uses the make_assess_status_func(...) from
-    charmhelpers.contrib.openstack.utils to create an assess_status(...)
-    function that can be used with the pause/resume of the unit
+    """Helper function that uses assess_status_func(...) to create an
+    assess_status(...) function that can be used with the pause/resume of
+    the unit
     @param f: the function to be used with the assess_status(...) function
     @returns None - this function is executed for its side-effect
     """
@@ -1249,8 +1546,33 @@ def _pause_resume_helper(f, configs):
       ports=None)
 
 
+def _set_aa_mode_links(profile, mode):
+    '''Point the disable and force-complain symlinks of profile at mode.
+
+    The profiles are loaded at boot in the mode the symlinks select, as
+    set up by aa-disable, aa-complain and aa-enforce.
+    '''
+    for link_mode, subdir in APPARMOR_MODE_DIRS.items():
+        link = os.path.join(APPARMOR_DIR, subdir, profile)
+        if link_mode == mode:
+            if not os.path.lexists(link):
+                os.makedirs(os.path.dirname(link), exist_ok=True)
+                os.symlink(os.path.join(APPARMOR_DIR, profile), link)
+        elif os.path.lexists(link):
+            os.remove(link)
+
+
+def _apparmor_parser(args, profiles):
+    subprocess.check_call(['apparmor_parser'] + args +
+                          [os.path.join(APPARMOR_DIR, p) for p in profiles])
+
+
 def configure_apparmor():
-    '''Configure all apparmor profiles for the local unit'''
+    '''Configure all apparmor profiles for the local unit
+
+    Only profiles whose rendered content or mode changed since they were
+    last set up are loaded, with one apparmor_parser call per mode.
+    '''
     profiles = deepcopy(APPARMOR_PROFILES)
     cmp_os_source = CompareOpenStackReleases(os_release('neutron-common'))
     if cmp_os_source >= 'newton':
@@ -1258,8 +1580,43 @@ def configure_apparmor():
         profiles.append(NEUTRON_LBAASV2_AA_PROFILE)
     if cmp_os_source >= 'train':
         profiles.remove(NEUTRON_LBAASV2_AA_PROFILE)
+    db = unitdata.kv()
+    applied = db.get(APPARMOR_STATE_KEY, {})
+    changed = collections.defaultdict(list)
     for profile in profiles:
-        context.AppArmorContext(profile).setup_aa_profile()
+        ctxt = context.AppArmorContext(profile)()
+        if not ctxt:
+            log("Not enabling apparmor Profile")
+            continue
+        mode = ctxt['aa_profile_mode']
+        state = [file_digest(os.path.join(APPARMOR_DIR, profile)), mode]
+        if applied.get(profile) != state:
+            changed[mode].append((profile, state))
+    for mode, entries in sorted(changed.items()):
+        names = [profile for profile, _ in entries]
+        log("Setting up the apparmor profiles for {} in {} mode."
+            "".format(', '.join(names), mode))
+        for profile in names:
+            _set_aa_mode_links(profile, mode)
+        try:
+            if mode == 'disable':
+                _apparmor_parser(['--remove'], names)
+            else:
+                args = ['--replace', '--write-cache']
+                if mode == 'complain':
+                    args.append('--complain')
+                _apparmor_parser(args, names)
+        except subprocess.CalledProcessError:
+            # Profiles which were never loaded cannot be removed, the
+            # disable symlink keeps them from being loaded.
+            if mode != 'disable':
+                status_set('blocked',
+                           "Apparmor profile(s) {} failed to be set to {}."
+                           "".format(', '.join(names), mode))
+                raise
+        applied.update(entries)
+        db.set(APPARMOR_STATE_KEY, applied)
+        db.flush()
 
 
 def deprecated_services():
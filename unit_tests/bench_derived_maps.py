@@ -0,0 +1,95 @@
+"""Count deep copies, use_l3ha calls and hook tool calls made by the
+derived maps.
+
+Replays the restart_map/services/get_packages calls made during a typical
+config-changed hook, once with memoization defeated and once with it
+enabled, against canned hook tool output:
+
+    python3 unit_tests/bench_derived_maps.py
+"""
+import collections
+import json
+import os
+import sys
+import tempfile
+import time
+
+from unittest import mock
+
+_here = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(1, os.path.join(_here, '..', 'hooks'))
+sys.modules.setdefault('apt', mock.MagicMock())
+sys.modules.setdefault('apt_pkg', mock.MagicMock())
+
+import charmhelpers.core.hookenv as hookenv  # noqa: E402
+import neutron_utils  # noqa: E402
+
+HOOK_TOOL_OUTPUT = {
+    'config-get': {'plugin': 'ovs', 'disable-neutron-lbaas': False,
+                   'openstack-origin': 'distro'},
+    'relation-ids': ['neutron-plugin-api:1'],
+    'relation-list': ['neutron-api/0'],
+    'relation-get': {'enable-l3ha': 'False',
+                     'shared-metadata-secret': 'secret'},
+}
+
+
+def _hook():
+    '''Derived map calls made by one config-changed hook execution.'''
+    neutron_utils.restart_map()           # restart_on_change, before
+    neutron_utils.deferrable_services()   # configure_deferred_restarts
+    neutron_utils.get_packages()          # install packages
+    neutron_utils.services()              # update_nrpe_config
+    neutron_utils.restart_map()           # restart_on_change, after
+    neutron_utils.services()              # assess_status
+    neutron_utils.services()              # assess_status_func
+
+
+def run(memoize):
+    tools = collections.Counter()
+
+    def check_output(cmd, *args, **kwargs):
+        tools[cmd[0]] += 1
+        return json.dumps(HOOK_TOOL_OUTPUT.get(cmd[0])).encode('UTF-8')
+
+    hookenv.cache.clear()
+    with mock.patch.object(hookenv.subprocess, 'check_output',
+                           side_effect=check_output), \
+            mock.patch.object(hookenv.subprocess, 'call'), \
+            mock.patch.object(neutron_utils, 'os_release',
+                              return_value='ussuri'), \
+            mock.patch.object(neutron_utils, 'lsb_release',
+                              return_value={'DISTRIB_CODENAME': 'focal'}), \
+            mock.patch.object(neutron_utils, 'use_l3ha',
+                              wraps=neutron_utils.use_l3ha) as use_l3ha, \
+            mock.patch.object(neutron_utils, 'deepcopy',
+                              wraps=neutron_utils.deepcopy) as deepcopy:
+        derived_state = neutron_utils._derived_state
+
+        def unmemoized():
+            # everything is worked out again on every call
+            neutron_utils.reset_derived_maps()
+            return derived_state()
+
+        state = None if memoize else unmemoized
+        with mock.patch.object(neutron_utils, '_derived_state',
+                               side_effect=state,
+                               wraps=derived_state):
+            start = time.time()
+            _hook()
+            elapsed = time.time() - start
+    return (deepcopy.call_count, use_l3ha.call_count, sum(tools.values()),
+            elapsed)
+
+
+def main():
+    os.environ.setdefault('CHARM_DIR', tempfile.mkdtemp())
+    for label, memoize in (('before', False), ('after', True)):
+        copies, l3ha, tools, elapsed = run(memoize)
+        print('{:6}: {:3} deep copies, {:3} use_l3ha calls, '
+              '{:3} hook tool calls, {:.1f}ms'
+              .format(label, copies, l3ha, tools, elapsed * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Time set/get/flush cycles against the unit state database.
+
+Runs the same cycles against charmhelpers' unitdata.Storage and
+neutron_kv.Storage, each on a fresh database file:
+
+    python3 unit_tests/bench_unitdata.py [cycles]
+
+Each cycle sets a key, sets it again to the same value, reads it back and
+flushes, as done by the charm's restart nonces and caches.  A bulk update of
+100 keys per cycle is timed as well.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+_here = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(1, os.path.join(_here, '..', 'hooks'))
+
+import charmhelpers.core.unitdata as unitdata  # noqa: E402
+import neutron_kv  # noqa: E402
+
+CYCLES = 10000
+KEYS = 100
+
+
+def set_get_flush(kv, cycles):
+    for i in range(cycles):
+        key = 'bench.{}'.format(i % KEYS)
+        kv.set(key, {'nonce': i})
+        kv.set(key, {'nonce': i})
+        kv.get(key)
+        kv.flush()
+
+
+def bulk_update(kv, cycles):
+    for i in range(cycles // KEYS):
+        kv.update({str(k): {'nonce': i} for k in range(KEYS)},
+                  prefix='bench.')
+        kv.flush()
+
+
+def run(storage, bench, cycles):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        kv = storage(os.path.join(tmpdir, '.unit-state.db'))
+        start = time.time()
+        bench(kv, cycles)
+        elapsed = time.time() - start
+        kv.close()
+    finally:
+        shutil.rmtree(tmpdir)
+    return elapsed
+
+
+def main():
+    cycles = int(sys.argv[1]) if len(sys.argv) > 1 else CYCLES
+    for bench in (set_get_flush, bulk_update):
+        for label, storage in (('unitdata', unitdata.Storage),
+                               ('neutron_kv', neutron_kv.Storage)):
+            elapsed = run(storage, bench, cycles)
+            print('{:14} {:11}: {:8.1f}ms, {:6.1f}us per cycle'.format(
+                bench.__name__, label, elapsed * 1000,
+                elapsed * 1e6 / cycles))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,451 @@
+"""In-process fake OVSDB server.
+
+Implements enough of RFC 7047 (get_schema, list_dbs, echo, transact with
+select/insert/update/mutate/delete, monitor and monitor_cancel) over a
+unix socket to exercise neutron_ovsdb without Open vSwitch installed.
+
+Running the module directly prints a small benchmark of the native
+backend against the fake server:
+
+    python3 unit_tests/fake_ovsdb.py [iterations]
+"""
+import copy
+import json
+import os
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+_SET = {'min': 0, 'max': 'unlimited'}
+
+
+def _set_of(key):
+    return dict(_SET, key=key)
+
+
+def _map_of(key, value):
+    return dict(_SET, key=key, value=value)
+
+
+def _ref(table):
+    return {'type': 'uuid', 'refTable': table}
+
+
+SCHEMA = {
+    'name': 'Open_vSwitch',
+    'version': '8.3.0',
+    'tables': {
+        'Open_vSwitch': {'columns': {
+            'bridges': {'type': _set_of(_ref('Bridge'))},
+            'external_ids': {'type': _map_of('string', 'string')},
+        }},
+        'Bridge': {'columns': {
+            'name': {'type': 'string'},
+            'ports': {'type': _set_of(_ref('Port'))},
+            'controller': {'type': _set_of(_ref('Controller'))},
+            'fail_mode': {'type': dict(key='string', min=0, max=1)},
+            'ipfix': {'type': dict(key=_ref('IPFIX'), min=0, max=1)},
+            'external_ids': {'type': _map_of('string', 'string')},
+        }},
+        'Port': {'columns': {
+            'name': {'type': 'string'},
+            'interfaces': {'type': _set_of(_ref('Interface'))},
+            'tag': {'type': dict(key='integer', min=0, max=1)},
+            'external_ids': {'type': _map_of('string', 'string')},
+        }},
+        'Interface': {'columns': {
+            'name': {'type': 'string'},
+            'type': {'type': 'string'},
+            'ofport': {'type': dict(key='integer', min=0, max=1)},
+            'options': {'type': _map_of('string', 'string')},
+            'external_ids': {'type': _map_of('string', 'string')},
+        }},
+        'Controller': {'columns': {
+            'target': {'type': 'string'},
+        }},
+        'IPFIX': {'columns': {
+            'targets': {'type': _set_of('string')},
+            'sampling': {'type': dict(key='integer', min=0, max=1)},
+        }},
+    },
+}
+
+
+class OVSDBFault(Exception):
+
+    def __init__(self, error, details=''):
+        super(OVSDBFault, self).__init__(error)
+        self.error = error
+        self.details = details
+
+
+class FakeOVSDB(object):
+    """Database contents and RFC 7047 operation semantics."""
+
+    def __init__(self, schema=SCHEMA):
+        self.schema = schema
+        self.tables = {t: {} for t in schema['tables']}
+        self.lock = threading.RLock()
+
+    def _ctype(self, table, column):
+        ctype = self.schema['tables'][table]['columns'][column]['type']
+        if not isinstance(ctype, dict):
+            ctype = {'key': ctype}
+        kind = 'atom'
+        if 'value' in ctype:
+            kind = 'map'
+        elif ctype.get('min', 1) != 1 or ctype.get('max', 1) != 1:
+            kind = 'set'
+        return kind
+
+    def _default(self, table, column):
+        kind = self._ctype(table, column)
+        if kind != 'atom':
+            return []
+        ctype = self.schema['tables'][table]['columns'][column]['type']
+        return {'integer': 0, 'real': 0.0, 'boolean': False}.get(ctype, '')
+
+    def _from_json(self, table, column, value, named=None):
+        """Convert wire notation to the internal representation."""
+        if named:
+            value = self._resolve_named(value, named)
+        if column == '_uuid':
+            return value
+        kind = self._ctype(table, column)
+        if kind == 'map':
+            return [list(pair) for pair in value[1]]
+        if kind == 'set':
+            if isinstance(value, list) and value and value[0] == 'set':
+                return list(value[1])
+            return [value]
+        return value
+
+    def _to_json(self, table, column, value):
+        if column in ('_uuid', '_version'):
+            return value
+        kind = self._ctype(table, column)
+        if kind == 'map':
+            return ['map', value]
+        if kind == 'set':
+            # Like ovsdb-server, single element sets are sent bare.
+            if len(value) == 1:
+                return value[0]
+            return ['set', value]
+        return value
+
+    def _resolve_named(self, value, named):
+        if isinstance(value, list):
+            if len(value) == 2 and value[0] == 'named-uuid':
+                return ['uuid', named[value[1]]]
+            return [self._resolve_named(v, named) for v in value]
+        return value
+
+    def _matches(self, table, row, where, named):
+        for column, func, value in where:
+            current = row[column]
+            wanted = self._from_json(table, column, value, named)
+            if column == '_uuid' or self._ctype(table, column) == 'atom':
+                current, wanted = [current], [wanted]
+            if func == '==':
+                ok = sorted(map(json.dumps, current)) == \
+                    sorted(map(json.dumps, wanted))
+            elif func == '!=':
+                ok = sorted(map(json.dumps, current)) != \
+                    sorted(map(json.dumps, wanted))
+            elif func == 'includes':
+                ok = all(w in current for w in wanted)
+            elif func == 'excludes':
+                ok = not any(w in current for w in wanted)
+            else:
+                raise OVSDBFault('unsupported function', func)
+            if not ok:
+                return False
+        return True
+
+    def _rows(self, table, where, named):
+        if table not in self.tables:
+            raise OVSDBFault('unknown table', table)
+        return [row for row in self.tables[table].values()
+                if self._matches(table, row, where or [], named)]
+
+    def _row_json(self, table, row, columns=None):
+        return {k: self._to_json(table, k, v) for k, v in row.items()
+                if not columns or k in columns}
+
+    def _mutate(self, table, row, mutations, named):
+        for column, mutator, value in mutations:
+            kind = self._ctype(table, column)
+            if mutator in ('+=', '-='):
+                sign = 1 if mutator == '+=' else -1
+                row[column] += sign * value
+                continue
+            if kind == 'map' and mutator == 'delete' and value[0] == 'set':
+                keys = value[1]
+                row[column] = [p for p in row[column] if p[0] not in keys]
+                continue
+            arg = self._from_json(table, column, value, named)
+            if mutator == 'insert':
+                for item in arg:
+                    present = ([p[0] for p in row[column]]
+                               if kind == 'map' else row[column])
+                    key = item[0] if kind == 'map' else item
+                    if key not in present:
+                        row[column].append(item)
+            elif mutator == 'delete':
+                row[column] = [v for v in row[column] if v not in arg]
+            else:
+                raise OVSDBFault('unsupported mutator', mutator)
+
+    def transact(self, database, operations):
+        """Run operations, returning (results, {table: {uuid: (old, new)}})."""
+        if database != self.schema['name']:
+            return [{'error': 'unknown database', 'details': database}], {}
+        with self.lock:
+            backup = copy.deepcopy(self.tables)
+            named = {}
+            changes = {}
+            results = []
+
+            def record(table, row_uuid, old, new):
+                prev = changes.setdefault(table, {}).get(row_uuid)
+                changes[table][row_uuid] = (prev[0] if prev else old, new)
+
+            try:
+                for op in operations:
+                    table = op.get('table')
+                    kind = op['op']
+                    if kind == 'select':
+                        results.append({'rows': [
+                            self._row_json(table, row, op.get('columns'))
+                            for row in self._rows(table, op['where'],
+                                                  named)]})
+                    elif kind == 'insert':
+                        row_uuid = str(uuid.uuid4())
+                        if 'uuid-name' in op:
+                            named[op['uuid-name']] = row_uuid
+                        row = {c: self._default(table, c)
+                               for c in self.schema['tables'][table][
+                                   'columns']}
+                        for column, value in op.get('row', {}).items():
+                            row[column] = self._from_json(
+                                table, column, value, named)
+                        row['_uuid'] = ['uuid', row_uuid]
+                        row['_version'] = ['uuid', str(uuid.uuid4())]
+                        self.tables[table][row_uuid] = row
+                        record(table, row_uuid, None, row)
+                        results.append({'uuid': ['uuid', row_uuid]})
+                    elif kind in ('update', 'mutate'):
+                        rows = self._rows(table, op['where'], named)
+                        for row in rows:
+                            old = copy.deepcopy(row)
+                            if kind == 'update':
+                                for column, value in op['row'].items():
+                                    row[column] = self._from_json(
+                                        table, column, value, named)
+                            else:
+                                self._mutate(table, row, op['mutations'],
+                                             named)
+                            row['_version'] = ['uuid', str(uuid.uuid4())]
+                            record(table, row['_uuid'][1], old, row)
+                        results.append({'count': len(rows)})
+                    elif kind == 'delete':
+                        rows = self._rows(table, op['where'], named)
+                        for row in rows:
+                            del self.tables[table][row['_uuid'][1]]
+                            record(table, row['_uuid'][1], row, None)
+                        results.append({'count': len(rows)})
+                    elif kind == 'comment':
+                        results.append({})
+                    else:
+                        raise OVSDBFault('unknown operation', kind)
+            except OVSDBFault as e:
+                self.tables = backup
+                results.append({'error': e.error, 'details': e.details})
+                return results, {}
+            except (KeyError, IndexError, TypeError) as e:
+                self.tables = backup
+                results.append({'error': 'syntax error', 'details': str(e)})
+                return results, {}
+        return results, changes
+
+    def table_updates(self, requests, changes=None):
+        """Build RFC 7047 table-updates for the monitored columns."""
+        updates = {}
+        for table, request in requests.items():
+            columns = request.get('columns')
+            if changes is None:
+                items = [(u, None, r) for u, r in self.tables[table].items()]
+            else:
+                items = [(u, o, n) for u, (o, n)
+                         in changes.get(table, {}).items()]
+            for row_uuid, old, new in items:
+                update = {}
+                if old is not None:
+                    update['old'] = self._row_json(table, old, columns)
+                if new is not None:
+                    update['new'] = self._row_json(table, new, columns)
+                updates.setdefault(table, {})[row_uuid] = update
+        return updates
+
+
+class _Handler(socketserver.BaseRequestHandler):
+
+    def setup(self):
+        self.monitors = {}
+        self.wlock = threading.Lock()
+        self.server.handlers.append(self)
+        self.server.connections += 1
+
+    def finish(self):
+        self.server.handlers.remove(self)
+
+    def send(self, msg):
+        with self.wlock:
+            self.request.sendall(json.dumps(msg).encode('UTF-8'))
+
+    def handle(self):
+        decoder = json.JSONDecoder()
+        buf = ''
+        while True:
+            data = self.request.recv(65536)
+            if not data:
+                return
+            buf += data.decode('UTF-8')
+            while True:
+                buf = buf.lstrip()
+                try:
+                    msg, end = decoder.raw_decode(buf)
+                except ValueError:
+                    break
+                buf = buf[end:]
+                if 'method' in msg and msg.get('id') is not None:
+                    self.server.requests += 1
+                    self.dispatch(msg)
+
+    def dispatch(self, msg):
+        db = self.server.db
+        method, params = msg['method'], msg['params']
+        result, error, changes = None, None, None
+        if method == 'echo':
+            result = params
+        elif method == 'list_dbs':
+            result = [db.schema['name']]
+        elif method == 'get_schema':
+            if params[0] == db.schema['name']:
+                result = db.schema
+            else:
+                error = 'unknown database'
+        elif method == 'transact':
+            result, changes = db.transact(params[0], params[1:])
+        elif method == 'monitor':
+            self.monitors[json.dumps(params[1])] = params[2]
+            with db.lock:
+                result = db.table_updates(params[2])
+        elif method == 'monitor_cancel':
+            self.monitors.pop(json.dumps(params[0]), None)
+            result = {}
+        else:
+            error = 'unknown method'
+        if changes:
+            # Notify monitors before replying so that clients observe the
+            # update by the time the transaction completes.
+            self.server.notify(changes)
+        self.send({'id': msg['id'], 'result': result, 'error': error})
+
+
+class FakeOVSDBServer(socketserver.ThreadingMixIn,
+                      socketserver.UnixStreamServer):
+    """Fake OVSDB server listening on a unix socket in a thread.
+
+    ``requests`` and ``connections`` count the JSON-RPC requests and the
+    client connections handled so far.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path=None, schema=SCHEMA):
+        if path is None:
+            self._tmpdir = tempfile.mkdtemp()
+            path = os.path.join(self._tmpdir, 'db.sock')
+        else:
+            self._tmpdir = None
+        self.path = path
+        self.db = FakeOVSDB(schema)
+        self.handlers = []
+        self.requests = 0
+        self.connections = 0
+        socketserver.UnixStreamServer.__init__(self, path, _Handler)
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever,
+                                        kwargs={'poll_interval': 0.05})
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
+        for handler in list(self.handlers):
+            handler.request.close()
+        os.unlink(self.path)
+        if self._tmpdir:
+            os.rmdir(self._tmpdir)
+
+    def notify(self, changes):
+        for handler in list(self.handlers):
+            for monitor_id, requests in handler.monitors.items():
+                updates = self.db.table_updates(requests, changes)
+                if not updates:
+                    continue
+                try:
+                    handler.send({'id': None, 'method': 'update',
+                                  'params': [json.loads(monitor_id),
+                                             updates]})
+                except OSError:
+                    pass
+
+    def insert(self, table, **row):
+        """Insert a row directly, returning its uuid as a string."""
+        results, changes = self.db.transact(
+            self.db.schema['name'],
+            [{'op': 'insert', 'table': table, 'row': row}])
+        if 'error' in results[-1]:
+            raise OVSDBFault(results[-1]['error'], results[-1]['details'])
+        self.notify(changes)
+        return results[0]['uuid'][1]
+
+
+def benchmark(iterations=1000):
+    """Time lookups through NativeOVSDB against the fake server."""
+    import neutron_ovsdb
+
+    server = FakeOVSDBServer().start()
+    try:
+        ports = [server.insert('Port', name='port{}'.format(i))
+                 for i in range(20)]
+        server.insert('Bridge', name='br-int',
+                      ports=['set', [['uuid', p] for p in ports]])
+        ovsdb = neutron_ovsdb.NativeOVSDB('ovs-vsctl', path=server.path)
+        start = time.time()
+        for i in range(iterations):
+            list(ovsdb.port.find('name=port{}'.format(i % 20)))
+        elapsed = time.time() - start
+        ovsdb.close()
+    finally:
+        server.stop()
+    print('{} finds in {:.3f}s ({:.1f}us per find), {} connection(s), '
+          '{} requests'.format(iterations, elapsed,
+                               elapsed / iterations * 1e6,
+                               server.connections, server.requests))
+
+
+if __name__ == '__main__':
+    _here = os.path.dirname(os.path.realpath(__file__))
+    sys.path.insert(1, os.path.join(_here, '..', 'hooks'))
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -1,7 +1,10 @@
+import subprocess
 import sys
 from unittest import mock
 from unittest.mock import MagicMock
 
+import yaml
+
 from test_utils import CharmTestCase
 
 # python-apt is not installed as part of test-requirements but is imported by
@@ -46,6 +49,98 @@ class ResumeTestCase(CharmTestCase):
         self.resume_unit_helper.assert_called_once_with('test-config')
 
 
+class ShowOVSChangesTestCase(CharmTestCase):
+
+    def setUp(self):
+        super(ShowOVSChangesTestCase, self).setUp(
+            actions, ["configure_ovs", "function_set", "action_fail"])
+
+    def test_show_ovs_changes(self):
+        plan = self.configure_ovs.return_value
+        plan.describe.return_value = ['--may-exist add-br br-ex',
+                                      'ip link set eth0 up']
+        actions.show_ovs_changes([])
+        self.configure_ovs.assert_called_once_with(dry_run=True)
+        self.function_set.assert_called_once_with(
+            {'changes': '--may-exist add-br br-ex\nip link set eth0 up'})
+
+    def test_show_ovs_changes_none(self):
+        self.configure_ovs.return_value.describe.return_value = []
+        actions.show_ovs_changes([])
+        self.function_set.assert_called_once_with({'changes': 'none'})
+
+    def test_show_ovs_changes_ovs_down(self):
+        self.configure_ovs.side_effect = subprocess.CalledProcessError(
+            1, 'ovs-vsctl')
+        actions.show_ovs_changes([])
+        self.assertTrue(self.action_fail.called)
+        self.assertFalse(self.function_set.called)
+
+    def test_show_ovs_changes_not_ovs(self):
+        self.configure_ovs.return_value = None
+        actions.show_ovs_changes([])
+        self.assertTrue(self.action_fail.called)
+        self.assertFalse(self.function_set.called)
+
+
+class RestartTestCase(CharmTestCase):
+
+    def setUp(self):
+        super(RestartTestCase, self).setUp(
+            actions, ["action_get", "action_fail", "assess_status",
+                      "register_configs", "process_deferred_reloads",
+                      "check_restart_timestamps", "os_utils"])
+        self.params = {'deferred-only': True, 'services': '',
+                       'run-hooks': False}
+        self.action_get.side_effect = self.params.get
+
+    def test_restart_deferred_only(self):
+        actions.restart([])
+        self.check_restart_timestamps.assert_called_once_with()
+        self.process_deferred_reloads.assert_called_once_with()
+        self.os_utils.restart_services_action.assert_called_once_with(
+            deferred_only=True)
+
+    def test_restart_services(self):
+        self.params.update({'deferred-only': False, 'services': 'svc-a'})
+        actions.restart([])
+        self.assertFalse(self.check_restart_timestamps.called)
+        self.assertFalse(self.process_deferred_reloads.called)
+        self.os_utils.restart_services_action.assert_called_once_with(
+            services=['svc-a'])
+
+
+class ShowHookStatsTestCase(CharmTestCase):
+
+    def setUp(self):
+        super(ShowHookStatsTestCase, self).setUp(
+            actions, ["function_set", "action_get"])
+        self.patch_object(actions.neutron_trace, 'history')
+        self.action_get.return_value = 1
+
+    def test_show_hook_stats(self):
+        self.history.return_value = [
+            {'hook': 'config-changed', 'duration': 2.0, 'subprocess': 1.5,
+             'sites': {'a.f ovs-vsctl': [2, 1.0, 0.6],
+                       'b.g ip': [1, 0.5, 0.5]}},
+        ]
+        actions.show_hook_stats([])
+        self.action_get.assert_called_once_with('top')
+        result = self.function_set.call_args[0][0]
+        self.assertEqual(yaml.safe_load(result['hooks']), {
+            'config-changed': {'count': 1, 'p50': 2.0, 'p90': 2.0,
+                               'p99': 2.0, 'max': 2.0,
+                               'subprocess-p50': 1.5}})
+        self.assertEqual(yaml.safe_load(result['slowest-call-sites']), [
+            {'site': 'a.f ovs-vsctl', 'calls': 2, 'total': 1.0,
+             'max': 0.6}])
+
+    def test_show_hook_stats_empty(self):
+        self.history.return_value = []
+        actions.show_hook_stats([])
+        self.assertIn('message', self.function_set.call_args[0][0])
+
+
 class GetStatusTestCase(CharmTestCase):
 
     def setUp(self):
@@ -14,6 +14,7 @@
 
 from unittest import mock
 
+import neutron_ovs
 import test_utils
 
 with mock.patch('neutron_utils.register_configs') as configs:
@@ -55,36 +56,50 @@ class HelperTestCase(test_utils.CharmTestCase):
     def setUp(self):
         super(HelperTestCase, self).setUp(
             actions, [
-                'ch_ovsdb',
+                'neutron_ovs',
+                'neutron_ovsdb',
             ])
 
-    @mock.patch.object(actions.ch_ovs, 'del_bridge_port')
-    @mock.patch.object(actions.ch_ovs, 'patch_ports_on_bridge')
-    def test_remove_patch_ports(
-            self, _patch_ports_on_bridge, _del_bridge_port):
-        _patch_ports_on_bridge.return_value = [actions.ch_ovs.Patch(
-            this_end=actions.ch_ovs.PatchPort(
-                bridge='this-end-bridge',
-                port='this-end-port'),
-            other_end=actions.ch_ovs.PatchPort(
-                bridge='other-end-bridge',
-                port='other-end-port')),
+    def test_remove_patch_ports(self):
+        self.neutron_ovs.OVSChangePlan = neutron_ovs.OVSChangePlan
+        snapshot = self.neutron_ovs.ovsdb_snapshot.return_value
+        _patch_ports_on_bridge = snapshot.patch_ports_on_bridge
+        _patch_ports_on_bridge.return_value = [
+            actions.ch_ovs.Patch(
+                this_end=actions.ch_ovs.PatchPort(
+                    bridge='this-end-bridge',
+                    port='this-end-port' + suffix),
+                other_end=actions.ch_ovs.PatchPort(
+                    bridge='other-end-bridge',
+                    port='other-end-port' + suffix))
+            for suffix in ('', '2')
         ]
         actions.remove_patch_ports('fake-bridge')
         _patch_ports_on_bridge.assert_called_once_with(
             'fake-bridge')
-        _del_bridge_port.assert_has_calls([
-            mock.call('this-end-bridge', 'this-end-port', linkdown=False),
-            mock.call('other-end-bridge', 'other-end-port', linkdown=False),
+        self.neutron_ovs.apply_ovs_changes.assert_called_once_with(mock.ANY)
+        plan = self.neutron_ovs.apply_ovs_changes.call_args[0][0]
+        self.assertEqual(plan.vsctl_cmd(), [
+            'ovs-vsctl',
+            '--', '--if-exists', 'del-port', 'this-end-bridge',
+            'this-end-port',
+            '--', '--if-exists', 'del-port', 'other-end-bridge',
+            'other-end-port',
+            '--', '--if-exists', 'del-port', 'this-end-bridge',
+            'this-end-port2',
+            '--', '--if-exists', 'del-port', 'other-end-bridge',
+            'other-end-port2',
         ])
+        self.neutron_ovs.reset_ovsdb_snapshot.assert_called_once_with()
 
     def test_remove_per_bridge_controllers(self):
         bridge = mock.MagicMock()
         bridge.__getitem__.return_value = 'fake-uuid'
         ovsdb = mock.MagicMock()
         ovsdb.bridge.__iter__.return_value = [bridge]
-        self.ch_ovsdb.SimpleOVSDB.return_value = ovsdb
+        self.neutron_ovsdb.simple_ovsdb.return_value = ovsdb
         actions.remove_per_bridge_controllers()
+        self.neutron_ovsdb.simple_ovsdb.assert_called_once_with('ovs-vsctl')
         ovsdb.bridge.clear.assert_called_once_with('fake-uuid', 'controller')
 
     @mock.patch.object(actions.subprocess, 'check_call')
@@ -97,49 +112,20 @@ class HelperTestCase(test_utils.CharmTestCase):
                 '--config-file=/etc/neutron/plugins/ml2/openvswitch_agent.ini',
             ))
 
-    @mock.patch.object(actions.os.path, 'exists')
-    @mock.patch.object(actions.os, 'unlink')
-    @mock.patch.object(actions.subprocess, 'check_call')
-    def test_neutron_netns_cleanup(self, _check_call, _unlink, _exists):
-        with test_utils.patch_open() as (_open, _file):
-            actions.neutron_netns_cleanup()
-            _open.assert_called_once_with(
-                '/etc/neutron/rootwrap.d/charm-n-ovs.filters', 'w')
-            _file.write.assert_called_once_with(
-                '[Filters]\n'
-                'neutron.cmd.netns_cleanup: CommandFilter, ip, root\n')
-            _check_call.assert_has_calls([
-                # FIXME: remove once package deps have been backported
-                mock.call(('apt', '-y', 'install', 'net-tools')),
-                mock.call(
-                    (
-                        'neutron-netns-cleanup',
-                        '--force',
-                        '--config-file=/etc/neutron/neutron.conf',
-                        '--config-file=/etc/neutron/l3_agent.ini',
-                        '--config-file=/etc/neutron/fwaas_driver.ini',
-                        '--config-file=/etc/neutron/dhcp_agent.ini',
-                    )),
-            ])
-            _unlink.assert_called_once_with(
-                '/etc/neutron/rootwrap.d/charm-n-ovs.filters')
-            # Confirm behaviour when a config does not exist
-            _exists.reset_mock()
-            _exists.side_effect = [True, True, True, False]
-            _check_call.reset_mock()
+    @mock.patch.object(actions.neutron_netns, 'teardown_namespaces')
+    @mock.patch.object(actions.neutron_netns, 'list_namespaces')
+    def test_neutron_netns_cleanup(self, _list_namespaces,
+                                   _teardown_namespaces):
+        _list_namespaces.return_value = ['qrouter-1', 'qdhcp-2']
+        _teardown_namespaces.return_value = []
+        actions.neutron_netns_cleanup()
+        _list_namespaces.assert_called_once_with()
+        _teardown_namespaces.assert_called_once_with(
+            ['qrouter-1', 'qdhcp-2'], kill=True, log=mock.ANY)
+        # Namespaces left behind fail the action
+        _teardown_namespaces.return_value = ['qrouter-1']
+        with self.assertRaises(RuntimeError):
             actions.neutron_netns_cleanup()
-            _check_call.assert_has_calls([
-                # FIXME: remove once package deps have been backported
-                mock.call(('apt', '-y', 'install', 'net-tools')),
-                mock.call(
-                    (
-                        'neutron-netns-cleanup',
-                        '--force',
-                        '--config-file=/etc/neutron/neutron.conf',
-                        '--config-file=/etc/neutron/l3_agent.ini',
-                        '--config-file=/etc/neutron/fwaas_driver.ini',
-                    )),
-            ])
 
 
 class MainTestCase(test_utils.CharmTestCase):
@@ -0,0 +1,142 @@
+import os
+import shutil
+import tempfile
+
+import yaml
+
+import charmhelpers.contrib.openstack.deferred_events as deferred_events
+import charmhelpers.core.unitdata as unitdata
+import neutron_deferred
+
+from test_utils import (
+    CharmTestCase
+)
+
+TO_PATCH = [
+    'log',
+]
+
+
+class TestEventIndex(CharmTestCase):
+
+    def setUp(self):
+        super(TestEventIndex, self).setUp(neutron_deferred, TO_PATCH)
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.kv = unitdata.Storage(':memory:')
+        self.patch_object(neutron_deferred.unitdata, 'kv', name='unit_kv',
+                          return_value=self.kv)
+        self.patch_object(neutron_deferred.hookenv, 'service_name',
+                          return_value='neutron-gateway')
+        self.patch_object(deferred_events.hookenv, 'service_name',
+                          name='events_service_name',
+                          return_value='neutron-gateway')
+        self.patch_object(deferred_events, 'DEFERRED_EVENTS_DIR',
+                          new=self.tmpdir)
+        self.patch_object(deferred_events, 'read_event_file',
+                          side_effect=deferred_events.read_event_file)
+        self.index = neutron_deferred.EventIndex(self.tmpdir)
+
+    def _write_event(self, name, service, requestor='neutron-gateway',
+                     reason='Package update'):
+        # As written by the policy-rc.d script.
+        with open(os.path.join(self.tmpdir, name), 'w') as f:
+            yaml.dump({
+                'timestamp': 1000,
+                'service': service,
+                'action': 'restart',
+                'reason': reason,
+                'policy_requestor_type': 'charm',
+                'policy_requestor_name': requestor}, f)
+        # Make sure the directory looks changed whatever the mtime
+        # granularity.
+        self.index.mtime = None
+
+    def _event(self, service, reason='File(s) changed: a.conf'):
+        return deferred_events.ServiceEvent(
+            timestamp=1000, service=service, reason=reason,
+            action='restart')
+
+    def test_deferred_events(self):
+        self._write_event('charm-neutron-gateway-1.deferred', 'svc1')
+        self._write_event('charm-other-2.deferred', 'svc2',
+                          requestor='other')
+        self._write_event('ignored.txt', 'svc3')
+        events = self.index.deferred_events()
+        self.assertEqual(
+            [(p, e.service) for p, e in events],
+            [(os.path.join(self.tmpdir, 'charm-neutron-gateway-1.deferred'),
+              'svc1')])
+        # Unchanged directory, nothing is read again.
+        self.index.deferred_events()
+        self.assertEqual(self.read_event_file.call_count, 2)
+
+    def test_index_persisted(self):
+        self._write_event('charm-neutron-gateway-1.deferred', 'svc1')
+        self.index.deferred_events()
+        index = neutron_deferred.EventIndex(self.tmpdir)
+        self.assertEqual([e.service for _, e in index.deferred_events()],
+                         ['svc1'])
+        self.assertEqual(self.read_event_file.call_count, 1)
+
+    def test_removed_files_forgotten(self):
+        self._write_event('charm-neutron-gateway-1.deferred', 'svc1')
+        self.index.deferred_events()
+        os.remove(os.path.join(self.tmpdir,
+                               'charm-neutron-gateway-1.deferred'))
+        self.index.mtime = None
+        self.assertEqual(self.index.deferred_events(), [])
+
+    def test_unreadable_file_retried(self):
+        path = os.path.join(self.tmpdir, 'charm-neutron-gateway-1.deferred')
+        with open(path, 'w') as f:
+            f.write('timestamp: 1000\n')
+        self.assertEqual(self.index.deferred_events(), [])
+        self.assertTrue(self.log.called)
+        self._write_event('charm-neutron-gateway-1.deferred', 'svc1')
+        self.assertEqual([e.service for _, e in self.index.deferred_events()],
+                         ['svc1'])
+
+    def test_save_event(self):
+        self.index.save_event(self._event('svc1'))
+        self.index.save_event(self._event('svc1'))
+        self.index.save_event(self._event('svc1', reason='other'))
+        files = sorted(os.listdir(self.tmpdir))
+        self.assertEqual(len(files), 2)
+        # Readable by charmhelpers and the NRPE check.
+        self.assertEqual(
+            sorted(deferred_events.read_event_file(
+                os.path.join(self.tmpdir, f)).reason for f in files),
+            ['File(s) changed: a.conf', 'other'])
+
+    def test_save_event_duplicate_from_package(self):
+        self._write_event('charm-neutron-gateway-1.deferred', 'svc1',
+                          reason='File(s) changed: a.conf')
+        self.index.save_event(self._event('svc1'))
+        self.assertEqual(os.listdir(self.tmpdir),
+                         ['charm-neutron-gateway-1.deferred'])
+
+    def test_clear_deferred_events(self):
+        self._write_event('charm-neutron-gateway-1.deferred', 'svc1')
+        self._write_event('charm-other-2.deferred', 'svc1',
+                          requestor='other')
+        self.index.save_event(self._event('svc2'))
+        self.index.clear_deferred_events(['svc1'], 'restart')
+        self.assertEqual([e.service for _, e in self.index.deferred_events()],
+                         ['svc2'])
+        self.assertEqual(len(os.listdir(self.tmpdir)), 1)
+
+    def test_install(self):
+        self.patch_object(neutron_deferred, '_index', new=None)
+        for name in ('deferred_events', 'save_event',
+                     'clear_deferred_events'):
+            self.patch_object(deferred_events, name,
+                              new=getattr(deferred_events, name))
+        index = neutron_deferred.install()
+        self.assertIs(neutron_deferred.install(), index)
+        deferred_events.save_event(self._event('svc1'))
+        self.assertEqual(
+            [e.service for e in deferred_events.get_deferred_restarts()],
+            ['svc1'])
+        deferred_events.clear_deferred_restarts(['svc1'])
+        self.assertEqual(os.listdir(self.tmpdir), [])
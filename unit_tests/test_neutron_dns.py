@@ -0,0 +1,75 @@
+import threading
+
+import charmhelpers.core.unitdata as unitdata
+import neutron_dns
+
+from test_utils import (
+    CharmTestCase
+)
+
+TO_PATCH = [
+    'config',
+    'log',
+    'ns_query',
+]
+
+
+class TestGetHostIP(CharmTestCase):
+
+    def setUp(self):
+        super(TestGetHostIP, self).setUp(neutron_dns, TO_PATCH)
+        self.config.side_effect = self.test_config.get
+        self.kv = unitdata.Storage(':memory:')
+        self.patch_object(neutron_dns.unitdata, 'kv', name='unit_kv',
+                          return_value=self.kv)
+        self.patch_object(neutron_dns.socket, 'gethostbyname',
+                          side_effect=OSError)
+        self.patch_object(neutron_dns.time, 'monotonic', return_value=1000)
+        self.addCleanup(neutron_dns.reset_cache)
+        self.ns_query.return_value = '10.0.0.1'
+
+    def test_ip(self):
+        self.assertEqual(neutron_dns.get_host_ip('10.0.0.2'), '10.0.0.2')
+        self.assertFalse(self.ns_query.called)
+
+    def test_cached(self):
+        self.assertEqual(neutron_dns.get_host_ip('host'), '10.0.0.1')
+        self.ns_query.return_value = '10.0.0.3'
+        self.assertEqual(neutron_dns.get_host_ip('host'), '10.0.0.1')
+        self.assertEqual(self.ns_query.call_count, 1)
+        self.monotonic.return_value += neutron_dns.POSITIVE_TTL
+        self.assertEqual(neutron_dns.get_host_ip('host'), '10.0.0.3')
+        self.assertEqual(self.kv.get(neutron_dns.LAST_KNOWN_GOOD_KEY),
+                         {'host': '10.0.0.3'})
+
+    def test_negative_cache(self):
+        self.ns_query.return_value = None
+        self.assertEqual(neutron_dns.get_host_ip('host', fallback='fb'), 'fb')
+        self.assertEqual(neutron_dns.get_host_ip('host', fallback='fb'), 'fb')
+        self.assertEqual(self.ns_query.call_count, 1)
+        self.assertEqual(self.gethostbyname.call_count, 1)
+        self.monotonic.return_value += neutron_dns.NEGATIVE_TTL
+        self.ns_query.return_value = '10.0.0.1'
+        self.assertEqual(neutron_dns.get_host_ip('host'), '10.0.0.1')
+
+    def test_last_known_good(self):
+        self.kv.set(neutron_dns.LAST_KNOWN_GOOD_KEY, {'host': '10.0.0.9'})
+        self.ns_query.side_effect = Exception('SERVFAIL')
+        self.assertEqual(neutron_dns.get_host_ip('host', fallback='fb'),
+                         '10.0.0.9')
+        self.assertEqual(neutron_dns.get_host_ip('host', fallback='fb'),
+                         '10.0.0.9')
+
+    def test_gethostbyname_fallback(self):
+        self.ns_query.return_value = None
+        self.gethostbyname.side_effect = None
+        self.gethostbyname.return_value = '10.0.0.4'
+        self.assertEqual(neutron_dns.get_host_ip('host'), '10.0.0.4')
+
+    def test_gethostbyname_timeout(self):
+        self.ns_query.return_value = None
+        release = threading.Event()
+        self.addCleanup(release.set)
+        self.gethostbyname.side_effect = lambda name: release.wait()
+        self.test_config.set('dns-query-timeout', 0.01)
+        self.assertEqual(neutron_dns.get_host_ip('host', fallback='fb'), 'fb')
@@ -0,0 +1,254 @@
+import os
+import shutil
+import tempfile
+
+import charmhelpers.contrib.hahelpers.cluster as cluster
+import charmhelpers.core.hookenv as hookenv
+import charmhelpers.core.unitdata as unitdata
+import neutron_contexts
+import neutron_dns
+import neutron_fingerprint
+import neutron_interfaces
+
+from test_utils import (
+    CharmTestCase
+)
+
+TO_PATCH = [
+    'log',
+]
+
+RELATION_DATA = {
+    'amqp:1': {
+        'rabbitmq-server/0': {'password': 'secret',
+                              'ingress-address': '10.0.0.1'},
+        'rabbitmq-server/1': {'password': 'secret',
+                              'ingress-address': '10.0.0.2'},
+    },
+}
+
+
+class TestFingerprint(CharmTestCase):
+
+    def setUp(self):
+        super(TestFingerprint, self).setUp(neutron_fingerprint, TO_PATCH)
+        self.kv = unitdata.Storage(':memory:')
+        self.patch_object(neutron_fingerprint.unitdata, 'kv',
+                          name='unit_kv', return_value=self.kv)
+        self.config_data = {'rabbit-user': 'neutron', 'debug': False}
+        self.data = {rid: {unit: dict(settings)
+                           for unit, settings in units.items()}
+                     for rid, units in RELATION_DATA.items()}
+        self.patch_object(hookenv, 'config', side_effect=self._config)
+        self.patch_object(hookenv, 'relation_get',
+                          side_effect=self._relation_get)
+        self.patch_object(hookenv, 'relation_ids',
+                          side_effect=lambda reltype=None: sorted(self.data))
+        self.patch_object(hookenv, 'related_units',
+                          side_effect=lambda relid=None: sorted(
+                              self.data.get(relid or 'amqp:1', {})))
+        self.patch_object(hookenv, 'relation_id', return_value='amqp:1')
+        self.patch_object(hookenv, 'remote_unit',
+                          return_value='rabbitmq-server/0')
+        self.patch_object(hookenv, 'relation_type', return_value='amqp')
+        self.leader = True
+        self.addresses = {'internal': '10.5.0.10'}
+        self.patch_object(hookenv, 'is_leader',
+                          side_effect=lambda: self.leader)
+        self.patch_object(hookenv, 'network_get_primary_address',
+                          side_effect=lambda binding: self.addresses[binding])
+        # as imported by hahelpers
+        self.patch_object(cluster, 'juju_is_leader', new=hookenv.is_leader)
+        self.runs = 0
+
+    def _config(self, scope=None):
+        if scope is None:
+            return dict(self.config_data)
+        return self.config_data.get(scope)
+
+    def _relation_get(self, attribute=None, unit=None, rid=None, app=None):
+        settings = self.data.get(rid or 'amqp:1', {}).get(
+            unit or 'rabbitmq-server/0', {})
+        if attribute is None:
+            return dict(settings)
+        return settings.get(attribute)
+
+    def _hook(self):
+        # Reads as done by a context, through the hookenv module.
+        self.runs += 1
+        passwords = []
+        for rid in hookenv.relation_ids('amqp'):
+            for unit in hookenv.related_units(rid):
+                passwords.append(hookenv.relation_get('password', rid=rid,
+                                                      unit=unit))
+        return hookenv.config('rabbit-user'), passwords
+
+    def test_recorder(self):
+        relation_get = hookenv.relation_get
+        recorder = neutron_fingerprint.InputRecorder()
+        recorder.start()
+        try:
+            hookenv.relation_get('password')
+            hookenv.related_units()
+            hookenv.config('debug')
+        finally:
+            recorder.stop()
+        self.assertIs(hookenv.relation_get, relation_get)
+        self.assertEqual(sorted(recorder.reads.items()), [
+            ('["config", "debug"]', 'false'),
+            ('["related_units", "amqp:1"]',
+             '["rabbitmq-server/0", "rabbitmq-server/1"]'),
+            ('["relation_get", "password", "rabbitmq-server/0", "amqp:1", '
+             'null]', '"secret"'),
+        ])
+
+    def test_replay_relation_get(self):
+        self.assertEqual(neutron_fingerprint.replay(
+            ['relation_get', 'password', 'rabbitmq-server/1', 'amqp:1',
+             None]), 'secret')
+        hookenv.relation_get.assert_called_once_with(
+            unit='rabbitmq-server/1', rid='amqp:1')
+        self.assertEqual(neutron_fingerprint.replay(
+            ['related_units', 'amqp:1']),
+            ['rabbitmq-server/0', 'rabbitmq-server/1'])
+
+    def test_skip_if_inputs_unchanged(self):
+        hook = neutron_fingerprint.skip_if_inputs_unchanged(self._hook)
+        self.assertEqual(hook(), ('neutron', ['secret', 'secret']))
+        self.assertIn('neutron_fingerprint._hook',
+                      self.kv.getrange('neutron_fingerprint.'))
+        # Attributes which are not read do not matter.
+        self.data['amqp:1']['rabbitmq-server/1']['ingress-address'] = \
+            '10.0.0.3'
+        self.assertIsNone(hook())
+        self.assertEqual(self.runs, 1)
+        # Attributes which are read do.
+        self.data['amqp:1']['rabbitmq-server/1']['password'] = 'changed'
+        self.assertEqual(hook(), ('neutron', ['secret', 'changed']))
+        self.assertIsNone(hook())
+        # And so does config.
+        self.config_data['rabbit-user'] = 'other'
+        self.assertEqual(hook(), ('other', ['secret', 'changed']))
+        self.assertEqual(self.runs, 3)
+
+    def test_new_unit(self):
+        hook = neutron_fingerprint.skip_if_inputs_unchanged(self._hook)
+        hook()
+        self.data['amqp:1']['rabbitmq-server/2'] = {'password': 'secret'}
+        self.assertEqual(hook(), ('neutron', ['secret'] * 3))
+
+    def test_failed_run_not_recorded(self):
+        hook = neutron_fingerprint.skip_if_inputs_unchanged(self._hook)
+        hook()
+        self.data['amqp:1']['rabbitmq-server/1']['password'] = 'changed'
+        hookenv.config.side_effect = Exception('boom')
+        self.assertRaises(Exception, hook)
+        hookenv.config.side_effect = self._config
+        self.data['amqp:1']['rabbitmq-server/1']['password'] = 'secret'
+        hook()
+        self.assertEqual(self.runs, 3)
+
+    def test_replay_failure(self):
+        hook = neutron_fingerprint.skip_if_inputs_unchanged(self._hook)
+        hook()
+        hookenv.related_units.side_effect = Exception('relation gone')
+        self.assertFalse(
+            neutron_fingerprint.inputs_unchanged('neutron_fingerprint._hook'))
+
+    def test_forget_inputs(self):
+        hook = neutron_fingerprint.skip_if_inputs_unchanged(self._hook)
+        hook()
+        neutron_fingerprint.forget_inputs()
+        hook()
+        self.assertEqual(self.runs, 2)
+
+    def _leader_hook(self):
+        self.runs += 1
+        return (cluster.is_elected_leader('res_neutron_vip'),
+                hookenv.network_get_primary_address('internal'))
+
+    def test_leadership_and_addresses(self):
+        hook = neutron_fingerprint.skip_if_inputs_unchanged(self._leader_hook)
+        self.assertEqual(hook(), (True, '10.5.0.10'))
+        self.assertIsNone(hook())
+        self.leader = False
+        self.assertEqual(hook(), (False, '10.5.0.10'))
+        self.assertIsNone(hook())
+        self.addresses['internal'] = '10.5.0.11'
+        self.assertEqual(hook(), (False, '10.5.0.11'))
+        self.assertEqual(self.runs, 3)
+
+    def _hook_network(self):
+        self.runs += 1
+        try:
+            return hookenv.network_get_primary_address('internal')
+        except NotImplementedError:
+            return None
+
+    def test_failed_call_recorded(self):
+        hook = neutron_fingerprint.skip_if_inputs_unchanged(self._hook_network)
+        hookenv.network_get_primary_address.side_effect = \
+            NotImplementedError
+        self.assertEqual(hook(), None)
+        self.assertIsNone(hook())
+        self.assertEqual(self.runs, 1)
+        hookenv.network_get_primary_address.side_effect = \
+            lambda binding: self.addresses[binding]
+        self.assertEqual(hook(), '10.5.0.10')
+        self.assertEqual(self.runs, 2)
+
+    def test_crm_leadership_not_skipped(self):
+        self.patch_object(cluster, 'is_crm_leader', return_value=True)
+        self.patch_object(cluster, 'is_clustered', return_value=True)
+        hookenv.is_leader.side_effect = NotImplementedError
+        self.patch_object(cluster, 'log')
+        hook = neutron_fingerprint.skip_if_inputs_unchanged(self._leader_hook)
+        hook()
+        hook()
+        self.assertEqual(self.runs, 2)
+        self.assertNotIn('neutron_fingerprint._leader_hook',
+                         self.kv.getrange('neutron_fingerprint.'))
+
+    def _metadata_hook(self):
+        # Reads as done by the metadata contexts.
+        self.runs += 1
+        return (neutron_contexts.get_host_ip('nova-api.example'),
+                neutron_contexts.get_shared_secret())
+
+    def test_dns_and_shared_secret(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        self.patch_object(neutron_contexts, 'SHARED_SECRET',
+                          new=os.path.join(tmp, '{}-secret.txt'))
+        self.addresses['nova-api.example'] = '10.5.0.20'
+        self.patch_object(neutron_dns, 'resolve',
+                          side_effect=lambda host: self.addresses[host])
+        self.addCleanup(neutron_dns.reset_cache)
+        hook = neutron_fingerprint.skip_if_inputs_unchanged(
+            self._metadata_hook)
+        address, secret = hook()
+        self.assertEqual(address, '10.5.0.20')
+        self.assertIsNone(hook())
+        self.addresses['nova-api.example'] = '10.5.0.21'
+        neutron_dns.reset_cache()
+        self.assertEqual(hook(), ('10.5.0.21', secret))
+        self.assertIsNone(hook())
+        with open(neutron_contexts.SHARED_SECRET.format('neutron'),
+                  'w') as f:
+            f.write('rotated')
+        self.assertEqual(hook(), ('10.5.0.21', 'rotated'))
+        self.assertEqual(self.runs, 3)
+
+    def test_interface_inventory_not_skipped(self):
+        self.patch_object(neutron_interfaces, 'load_interface_inventory')
+
+        def hook():
+            self.runs += 1
+            hookenv.config('data-port')
+            neutron_contexts.interface_inventory()
+        neutron_interfaces.reset_interface_inventory()
+        self.addCleanup(neutron_interfaces.reset_interface_inventory)
+        hook = neutron_fingerprint.skip_if_inputs_unchanged(hook)
+        hook()
+        hook()
+        self.assertEqual(self.runs, 2)
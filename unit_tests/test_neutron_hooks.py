@@ -1,3 +1,4 @@
+import itertools
 import sys
 
 from unittest.mock import MagicMock, patch, call
@@ -10,7 +11,9 @@ sys.modules['apt_pkg'] = MagicMock()
 import charmhelpers.core.hookenv as hookenv
 import charmhelpers.contrib.hardening.harden as harden
 
+import neutron_fingerprint
 import neutron_hooks as hooks
+import neutron_utils
 
 from test_utils import CharmTestCase
 
@@ -33,6 +36,7 @@ TO_PATCH = [
     'relation_set',
     'relation_ids',
     'relation_get',
+    'relation_type',
     'install_ca_cert',
     'execd_preinstall',
     'lsb_release',
@@ -81,6 +85,17 @@ class TestQuantumHooks(CharmTestCase):
         hooks.hooks._config_save = False
         harden._DISABLE_HARDENING_FOR_UNIT_TEST = True
         self.is_unit_paused_set.return_value = True
+        # restart_map runs unmocked through restart_on_change; give every
+        # call a distinct state so nothing is memoized across hooks.
+        self.patch_object(neutron_utils, '_derived_state',
+                          side_effect=itertools.count().__next__)
+        # Hooks are run in full unless a test says otherwise.
+        self.patch_object(neutron_fingerprint, 'inputs_unchanged',
+                          return_value=False)
+
+    def tearDown(self):
+        super(TestQuantumHooks, self).tearDown()
+        hookenv.cache = {}
 
     def _call_hook(self, hookname):
         hooks.hooks.execute([
@@ -251,18 +266,46 @@ class TestQuantumHooks(CharmTestCase):
         )
 
     def test_amqp_changed(self):
+        self.relation_type.return_value = 'amqp'
         self._call_hook('amqp-relation-changed')
-        self.assertTrue(self.CONFIGS.write_all.called)
+        self.CONFIGS.write_for.assert_called_once_with(interfaces=['amqp'])
+        self.assertFalse(self.CONFIGS.write_all.called)
+
+    def test_cluster_changed(self):
+        self.relation_type.return_value = 'cluster'
+        self._call_hook('cluster-relation-changed')
+        self.CONFIGS.write_for.assert_called_once_with(interfaces=['cluster'])
+
+    def test_amqp_changed_inputs_unchanged(self):
+        self.inputs_unchanged.return_value = True
+        self._call_hook('amqp-relation-changed')
+        self.assertFalse(self.CONFIGS.write_for.called)
+        self.inputs_unchanged.assert_called_once_with(
+            'neutron_fingerprint.amqp_changed')
+
+    def test_nm_changed_inputs_unchanged(self):
+        self.inputs_unchanged.return_value = True
+        self._call_hook('quantum-network-service-relation-changed')
+        self.assertFalse(self.CONFIGS.write_for.called)
+        self.assertFalse(self.update_nrpe_config.called)
+
+    def test_upgrade_charm_forgets_inputs(self):
+        self.patch_object(hooks, 'forget_inputs')
+        self.patch_object(hooks, 'install')
+        self.patch_object(hooks, 'config_changed')
+        self.remove_old_packages.return_value = False
+        self._call_hook('upgrade-charm')
+        self.forget_inputs.assert_called_once_with()
 
     def test_amqp_departed_no_rel(self):
         self.CONFIGS.complete_contexts.return_value = []
         self._call_hook('amqp-relation-departed')
-        self.assertFalse(self.CONFIGS.write_all.called)
+        self.assertFalse(self.CONFIGS.write_for.called)
 
     def test_amqp_departed(self):
         self.CONFIGS.complete_contexts.return_value = ['amqp']
         self._call_hook('amqp-relation-departed')
-        self.assertTrue(self.CONFIGS.write_all.called)
+        self.CONFIGS.write_for.assert_called_once_with(interfaces=['amqp'])
 
     def test_amqp_nova_joined(self):
         self._call_hook('amqp-nova-relation-joined')
@@ -275,12 +318,13 @@ class TestQuantumHooks(CharmTestCase):
     def test_amqp_nova_changed_no_rel(self):
         self.CONFIGS.complete_contexts.return_value = []
         self._call_hook('amqp-nova-relation-changed')
-        self.assertFalse(self.CONFIGS.write_all.called)
+        self.assertFalse(self.CONFIGS.write_for.called)
 
     def test_amqp_nova_changed(self):
         self.CONFIGS.complete_contexts.return_value = ['amqp-nova']
         self._call_hook('amqp-nova-relation-changed')
-        self.assertTrue(self.CONFIGS.write_all.called)
+        self.CONFIGS.write_for.assert_called_once_with(
+            interfaces=['amqp-nova'])
 
     def test_nm_changed(self):
         self.disable_nova_metadata.return_value = False
@@ -294,7 +338,8 @@ class TestQuantumHooks(CharmTestCase):
             return data.get(key)
         self.relation_get.side_effect = _relation_get
         self._call_hook('quantum-network-service-relation-changed')
-        self.assertTrue(self.CONFIGS.write_all.called)
+        self.CONFIGS.write_for.assert_called_once_with(
+            interfaces=['quantum-network-service'])
         self.install_ca_cert.assert_called_with('cert')
 
     @patch("neutron_utils.get_packages")
@@ -328,7 +373,8 @@ class TestQuantumHooks(CharmTestCase):
         self.kv.return_value = kv_mock
         kv_mock.get.return_value = None
         self._call_hook('quantum-network-service-relation-changed')
-        self.assertTrue(self.CONFIGS.write_all.called)
+        self.CONFIGS.write_for.assert_called_once_with(
+            interfaces=['quantum-network-service'])
         self.install_ca_cert.assert_called_with('cert')
         self.deferrable_svc_restart.assert_called_with(
             'nova-api-metadata',
@@ -369,7 +415,8 @@ class TestQuantumHooks(CharmTestCase):
         self.kv.return_value = kv_mock
         kv_mock.get.return_value = ('22222233333344444')
         self._call_hook('quantum-network-service-relation-changed')
-        self.assertTrue(self.CONFIGS.write_all.called)
+        self.CONFIGS.write_for.assert_called_once_with(
+            interfaces=['quantum-network-service'])
         self.install_ca_cert.assert_called_with('cert')
         self.deferrable_svc_restart.assert_called_with(
             'nova-api-metadata',
@@ -411,7 +458,8 @@ class TestQuantumHooks(CharmTestCase):
         self.kv.return_value = kv_mock
         kv_mock.get.return_value = ('1111111222222333333')
         self._call_hook('quantum-network-service-relation-changed')
-        self.assertTrue(self.CONFIGS.write_all.called)
+        self.CONFIGS.write_for.assert_called_once_with(
+            interfaces=['quantum-network-service'])
         self.install_ca_cert.assert_called_with('cert')
         self.assertFalse(self.deferrable_svc_restart.called)
         kv_mock.get.assert_called_with('restart_nonce')
@@ -429,7 +477,8 @@ class TestQuantumHooks(CharmTestCase):
             return data.get(key)
         self.relation_get.side_effect = _relation_get
         self._call_hook('quantum-network-service-relation-changed')
-        self.assertTrue(self.CONFIGS.write_all.called)
+        self.CONFIGS.write_for.assert_called_once_with(
+            interfaces=['quantum-network-service'])
         self.install_ca_cert.assert_called_with('cert')
         self.remove_legacy_nova_metadata.assert_called_once_with()
 
@@ -438,7 +487,8 @@ class TestQuantumHooks(CharmTestCase):
         self._call_hook('neutron-plugin-api-relation-changed')
         self.apt_install.assert_called_with(['keepalived', 'conntrack'],
                                             fatal=True)
-        self.assertTrue(self.CONFIGS.write_all.called)
+        self.CONFIGS.write_for.assert_called_once_with(
+            interfaces=['neutron-plugin-api'])
 
     def test_cluster_departed_nvp(self):
         self.test_config.set('plugin', 'nvp')
@@ -469,3 +519,29 @@ class TestQuantumHooks(CharmTestCase):
         self.test_config.set('ha-legacy-mode', True)
         self._call_hook('quantum-network-service-relation-changed')
         self.assertTrue(self.cache_env_data.called)
+
+    @patch.object(hooks, 'assess_status')
+    @patch.object(hooks, 'status_unchanged')
+    @patch.object(hooks, 'install_log_sink')
+    @patch.object(hooks, 'resolve_CONFIGS')
+    def test_main_update_status(self, resolve_CONFIGS, install_log_sink,
+                                status_unchanged, assess_status):
+        self.patch_object(hooks.sys, 'argv', new=['hooks/update-status'])
+        status_unchanged.return_value = True
+        hooks.main()
+        self.assertFalse(resolve_CONFIGS.called)
+        self.assertFalse(assess_status.called)
+        status_unchanged.return_value = False
+        hooks.main()
+        assess_status.assert_called_once_with(resolve_CONFIGS.return_value)
+
+    @patch.object(hooks, 'assess_status')
+    @patch.object(hooks, 'status_unchanged')
+    @patch.object(hooks, 'install_log_sink')
+    @patch.object(hooks, 'resolve_CONFIGS')
+    def test_main_full_assessment(self, resolve_CONFIGS, install_log_sink,
+                                  status_unchanged, assess_status):
+        self.patch_object(hooks.sys, 'argv', new=['hooks/start'])
+        hooks.main()
+        self.assertFalse(status_unchanged.called)
+        assess_status.assert_called_once_with(resolve_CONFIGS.return_value)
@@ -0,0 +1,211 @@
+import os
+import shutil
+import tempfile
+
+from unittest.mock import patch
+
+import charmhelpers.core.hookenv as hookenv
+import neutron_contexts
+import neutron_interfaces
+
+from test_utils import (
+    CharmTestCase
+)
+
+TO_PATCH = [
+    'log',
+    'subprocess',
+]
+
+IP_ADDR_OUTPUT = b"""\
+1: lo    inet 127.0.0.1/8 scope host lo\\       valid_lft forever
+2: eth0    inet 10.5.0.10/16 brd 10.5.255.255 scope global eth0\\       valid
+2: eth0    inet6 fe80::f816:3eff:fe2b:1/64 scope link \\       valid_lft
+3: eth1    inet6 2001:db8::1/64 scope global dynamic mngtmpaddr \\       valid
+3: eth1    inet6 2001:db8::2/64 scope global temporary dynamic \\       valid
+"""
+
+
+class TestInterfaceInventory(CharmTestCase):
+
+    def setUp(self):
+        super(TestInterfaceInventory, self).setUp(neutron_interfaces,
+                                                  TO_PATCH)
+        self.subprocess.CalledProcessError = Exception
+        self.subprocess.check_output.return_value = IP_ADDR_OUTPUT
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.devices = os.path.join(self.tmp, 'devices')
+        self.sys_net = os.path.join(self.tmp, 'class', 'net')
+        os.makedirs(self.sys_net)
+
+    def tearDown(self):
+        super(TestInterfaceInventory, self).tearDown()
+        hookenv.cache = {}
+
+    def _add_iface(self, name, index, hwaddr='', virtual=False, files=None,
+                   dirs=None):
+        parent = 'virtual' if virtual else 'pci0000:00'
+        path = os.path.join(self.devices, parent, 'net', name)
+        os.makedirs(path)
+        data = {'ifindex': index, 'address': hwaddr, 'mtu': 1500}
+        data.update(files or {})
+        for k, v in data.items():
+            with open(os.path.join(path, k), 'w') as f:
+                f.write('{}\n'.format(v))
+        for d in dirs or []:
+            os.makedirs(os.path.join(path, d))
+        os.symlink(path, os.path.join(self.sys_net, name))
+        return path
+
+    def _link(self, name, link, target):
+        os.symlink(os.path.join(self.sys_net, target),
+                   os.path.join(self.sys_net, name, link))
+
+    def _load(self):
+        return neutron_interfaces.load_interface_inventory(self.sys_net)
+
+    def test_load(self):
+        self._add_iface('eth0', 2, 'fa:16:3e:00:00:01',
+                        files={'flags': '0x1103'})
+        self._add_iface('tap1', 5, 'fa:16:3e:00:00:05', virtual=True,
+                        dirs=['brport'])
+        self._add_iface('br0', 4, 'fa:16:3e:00:00:04', virtual=True,
+                        dirs=['bridge'])
+        inventory = self._load()
+        self.subprocess.check_output.assert_called_once_with(
+            ['ip', '-o', 'addr', 'show'])
+        self.assertEqual(list(inventory), ['eth0', 'br0', 'tap1'])
+        self.assertEqual(inventory.physical_nics(), ['eth0'])
+        self.assertEqual(inventory.hwaddr('eth0'), 'fa:16:3e:00:00:01')
+        self.assertEqual(inventory.mtu('eth0'), 1500)
+        self.assertTrue(inventory.is_bridge_member('tap1'))
+        self.assertFalse(inventory.is_bridge_member('eth0'))
+        self.assertTrue(inventory.is_linux_bridge('br0'))
+        self.assertFalse(inventory.is_linux_bridge('missing'))
+        self.assertEqual(inventory.get_addresses('eth0'), ['10.5.0.10'])
+        self.assertTrue(inventory.is_up('eth0'))
+        self.assertTrue(inventory.is_promisc('eth0'))
+        self.assertFalse(inventory.is_up('tap1'))
+        self.assertFalse(inventory.is_promisc('missing'))
+
+    def test_load_ipv6_global_dynamic_only(self):
+        self._add_iface('eth1', 3, 'fa:16:3e:00:00:03')
+        inventory = self._load()
+        self.assertEqual(inventory.get_addresses('eth1'), ['2001:db8::1'])
+
+    def test_load_ip_failure(self):
+        self.subprocess.check_output.side_effect = OSError('no ip')
+        self._add_iface('eth0', 2, 'fa:16:3e:00:00:01')
+        inventory = self._load()
+        self.assertEqual(inventory.get_addresses('eth0'), [])
+        self.assertTrue('eth0' in inventory)
+
+    def test_bond_master(self):
+        self._add_iface('bond0', 6, 'fa:16:3e:00:00:06', virtual=True,
+                        dirs=['bonding'])
+        self._add_iface('eth2', 7, 'fa:16:3e:00:00:06')
+        self._link('eth2', 'master', 'bond0')
+        self._add_iface('eth3', 8, 'fa:16:3e:00:00:08')
+        self._link('eth3', 'master', 'bond0')
+        inventory = self._load()
+        self.assertEqual(inventory.bond_master('eth2'), 'bond0')
+        self.assertEqual(inventory.bond_master('bond0'), None)
+        self.assertEqual(
+            inventory.resolve_ports(['fa:16:3e:00:00:06']), ['bond0'])
+
+    def test_lower_devices(self):
+        self._add_iface('eth0', 2, 'fa:16:3e:00:00:01')
+        path = self._add_iface('eth0.100', 9, 'fa:16:3e:00:00:01',
+                               virtual=True)
+        os.symlink(os.path.join(self.sys_net, 'eth0'),
+                   os.path.join(path, 'lower_eth0'))
+        inventory = self._load()
+        self.assertEqual(inventory.lower_devices('eth0.100'), ['eth0'])
+        self.assertEqual(inventory.lower_devices('eth0'), [])
+
+    def test_resolve_ports(self):
+        self._add_iface('eth0', 2, 'fa:16:3e:00:00:01')
+        self._add_iface('eth1', 3, 'fa:16:3e:00:00:02')
+        self._add_iface('eth4', 10, 'fa:16:3e:00:00:0a', dirs=['brport'])
+        self._add_iface('tap1', 5, 'fa:16:3e:00:00:05', virtual=True)
+        inventory = self._load()
+        self.assertEqual(inventory.resolve_ports([]), None)
+        # eth0 has an IPv4 address so is not resolved from its MAC
+        self.assertEqual(inventory.resolve_ports(['fa:16:3e:00:00:01']), [])
+        # eth1 only has a dynamic IPv6 address so it is skipped as well
+        self.assertEqual(inventory.resolve_ports(['fa:16:3e:00:00:02']), [])
+        # bridge members are never resolved from their MAC
+        self.assertEqual(inventory.resolve_ports(['fa:16:3e:00:00:0a']), [])
+        # virtual interfaces are only resolved by name
+        self.assertEqual(inventory.resolve_ports(['fa:16:3e:00:00:05']), [])
+        self.assertEqual(
+            sorted(inventory.resolve_ports(['tap1', 'eth0', 'missing'])),
+            ['eth0', 'tap1'])
+
+    def test_resolve_ports_unaddressed_mac(self):
+        self.subprocess.check_output.return_value = b''
+        self._add_iface('eth1', 3, 'fa:16:3e:00:00:02')
+        inventory = self._load()
+        self.assertEqual(
+            inventory.resolve_ports(['fa:16:3e:00:00:02']), ['eth1'])
+
+    @patch.object(neutron_interfaces, 'load_interface_inventory')
+    def test_interface_inventory_cached(self, _load):
+        _load.return_value = 'inventory'
+        self.assertEqual(neutron_interfaces.interface_inventory(), 'inventory')
+        self.assertEqual(neutron_interfaces.interface_inventory(), 'inventory')
+        _load.assert_called_once_with()
+        neutron_interfaces.reset_interface_inventory()
+        neutron_interfaces.interface_inventory()
+        self.assertEqual(_load.call_count, 2)
+
+
+class TestPortContexts(CharmTestCase):
+
+    def setUp(self):
+        super(TestPortContexts, self).setUp(neutron_contexts,
+                                            ['config', 'interface_inventory',
+                                             'NeutronAPIContext'])
+        self.config.side_effect = self.test_config.get
+        self.inventory = neutron_interfaces.InterfaceInventory([
+            neutron_interfaces.Interface(
+                name='eth0', index=2, hwaddr='fa:16:3e:00:00:01', mtu=1500,
+                physical=True, master=None, bond_master=None,
+                bridge_member=False, linux_bridge=False, lower=[]),
+            neutron_interfaces.Interface(
+                name='eth0.100', index=3, hwaddr='fa:16:3e:00:00:01',
+                mtu=1500, physical=False, master=None, bond_master=None,
+                bridge_member=False, linux_bridge=False, lower=['eth0']),
+            neutron_interfaces.Interface(
+                name='eth1', index=4, hwaddr='fa:16:3e:00:00:02', mtu=1500,
+                physical=True, master=None, bond_master=None,
+                bridge_member=False, linux_bridge=False, lower=[]),
+        ], {'eth0': ['10.5.0.10']})
+        self.interface_inventory.return_value = self.inventory
+        self.NeutronAPIContext.return_value.return_value = {
+            'network_device_mtu': 9000}
+
+    def test_data_port(self):
+        self.test_config.set('data-port',
+                             'br-ex:fa:16:3e:00:00:02 br-data:eth0.100')
+        self.assertEqual(neutron_contexts.DataPortContext()(),
+                         {'eth1': 'br-ex', 'eth0.100': 'br-data'})
+
+    def test_data_port_unresolved(self):
+        self.test_config.set('data-port', 'br-ex:eth9')
+        self.assertEqual(neutron_contexts.DataPortContext()(), None)
+
+    def test_phy_nic_mtu(self):
+        self.test_config.set('data-port', 'br-data:eth0.100')
+        self.assertEqual(neutron_contexts.PhyNICMTUContext()(),
+                         {'devs': 'eth0\\neth0.100', 'mtu': 9000})
+
+    @patch('charmhelpers.contrib.openstack.context.NeutronAPIContext')
+    @patch('charmhelpers.contrib.openstack.context.config')
+    def test_external_port(self, _config, _napi):
+        _config.side_effect = self.test_config.get
+        _napi.return_value.return_value = {}
+        self.test_config.set('ext-port', 'fa:16:3e:00:00:02')
+        self.assertEqual(neutron_contexts.ExternalPortContext()(),
+                         {'ext_port': 'eth1'})
@@ -0,0 +1,111 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from unittest.mock import patch
+
+import charmhelpers.core.unitdata as unitdata
+import neutron_kv
+
+
+class TestStorage(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.path = os.path.join(self.tmpdir, '.unit-state.db')
+        self.kv = neutron_kv.Storage(self.path)
+        self.addCleanup(self.kv.close)
+
+    def _stored(self):
+        conn = sqlite3.connect(self.path)
+        try:
+            return dict(conn.execute('select key, data from kv'))
+        finally:
+            conn.close()
+
+    def test_wal(self):
+        self.assertEqual(
+            self.kv.cursor.execute('pragma journal_mode').fetchone(),
+            ('wal',))
+        self.assertEqual(
+            self.kv.cursor.execute('pragma synchronous').fetchone(),
+            (1,))
+
+    def test_set_get(self):
+        self.assertIsNone(self.kv.get('a'))
+        self.assertEqual(self.kv.get('a', 'default'), 'default')
+        self.kv.set('a', {'b': [1, 2]})
+        self.assertEqual(self.kv.get('a'), {'b': [1, 2]})
+        self.assertEqual(self.kv.get('a', record=True).b, [1, 2])
+        # Callers mutating returned values do not change the cache.
+        self.kv.get('a')['b'].append(3)
+        self.assertEqual(self.kv.get('a'), {'b': [1, 2]})
+        self.kv.flush()
+        self.assertEqual(self._stored(), {'a': '{"b": [1, 2]}'})
+
+    def test_get_cached(self):
+        self.kv.set('a', 1)
+        with patch.object(self.kv, 'cursor') as cursor:
+            self.assertEqual(self.kv.get('a'), 1)
+            self.kv.set('a', 1)
+        self.assertFalse(cursor.execute.called)
+        self.assertFalse(cursor.executemany.called)
+
+    def test_update(self):
+        self.kv.set('p.a', 1)
+        cursor = self.kv.cursor
+        with patch.object(self.kv, 'cursor', wraps=cursor) as mock_cursor:
+            self.kv.update({'a': 1, 'b': 2, 'c': 3}, prefix='p.')
+        mock_cursor.executemany.assert_called_once_with(
+            'insert or replace into kv (key, data) values (?, ?)',
+            [('p.b', '2'), ('p.c', '3')])
+        self.assertEqual(self.kv.getrange('p.', strip=True),
+                         {'a': 1, 'b': 2, 'c': 3})
+
+    def test_unset(self):
+        self.kv.update({'a': 1, 'b': 2, 'c': 3}, prefix='p.')
+        self.kv.unset('p.a')
+        self.assertIsNone(self.kv.get('p.a'))
+        self.kv.unsetrange(['b'], prefix='p.')
+        self.assertIsNone(self.kv.get('p.b'))
+        self.kv.unsetrange(prefix='p.')
+        self.assertIsNone(self.kv.get('p.c'))
+        self.kv.flush()
+        self.assertEqual(self._stored(), {})
+
+    def test_rollback(self):
+        self.kv.set('a', 1)
+        self.kv.flush()
+        self.kv.set('a', 2)
+        self.kv.flush(False)
+        self.assertEqual(self.kv.get('a'), 1)
+
+    def test_readable_by_unitdata(self):
+        self.kv.update({'a': 1, 'b': [2]})
+        self.kv.flush()
+        other = unitdata.Storage(self.path)
+        self.addCleanup(other.close)
+        self.assertEqual(other.getrange(''), {'a': 1, 'b': [2]})
+
+    def test_revisions(self):
+        kv = neutron_kv.Storage(':memory:', keep_revisions=True)
+        self.addCleanup(kv.close)
+        with kv.hook_scope('config-changed'):
+            kv.set('a', 1)
+            kv.update({'b': 2})
+        self.assertEqual(kv.get('a'), 1)
+        self.assertEqual([h[1] for h in kv.gethistory('b')], ['b'])
+
+    def test_install(self):
+        previous = unitdata.Storage(self.path)
+        previous.set('a', 1)
+        with patch.object(unitdata, '_KV', new=previous):
+            kv = neutron_kv.install()
+            self.addCleanup(kv.close)
+            self.assertIsInstance(unitdata.kv(), neutron_kv.Storage)
+            self.assertIs(neutron_kv.install(), kv)
+            self.assertEqual(kv.db_path, self.path)
+            self.assertEqual(kv.get('a'), 1)
@@ -0,0 +1,108 @@
+import errno
+
+from unittest.mock import call, patch
+
+import charmhelpers.core.hookenv as hookenv
+import neutron_log
+import neutron_patch
+
+from test_utils import (
+    CharmTestCase
+)
+
+TO_PATCH = []
+
+
+class TestBufferedLog(CharmTestCase):
+
+    def setUp(self):
+        super(TestBufferedLog, self).setUp(neutron_log, TO_PATCH)
+        self.patch_object(neutron_log.subprocess, 'call')
+        self.sink = neutron_log.BufferedLog()
+
+    def test_batches(self):
+        self.sink.log('one')
+        self.sink.log('two', level=hookenv.INFO)
+        self.sink.log('three', level=hookenv.DEBUG)
+        self.sink.log(['four'], level=hookenv.DEBUG)
+        self.assertFalse(self.call.called)
+        self.sink.flush()
+        self.call.assert_has_calls([
+            call(['juju-log', '-l', 'INFO', 'one\ntwo']),
+            call(['juju-log', '-l', 'DEBUG', "three\n['four']"])])
+        self.assertEqual(self.call.call_count, 2)
+        self.sink.flush()
+        self.assertEqual(self.call.call_count, 2)
+
+    def test_flush_on_warning(self):
+        self.sink.log('one')
+        self.sink.log('bad', level=hookenv.ERROR)
+        self.call.assert_has_calls([
+            call(['juju-log', '-l', 'INFO', 'one']),
+            call(['juju-log', '-l', 'ERROR', 'bad'])])
+
+    @patch.object(neutron_log, 'MAX_BUFFER', 10)
+    def test_flush_on_size(self):
+        self.sink.log('12345')
+        self.assertFalse(self.call.called)
+        self.sink.log('678901')
+        self.call.assert_called_once_with(
+            ['juju-log', '-l', 'INFO', '12345\n678901'])
+
+    def test_floor(self):
+        sink = neutron_log.BufferedLog(floor=hookenv.WARNING)
+        sink.log('dropped')
+        sink.log('dropped', level=hookenv.DEBUG)
+        sink.flush()
+        self.assertFalse(self.call.called)
+        sink.log('kept', level=hookenv.WARNING)
+        self.call.assert_called_once_with(
+            ['juju-log', '-l', 'WARNING', 'kept'])
+
+    @patch.object(neutron_log.hookenv, 'SH_MAX_ARG', 10)
+    def test_split_large_flush(self):
+        for message in ('1234', '5678', '90', 'abcdefghijklmnopqrstuvwxy',
+                        '', 'z'):
+            self.sink.log(message)
+        self.sink.log('debug', level=hookenv.DEBUG)
+        self.sink.flush()
+        self.call.assert_has_calls([
+            call(['juju-log', '-l', 'INFO', '1234\n5678']),
+            call(['juju-log', '-l', 'INFO', '90']),
+            call(['juju-log', '-l', 'INFO', 'abcdefghij']),
+            call(['juju-log', '-l', 'INFO', 'klmnopqrst']),
+            call(['juju-log', '-l', 'INFO', 'uvwxy\n\nz']),
+            call(['juju-log', '-l', 'DEBUG', 'debug'])])
+        self.assertEqual(self.call.call_count, 6)
+
+    @patch('builtins.print')
+    def test_no_juju_log(self, _print):
+        self.call.side_effect = OSError(errno.ENOENT, 'missing')
+        self.sink.log('one')
+        self.sink.log('two')
+        self.sink.flush()
+        _print.assert_has_calls([
+            call('juju-log: INFO: one', file=neutron_log.sys.stderr),
+            call('juju-log: INFO: two', file=neutron_log.sys.stderr)])
+
+
+class TestInstall(CharmTestCase):
+
+    def setUp(self):
+        super(TestInstall, self).setUp(neutron_log, TO_PATCH)
+        self.patch_object(neutron_log, '_sink', new=None)
+        self.patch_object(neutron_log.hookenv, 'atexit')
+        self.patch_object(neutron_log.atexit, 'register')
+
+    def test_install(self):
+        import neutron_ovs
+        self.addCleanup(neutron_patch.restore, neutron_patch.references(
+            [hookenv.log], ['log']))
+        sink = neutron_log.install(debug=True)
+        self.assertEqual(hookenv.log, sink.log)
+        self.assertEqual(neutron_ovs.log, sink.log)
+        self.assertEqual(sink.floor,
+                         neutron_log.SEVERITY[hookenv.DEBUG])
+        self.atexit.assert_called_once_with(sink.flush)
+        self.register.assert_called_once_with(sink.flush)
+        self.assertIs(neutron_log.install(), sink)
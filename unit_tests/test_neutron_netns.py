@@ -0,0 +1,182 @@
+import os
+import shutil
+import signal
+import subprocess
+import tempfile
+
+from unittest.mock import MagicMock, call
+
+import neutron_netns
+
+from test_utils import (
+    CharmTestCase
+)
+
+TO_PATCH = [
+    'subprocess',
+]
+
+LINKS = {
+    'qrouter-1': (
+        b'1: lo: <LOOPBACK,UP,LOWER_UP> mtu 65536 qdisc noqueue\\    '
+        b'link/loopback 00:00:00:00:00:00 brd 00:00:00:00:00:00\n'
+        b'2: qr-aa: <BROADCAST,MULTICAST,UP> mtu 1500\\    link/ether\n'
+        b'3: qg-bb@if7: <BROADCAST,MULTICAST,UP> mtu 1500\\    link/ether\n'),
+    'qdhcp-2': (
+        b'1: lo: <LOOPBACK,UP,LOWER_UP> mtu 65536 qdisc noqueue\n'
+        b'2: tap-cc: <BROADCAST,MULTICAST,UP> mtu 1500\\    link/ether\n'),
+}
+
+
+class TestNetns(CharmTestCase):
+
+    def setUp(self):
+        super(TestNetns, self).setUp(neutron_netns, TO_PATCH)
+        self.subprocess.CalledProcessError = subprocess.CalledProcessError
+        self.subprocess.PIPE = subprocess.PIPE
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.netns_dir = os.path.join(self.tmp, 'netns')
+        self.proc_dir = os.path.join(self.tmp, 'proc')
+        os.mkdir(self.netns_dir)
+        os.mkdir(self.proc_dir)
+        self.patch_object(neutron_netns, 'NETNS_DIR', new=self.netns_dir)
+        self.patch_object(neutron_netns, 'PROC_DIR', new=self.proc_dir)
+        self.patch_object(neutron_netns.os, 'kill')
+        for namespace in ('qrouter-1', 'qdhcp-2', 'other'):
+            self._namespace(namespace)
+        self._process(100, 'qrouter-1')
+        self._process(101, 'qrouter-1')
+        self._process(200, 'qdhcp-2')
+        self._process(300, None)
+        os.mkdir(os.path.join(self.proc_dir, 'self'))
+        self.links = dict(LINKS)
+        self.subprocess.check_output.side_effect = self._link_show
+        self.batches = []
+        self.subprocess.Popen.side_effect = self._popen
+
+    def _namespace(self, name):
+        open(os.path.join(self.netns_dir, name), 'w').close()
+
+    def _process(self, pid, namespace):
+        ns_dir = os.path.join(self.proc_dir, str(pid), 'ns')
+        os.makedirs(ns_dir)
+        if namespace:
+            os.link(os.path.join(self.netns_dir, namespace),
+                    os.path.join(ns_dir, 'net'))
+        else:
+            open(os.path.join(ns_dir, 'net'), 'w').close()
+
+    def _link_show(self, cmd):
+        return self.links[cmd[2]]
+
+    def _popen(self, cmd, **kwargs):
+        proc = MagicMock()
+        proc.returncode = 0
+
+        def communicate(data):
+            commands = data.decode('UTF-8').splitlines()
+            self.batches.append((cmd, commands))
+            for command in commands:
+                if command.startswith('netns delete '):
+                    os.unlink(os.path.join(self.netns_dir, command[13:]))
+            return b'', b''
+        proc.communicate.side_effect = communicate
+        return proc
+
+    def test_list_namespaces(self):
+        self.assertEqual(neutron_netns.list_namespaces(),
+                         ['qdhcp-2', 'qrouter-1'])
+        self.assertEqual(neutron_netns.list_namespaces(['qdhcp-']),
+                         ['qdhcp-2'])
+        shutil.rmtree(self.netns_dir)
+        self.assertEqual(neutron_netns.list_namespaces(), [])
+
+    def test_namespace_devices(self):
+        self.assertEqual(neutron_netns.namespace_devices('qrouter-1'),
+                         ['qr-aa', 'qg-bb'])
+        self.subprocess.check_output.assert_called_once_with(
+            ['ip', '-netns', 'qrouter-1', '-oneline', 'link', 'show'])
+
+    def test_namespace_pids(self):
+        pids = neutron_netns.namespace_pids(['qrouter-1', 'qdhcp-2', 'gone'])
+        self.assertEqual(sorted(pids), ['qdhcp-2', 'qrouter-1'])
+        self.assertEqual(sorted(pids['qrouter-1']), [100, 101])
+        self.assertEqual(pids['qdhcp-2'], [200])
+
+    def test_delete_ovs_ports(self):
+        neutron_netns.delete_ovs_ports(['qr-aa', 'tap-cc', 'qr-aa'])
+        self.subprocess.check_call.assert_called_once_with(
+            ['ovs-vsctl', '--', '--if-exists', 'del-port', 'qr-aa',
+             '--', '--if-exists', 'del-port', 'tap-cc'])
+        self.subprocess.check_call.reset_mock()
+        neutron_netns.delete_ovs_ports([])
+        self.assertFalse(self.subprocess.check_call.called)
+
+    def test_ip_batch_failure(self):
+        proc = MagicMock(returncode=1)
+        proc.communicate.return_value = (b'', b'Cannot find device "x"')
+        self.subprocess.Popen.side_effect = None
+        self.subprocess.Popen.return_value = proc
+        self.assertEqual(
+            neutron_netns.ip_batch(['link delete dev x'], 'qrouter-1'),
+            'Cannot find device "x"')
+        self.subprocess.Popen.assert_called_once_with(
+            ['ip', '-netns', 'qrouter-1', '-force', '-batch', '-'],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE)
+        proc.communicate.assert_called_once_with(b'link delete dev x\n')
+
+    def test_teardown_namespaces(self):
+        def del_ports(cmd):
+            # qr-aa is an OVS internal port, gone with its port
+            self.links['qrouter-1'] = self.links['qrouter-1'].replace(
+                b'2: qr-aa: <BROADCAST,MULTICAST,UP> mtu 1500\\    '
+                b'link/ether\n', b'')
+        self.subprocess.check_call.side_effect = del_ports
+        log = MagicMock()
+        self.assertEqual(neutron_netns.teardown_namespaces(
+            ['qrouter-1', 'qdhcp-2', 'qdhcp-gone'], workers=2, kill=True,
+            log=log), [])
+        neutron_netns.os.kill.assert_has_calls([
+            call(200, signal.SIGKILL),
+            call(100, signal.SIGKILL),
+            call(101, signal.SIGKILL)], any_order=True)
+        self.assertEqual(neutron_netns.os.kill.call_count, 3)
+        self.subprocess.check_call.assert_called_once_with(
+            ['ovs-vsctl',
+             '--', '--if-exists', 'del-port', 'qg-bb',
+             '--', '--if-exists', 'del-port', 'qr-aa',
+             '--', '--if-exists', 'del-port', 'tap-cc'])
+        self.assertEqual(sorted(self.batches[:-1]), [
+            (['ip', '-netns', 'qdhcp-2', '-force', '-batch', '-'],
+             ['link delete dev tap-cc']),
+            (['ip', '-netns', 'qrouter-1', '-force', '-batch', '-'],
+             ['link delete dev qg-bb']),
+        ])
+        self.assertEqual(self.batches[-1], (
+            ['ip', '-force', '-batch', '-'],
+            ['netns delete qdhcp-2', 'netns delete qrouter-1']))
+        self.assertEqual(neutron_netns.list_namespaces(), [])
+        self.assertFalse(log.called)
+
+    def test_teardown_namespaces_failures(self):
+        self.subprocess.check_call.side_effect = \
+            subprocess.CalledProcessError(1, 'ovs-vsctl')
+        failed = MagicMock(returncode=1)
+        failed.communicate.return_value = (b'', b'busy')
+        self.subprocess.Popen.side_effect = None
+        self.subprocess.Popen.return_value = failed
+        log = MagicMock()
+        self.assertEqual(neutron_netns.teardown_namespaces(
+            ['qrouter-1'], log=log), ['qrouter-1'])
+        self.assertFalse(neutron_netns.os.kill.called)
+        log.assert_has_calls([
+            call("Unable to delete OVS ports: Command 'ovs-vsctl' returned "
+                 "non-zero exit status 1."),
+            call('Unable to delete devices of namespace qrouter-1: busy'),
+            call('Unable to delete namespaces: busy')])
+
+    def test_teardown_no_namespaces(self):
+        self.assertEqual(neutron_netns.teardown_namespaces(['gone']), [])
+        self.assertFalse(self.subprocess.Popen.called)
@@ -0,0 +1,236 @@
+import json
+import uuid
+
+from unittest.mock import patch
+
+import charmhelpers.core.hookenv as hookenv
+import neutron_ovs
+from neutron_interfaces import Interface, InterfaceInventory
+
+from test_utils import (
+    CharmTestCase
+)
+
+TO_PATCH = [
+    'add_ovsbridge_linuxbridge',
+    'log',
+    'subprocess',
+]
+
+BR_UUID = '9a7d1aba-cd35-4a55-b5e4-6d3e1e2e5a01'
+PORT_UUID = '1f0e0c57-a0a5-4a2c-8f5c-4f3d1f4c6a02'
+IFACE_UUID = '5b7f9a1c-3e42-4d4e-9c5b-2a8e7d1b3c03'
+IPFIX_UUID = 'c2d4e6f8-1a3b-4c5d-8e7f-9a0b1c2d3e04'
+
+
+def _table(headings, *rows):
+    return json.dumps({'headings': headings, 'data': list(rows)})
+
+
+VSCTL_OUTPUT = '\n'.join([
+    _table(['_uuid', 'name', 'ports', 'external_ids', 'ipfix'],
+           [['uuid', BR_UUID], 'br-data', ['uuid', PORT_UUID],
+            ['map', [['charm-neutron-gateway', 'managed']]],
+            ['uuid', IPFIX_UUID]]),
+    _table(['_uuid', 'name', 'interfaces', 'external_ids'],
+           [['uuid', PORT_UUID], 'eth1', ['uuid', IFACE_UUID],
+            ['map', [['charm-neutron-gateway', 'br-data']]]]),
+    _table(['_uuid', 'name', 'type', 'options', 'external_ids'],
+           [['uuid', IFACE_UUID], 'eth1', '', ['map', []],
+            ['map', [['charm-neutron-gateway', 'br-data']]]]),
+    _table(['_uuid', 'targets', 'sampling', 'cache_active_timeout',
+            'cache_max_flows'],
+           [['uuid', IPFIX_UUID], '127.0.0.1:80', 64, 60, 128]),
+]) + '\n'
+
+
+def _inventory(**flags):
+    return InterfaceInventory([
+        Interface(name=name, index=index, hwaddr='', mtu=1500, physical=True,
+                  master=None, bond_master=None, bridge_member=False,
+                  linux_bridge=False, lower=[], flags=flags[name])
+        for index, name in enumerate(sorted(flags), 1)])
+
+
+def _patch_snapshot():
+    rows = {'Bridge': [], 'Port': [], 'Interface': []}
+
+    def add_port(bridge, name, peer=None):
+        iface = {'_uuid': 'i-' + name, 'name': name,
+                 'type': 'patch' if peer else '',
+                 'options': {'peer': peer} if peer else {}}
+        port = {'_uuid': 'p-' + name, 'name': name,
+                'interfaces': iface['_uuid']}
+        rows['Interface'].append(iface)
+        rows['Port'].append(port)
+        bridge['ports'].append(port['_uuid'])
+
+    br_int = {'_uuid': 'b-int', 'name': 'br-int', 'ports': []}
+    br_ex = {'_uuid': 'b-ex', 'name': 'br-ex', 'ports': []}
+    br_data = {'_uuid': 'b-data', 'name': 'br-data', 'ports': []}
+    rows['Bridge'].extend([br_int, br_ex, br_data])
+    add_port(br_int, 'int-br-ex', peer='phy-br-ex')
+    add_port(br_ex, 'phy-br-ex', peer='int-br-ex')
+    add_port(br_int, 'int-br-data', peer='phy-br-data')
+    add_port(br_data, 'phy-br-data', peer='int-br-data')
+    add_port(br_data, 'eth1')
+    # single element sets are presented as the bare element
+    br_ex['ports'] = br_ex['ports'][0]
+    return neutron_ovs.OVSDBSnapshot(rows)
+
+
+class TestNeutronOVS(CharmTestCase):
+
+    def setUp(self):
+        super(TestNeutronOVS, self).setUp(neutron_ovs, TO_PATCH)
+        self.subprocess.check_output.return_value = VSCTL_OUTPUT.encode()
+
+    def tearDown(self):
+        super(TestNeutronOVS, self).tearDown()
+        hookenv.cache = {}
+
+    def _desired(self, ipfix_target='127.0.0.1:80'):
+        desired = neutron_ovs.OVSDesiredState(ipfix_target=ipfix_target)
+        desired.add_bridge('br-data', {'charm-neutron-gateway': 'managed'})
+        desired.add_port('br-data', 'eth1',
+                         {'charm-neutron-gateway': 'br-data'},
+                         promisc=True, data_port=True)
+        return desired
+
+    def test_decode_ovsdb(self):
+        self.assertEqual(neutron_ovs.decode_ovsdb(['uuid', BR_UUID]),
+                         uuid.UUID(BR_UUID))
+        self.assertEqual(neutron_ovs.decode_ovsdb(['set', [1, 2]]), [1, 2])
+        self.assertEqual(neutron_ovs.decode_ovsdb(['map', [['a', 'b']]]),
+                         {'a': 'b'})
+        self.assertEqual(neutron_ovs.decode_ovsdb('br-ex'), 'br-ex')
+
+    def test_load_ovsdb_snapshot(self):
+        snapshot = neutron_ovs.load_ovsdb_snapshot()
+        self.subprocess.check_output.assert_called_once_with([
+            'ovs-vsctl', '--format=json',
+            '--', '--columns=_uuid,name,ports,external_ids,ipfix',
+            'list', 'Bridge',
+            '--', '--columns=_uuid,name,interfaces,external_ids',
+            'list', 'Port',
+            '--', '--columns=_uuid,name,type,options,external_ids',
+            'list', 'Interface',
+            '--', '--columns=_uuid,targets,sampling,cache_active_timeout,'
+            'cache_max_flows', 'list', 'IPFIX'])
+        self.assertEqual(snapshot.bridges_and_ports_map(),
+                         {'br-data': ['eth1']})
+        self.assertEqual(snapshot.port_bridges(), {'eth1': 'br-data'})
+        self.assertEqual(snapshot.ipfix('br-data')['targets'],
+                         '127.0.0.1:80')
+        self.assertEqual(snapshot.ipfix('br-missing'), None)
+
+    def test_snapshot_indexes(self):
+        snapshot = _patch_snapshot()
+        self.assertEqual(snapshot.uuid_for_port('eth1'), 'p-eth1')
+        self.assertEqual(snapshot.uuid_for_port('missing'), None)
+        self.assertEqual(snapshot.bridge_for_port('p-phy-br-ex'), 'br-ex')
+        self.assertEqual(snapshot.bridge_for_port('p-eth1'), 'br-data')
+        self.assertEqual(snapshot.bridge_for_port(None), None)
+        self.assertEqual(snapshot.port_for_interface('eth1')['name'], 'eth1')
+        self.assertEqual(snapshot.peer('int-br-ex'), 'phy-br-ex')
+        self.assertEqual(snapshot.peer('eth1'), None)
+
+    def test_patch_ports_on_bridge(self):
+        snapshot = _patch_snapshot()
+        self.assertEqual(snapshot.patch_ports_on_bridge('br-int'), [
+            neutron_ovs.Patch(
+                neutron_ovs.PatchPort('br-int', 'int-br-data'),
+                neutron_ovs.PatchPort('br-data', 'phy-br-data')),
+            neutron_ovs.Patch(
+                neutron_ovs.PatchPort('br-int', 'int-br-ex'),
+                neutron_ovs.PatchPort('br-ex', 'phy-br-ex')),
+        ])
+        self.assertEqual(snapshot.patch_ports_on_bridge('br-ex'), [
+            neutron_ovs.Patch(
+                neutron_ovs.PatchPort('br-ex', 'phy-br-ex'),
+                neutron_ovs.PatchPort('br-int', 'int-br-ex'))])
+        self.assertEqual(snapshot.patch_ports_on_bridge('br-tun'), [])
+
+    def test_patch_ports_on_bridge_missing_port(self):
+        snapshot = neutron_ovs.OVSDBSnapshot({'Interface': [
+            {'_uuid': 'i1', 'name': 'patch-tun', 'type': 'patch',
+             'options': {'peer': 'patch-int'}}]})
+        with self.assertRaises(ValueError):
+            snapshot.patch_ports_on_bridge('br-int')
+
+    @patch.object(neutron_ovs, 'load_ovsdb_snapshot')
+    def test_ovsdb_snapshot_cached(self, _load):
+        self.assertEqual(neutron_ovs.ovsdb_snapshot(), _load.return_value)
+        neutron_ovs.ovsdb_snapshot()
+        _load.assert_called_once_with()
+        neutron_ovs.apply_ovs_changes(neutron_ovs.OVSChangePlan())
+        neutron_ovs.ovsdb_snapshot()
+        self.assertEqual(_load.call_count, 1)
+        plan = neutron_ovs.OVSChangePlan()
+        plan.commands = [('del-br', 'br-tun')]
+        neutron_ovs.apply_ovs_changes(plan)
+        neutron_ovs.ovsdb_snapshot()
+        self.assertEqual(_load.call_count, 2)
+
+    def test_plan_no_changes(self):
+        snapshot = neutron_ovs.load_ovsdb_snapshot()
+        plan = neutron_ovs.plan_ovs_changes(
+            self._desired(), snapshot, _inventory(eth1=0x1103))
+        self.assertFalse(plan)
+        self.assertFalse(plan.data_ports_changed)
+        self.assertEqual(plan.describe(), [])
+
+    def test_plan_changes(self):
+        snapshot = neutron_ovs.load_ovsdb_snapshot()
+        desired = self._desired(ipfix_target=None)
+        desired.add_bridge('br-ex', {'charm-neutron-gateway': 'managed'})
+        desired.add_port('br-ex', 'eth2',
+                         {'charm-neutron-gateway': 'br-ex'}, promisc=False)
+        plan = neutron_ovs.plan_ovs_changes(
+            desired, snapshot, _inventory(eth1=0x1003, eth2=0))
+        self.assertEqual(plan.commands, [
+            ('--may-exist', 'add-br', 'br-ex'),
+            ('set', 'bridge', 'br-ex',
+             'external-ids:charm-neutron-gateway=managed'),
+            ('--may-exist', 'add-port', 'br-ex', 'eth2'),
+            ('set', 'Interface', 'eth2',
+             'external-ids:charm-neutron-gateway=br-ex'),
+            ('set', 'Port', 'eth2',
+             'external-ids:charm-neutron-gateway=br-ex'),
+            ('clear', 'Bridge', 'br-data', 'ipfix'),
+        ])
+        self.assertEqual(plan.links, [('eth1', 'promisc', 'on'),
+                                      ('eth2', 'up'),
+                                      ('eth2', 'promisc', 'off')])
+        # eth1 is already attached, eth2 is not a data port
+        self.assertFalse(plan.data_ports_changed)
+
+    def test_plan_empty_ovsdb(self):
+        plan = neutron_ovs.plan_ovs_changes(
+            self._desired(), neutron_ovs.OVSDBSnapshot({}), _inventory(eth1=0))
+        self.assertIn(('--may-exist', 'add-port', 'br-data', 'eth1'),
+                      plan.commands)
+        self.assertIn(('set', 'Bridge', 'br-data', 'ipfix=@ipfix0'),
+                      plan.commands)
+        self.assertTrue(plan.data_ports_changed)
+
+    def test_apply_ovs_changes(self):
+        plan = neutron_ovs.OVSChangePlan()
+        plan.commands = [('--may-exist', 'add-br', 'br-ex'),
+                         ('--may-exist', 'add-port', 'br-ex', 'eth2')]
+        plan.links = [('eth2', 'up')]
+        plan.linuxbridges = [('br-data', 'br-eth0', {'a': 'b'})]
+        neutron_ovs.apply_ovs_changes(plan)
+        self.subprocess.check_call.assert_has_calls([
+            ((['ovs-vsctl', '--', '--may-exist', 'add-br', 'br-ex',
+               '--', '--may-exist', 'add-port', 'br-ex', 'eth2'],),),
+            ((['ip', 'link', 'set', 'eth2', 'up'],),),
+        ])
+        self.assertEqual(self.subprocess.check_call.call_count, 2)
+        self.add_ovsbridge_linuxbridge.assert_called_once_with(
+            'br-data', 'br-eth0', ifdata={'external-ids': {'a': 'b'}},
+            portdata={'external-ids': {'a': 'b'}})
+
+    def test_apply_no_changes(self):
+        neutron_ovs.apply_ovs_changes(neutron_ovs.OVSChangePlan())
+        self.assertFalse(self.subprocess.check_call.called)
@@ -0,0 +1,222 @@
+import json
+import os
+import shutil
+import tempfile
+import uuid
+
+from unittest import mock
+
+import charmhelpers.contrib.network.ovs.ovsdb as ch_ovsdb
+import neutron_ovsdb
+
+from fake_ovsdb import FakeOVSDBServer
+from test_utils import (
+    CharmTestCase
+)
+
+TO_PATCH = [
+    'log',
+]
+
+
+class TestNativeOVSDB(CharmTestCase):
+
+    def setUp(self):
+        super(TestNativeOVSDB, self).setUp(neutron_ovsdb, TO_PATCH)
+        self.server = FakeOVSDBServer().start()
+        self.addCleanup(self.server.stop)
+        self.ctrl = self.server.insert('Controller', target='tcp:127.0.0.1')
+        self.iface = self.server.insert('Interface', name='patch-tun',
+                                        type='patch')
+        self.port = self.server.insert(
+            'Port', name='patch-tun',
+            interfaces=['uuid', self.iface],
+            external_ids=['map', [['charm', 'managed']]])
+        self.br = self.server.insert(
+            'Bridge', name='br-int', ports=['uuid', self.port],
+            controller=['uuid', self.ctrl],
+            external_ids=['map', [['charm', 'managed']]])
+        self.ovsdb = neutron_ovsdb.NativeOVSDB('ovs-vsctl',
+                                               path=self.server.path)
+        self.addCleanup(self.ovsdb.close)
+
+    def test_iter(self):
+        bridges = list(self.ovsdb.bridge)
+        self.assertEqual(len(bridges), 1)
+        self.assertEqual(bridges[0]['name'], 'br-int')
+        self.assertEqual(bridges[0]['_uuid'], uuid.UUID(self.br))
+        self.assertEqual(bridges[0]['ports'], uuid.UUID(self.port))
+        self.assertEqual(bridges[0]['external_ids'], {'charm': 'managed'})
+        self.assertEqual(bridges[0]['fail_mode'], [])
+        self.assertNotIn('_version', bridges[0])
+
+    def test_find(self):
+        self.server.insert('Bridge', name='br-ex')
+        self.assertEqual(
+            [b['name'] for b in self.ovsdb.bridge.find('name=br-ex')],
+            ['br-ex'])
+        self.assertEqual(
+            [b['name'] for b in self.ovsdb.bridge.find(
+                'external_ids:charm=managed')],
+            ['br-int'])
+        self.assertEqual(
+            [p['name'] for p in self.ovsdb.port.find('tag=[]')],
+            ['patch-tun'])
+        with self.assertRaises(ValueError):
+            list(self.ovsdb.bridge.find('name'))
+
+    def test_getitem(self):
+        self.assertEqual(self.ovsdb.bridge[self.br]['name'], 'br-int')
+        self.assertEqual(self.ovsdb.bridge['br-int']['_uuid'],
+                         uuid.UUID(self.br))
+        with self.assertRaises(KeyError):
+            self.ovsdb.bridge['br-missing']
+
+    def test_set(self):
+        self.ovsdb.bridge.set('br-int', 'fail_mode', 'secure')
+        self.ovsdb.bridge.set(self.br, 'external_ids:charm', 'unmanaged')
+        self.ovsdb.bridge.set(self.br, 'external_ids:other', '"x"')
+        bridge = self.ovsdb.bridge['br-int']
+        self.assertEqual(bridge['fail_mode'], 'secure')
+        self.assertEqual(bridge['external_ids'],
+                         {'charm': 'unmanaged', 'other': 'x'})
+        self.ovsdb.port.set('patch-tun', 'tag', '100')
+        self.assertEqual(self.ovsdb.port['patch-tun']['tag'], 100)
+
+    def test_clear(self):
+        self.ovsdb.bridge.clear(str(self.br), 'controller')
+        self.ovsdb.bridge.clear(str(self.br), 'external_ids')
+        bridge = self.ovsdb.bridge['br-int']
+        self.assertEqual(bridge['controller'], [])
+        self.assertEqual(bridge['external_ids'], {})
+
+    def test_remove(self):
+        self.ovsdb.bridge.remove(self.br, 'external_ids', 'charm')
+        self.assertEqual(self.ovsdb.bridge['br-int']['external_ids'], {})
+        self.ovsdb.bridge.remove(self.br, 'ports', self.port)
+        self.assertEqual(self.ovsdb.bridge['br-int']['ports'], [])
+
+    def test_unknown_table(self):
+        with self.assertRaises(AttributeError):
+            self.ovsdb.chassis
+        with self.assertRaises(AttributeError):
+            self.ovsdb.qos
+
+    def test_single_connection(self):
+        for _ in range(10):
+            list(self.ovsdb.bridge)
+            list(self.ovsdb.port.find('name=patch-tun'))
+        self.assertEqual(self.server.connections, 1)
+        # schema is only fetched once
+        self.assertEqual(self.server.requests, 21)
+
+    def test_transact_error(self):
+        with self.assertRaises(neutron_ovsdb.OVSDBError):
+            self.ovsdb.connection.transact(
+                'Open_vSwitch', {'op': 'select', 'table': 'Missing',
+                                 'where': []})
+
+    def test_monitor(self):
+        conn = self.ovsdb.connection
+        initial = conn.monitor('Open_vSwitch', 'mon',
+                               {'Bridge': {'columns': ['name']}})
+        self.assertEqual(initial['Bridge'][self.br],
+                         {'new': {'name': 'br-int'}})
+        other = neutron_ovsdb.NativeOVSDB('ovs-vsctl', path=self.server.path)
+        self.addCleanup(other.close)
+        other.bridge.set('br-int', 'name', 'br-renamed')
+        # the reply to this request arrives after the update notification
+        conn.call('echo', 'ping')
+        self.assertEqual(conn.poll(), [
+            ('update', ['mon', {'Bridge': {self.br: {
+                'old': {'name': 'br-int'},
+                'new': {'name': 'br-renamed'}}}}])])
+        self.assertEqual(conn.poll(), [])
+        conn.monitor_cancel('mon')
+
+    def test_echo_from_server(self):
+        conn = self.ovsdb.connection
+        self.assertEqual(conn.call('echo', 'x'), ['x'])
+        handler = self.server.handlers[0]
+        handler.send({'method': 'echo', 'params': ['hi'], 'id': 'e1'})
+        self.assertEqual(conn.call('echo', 'y'), ['y'])
+        self.assertEqual(conn.poll(), [])
+
+    def test_multibyte_split_across_reads(self):
+        conn = neutron_ovsdb.OVSDBConnection(path=self.server.path)
+        data = '{"id": 1, "result": ["caf\u00e9"], "error": null}'.encode(
+            'UTF-8')
+        split = data.index(b'\xa9')
+        conn._sock = mock.MagicMock()
+        conn._sock.recv.side_effect = [data[:split], data[split:]]
+        self.assertEqual(conn.call('echo', 'x'), ['caf\u00e9'])
+
+    def test_messages_split_across_reads(self):
+        conn = neutron_ovsdb.OVSDBConnection(path=self.server.path)
+        conn._sock = mock.MagicMock()
+        update = {'method': 'update',
+                  'params': ['mon', {'name': 'br-{x}"\\[', 'tag': [1]}],
+                  'id': None}
+        result = ['}{"\\']
+
+        def data(request_id):
+            reply = {'id': request_id, 'result': result, 'error': None}
+            text = ' {}\n{} '.format(json.dumps(update), json.dumps(reply))
+            return text.encode('UTF-8')
+        # one byte per read, splitting every escape and delimiter
+        conn._sock.recv.side_effect = [bytes([b]) for b in data(1)]
+        self.assertEqual(conn.call('echo', 'x'), result)
+        self.assertEqual(conn.updates, [('update', update['params'])])
+        # and all in a single read
+        conn._sock.recv.side_effect = [data(2)]
+        self.assertEqual(conn.call('echo', 'x'), result)
+        self.assertEqual(conn.updates, [('update', update['params'])] * 2)
+
+
+class TestSimpleOVSDB(CharmTestCase):
+
+    def setUp(self):
+        super(TestSimpleOVSDB, self).setUp(neutron_ovsdb, TO_PATCH)
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def test_cli_when_socket_missing(self):
+        path = os.path.join(self.tmp, 'db.sock')
+        ovsdb = neutron_ovsdb.simple_ovsdb(path=path)
+        self.assertIs(type(ovsdb), ch_ovsdb.SimpleOVSDB)
+
+    def test_cli_for_ovn_tools(self):
+        server = FakeOVSDBServer(os.path.join(self.tmp, 'db.sock')).start()
+        self.addCleanup(server.stop)
+        ovsdb = neutron_ovsdb.simple_ovsdb('ovn-nbctl', path=server.path)
+        self.assertIs(type(ovsdb), ch_ovsdb.SimpleOVSDB)
+
+    def test_cli_requested(self):
+        ovsdb = neutron_ovsdb.simple_ovsdb(
+            backend=neutron_ovsdb.BACKEND_CLI, path=self.tmp)
+        self.assertIs(type(ovsdb), ch_ovsdb.SimpleOVSDB)
+
+    def test_native(self):
+        server = FakeOVSDBServer(os.path.join(self.tmp, 'db.sock')).start()
+        self.addCleanup(server.stop)
+        ovsdb = neutron_ovsdb.simple_ovsdb(path=server.path)
+        self.addCleanup(ovsdb.close)
+        self.assertIsInstance(ovsdb, neutron_ovsdb.NativeOVSDB)
+        self.assertEqual(list(ovsdb.bridge), [])
+
+    def test_native_unreachable(self):
+        path = os.path.join(self.tmp, 'db.sock')
+        open(path, 'w').close()
+        ovsdb = neutron_ovsdb.simple_ovsdb(path=path)
+        self.assertIs(type(ovsdb), ch_ovsdb.SimpleOVSDB)
+        self.assertTrue(self.log.called)
+        with self.assertRaises(OSError):
+            neutron_ovsdb.simple_ovsdb(backend=neutron_ovsdb.BACKEND_NATIVE,
+                                       path=path)
+
+    @mock.patch.object(neutron_ovsdb.ch_ovsdb.utils, '_run')
+    def test_cli_table_api_unchanged(self, _run):
+        _run.return_value = '{"headings": ["name"], "data": [["br-int"]]}'
+        ovsdb = neutron_ovsdb.simple_ovsdb(
+            backend=neutron_ovsdb.BACKEND_CLI)
+        self.assertEqual(list(ovsdb.bridge), [{'name': 'br-int'}])
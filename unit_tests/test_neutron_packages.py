@@ -0,0 +1,132 @@
+import os
+import shutil
+import tempfile
+
+from unittest.mock import MagicMock
+
+import charmhelpers.contrib.openstack.utils as os_utils
+import charmhelpers.core.unitdata as unitdata
+import charmhelpers.fetch as fetch
+import neutron_packages
+import neutron_patch
+
+from test_utils import (
+    CharmTestCase
+)
+
+TO_PATCH = [
+    'log',
+]
+
+INSTALLED = {
+    'neutron-common': '2:16.0.0-0ubuntu1',
+    'openstack-release': '2020.1',
+}
+
+
+class TestPackageCache(CharmTestCase):
+
+    def setUp(self):
+        super(TestPackageCache, self).setUp(neutron_packages, TO_PATCH)
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.status = os.path.join(self.tmp, 'status')
+        self._dpkg_change('initial')
+        self.patch_object(neutron_packages, 'DPKG_STATUS', new=self.status)
+        self.kv = unitdata.Storage(':memory:')
+        self.patch_object(neutron_packages.unitdata, 'kv',
+                          name='unit_kv', return_value=self.kv)
+        self.apt = MagicMock()
+        self.apt.dpkg_list.side_effect = lambda packages: {
+            p: {'name': p, 'version': INSTALLED[p]}
+            for p in packages if p in INSTALLED}
+        self.patch_object(neutron_packages.fetch, 'apt_cache',
+                          return_value=self.apt)
+        self.patch_object(neutron_packages.os_utils,
+                          'snap_install_requested', return_value=False)
+        self.codename = MagicMock(return_value='ussuri')
+        self.cache = neutron_packages.PackageCache(self.codename)
+
+    def _dpkg_change(self, content):
+        with open(self.status, 'a') as f:
+            f.write(content)
+
+    def test_installed_versions(self):
+        self.assertEqual(
+            self.cache.installed_versions(['neutron-common', 'missing']),
+            {'neutron-common': '2:16.0.0-0ubuntu1', 'missing': None})
+        self.apt.dpkg_list.assert_called_once_with(
+            ['missing', 'neutron-common'])
+        self.assertEqual(
+            self.cache.installed_versions(['missing', 'openstack-release']),
+            {'missing': None, 'openstack-release': '2020.1'})
+        self.apt.dpkg_list.assert_called_with(['openstack-release'])
+        self.assertEqual(self.apt.dpkg_list.call_count, 2)
+
+    def test_persisted(self):
+        self.cache.installed_versions(['neutron-common'])
+        self.cache.get_os_codename_package('neutron-common')
+        cache = neutron_packages.PackageCache(self.codename)
+        self.assertEqual(cache.get_upstream_version('neutron-common'),
+                         '16.0.0')
+        self.assertEqual(cache.get_os_codename_package('neutron-common'),
+                         'ussuri')
+        self.assertEqual(self.apt.dpkg_list.call_count, 1)
+        self.codename.assert_called_once_with('neutron-common', fatal=True)
+
+    def test_dpkg_change(self):
+        self.cache.installed_versions(['neutron-common'])
+        self.cache.get_os_codename_package('neutron-common', fatal=False)
+        self._dpkg_change('upgraded')
+        self.cache.installed_versions(['neutron-common'])
+        self.cache.get_os_codename_package('neutron-common', fatal=False)
+        self.assertEqual(self.apt.dpkg_list.call_count, 2)
+        self.assertEqual(self.codename.call_count, 2)
+
+    def test_no_dpkg_status(self):
+        os.unlink(self.status)
+        self.cache.installed_versions(['neutron-common'])
+        self.cache.installed_versions(['neutron-common'])
+        self.assertEqual(self.apt.dpkg_list.call_count, 2)
+        self.assertIsNone(self.kv.get(neutron_packages.CACHE_KEY))
+
+    def test_codename_after_install(self):
+        # the lookup installs openstack-release
+        self.codename.side_effect = lambda *a, **k: (
+            self._dpkg_change('openstack-release') or 'ussuri')
+        self.cache.get_os_codename_package('neutron-common')
+        self.cache.get_os_codename_package('neutron-common')
+        self.codename.assert_called_once_with('neutron-common', fatal=True)
+
+    def test_snap_not_cached(self):
+        neutron_packages.os_utils.snap_install_requested.return_value = True
+        self.cache.get_os_codename_package('neutron-common')
+        self.cache.get_os_codename_package('neutron-common')
+        self.assertEqual(self.codename.call_count, 2)
+
+    def test_filters(self):
+        packages = ['neutron-common', 'missing']
+        self.assertEqual(self.cache.filter_installed_packages(packages),
+                         ['missing'])
+        self.assertEqual(self.cache.filter_missing_packages(packages),
+                         ['neutron-common'])
+        self.assertIsNone(self.cache.get_upstream_version('missing'))
+        self.assertEqual(self.apt.dpkg_list.call_count, 1)
+
+    def test_install(self):
+        import neutron_utils
+        self.addCleanup(neutron_patch.restore, neutron_patch.references(
+            [fetch.filter_installed_packages, fetch.filter_missing_packages,
+             fetch.get_upstream_version, os_utils.get_os_codename_package],
+            neutron_packages.REPLACED))
+        original = os_utils.get_os_codename_package
+        self.patch_object(neutron_packages, '_cache', new=None)
+        cache = neutron_packages.install()
+        self.assertIs(cache.original_codename, original)
+        self.assertEqual(os_utils.get_os_codename_package,
+                         cache.get_os_codename_package)
+        self.assertEqual(neutron_utils.filter_missing_packages,
+                         cache.filter_missing_packages)
+        self.assertEqual(fetch.get_upstream_version,
+                         cache.get_upstream_version)
+        self.assertIs(neutron_packages.install(), cache)
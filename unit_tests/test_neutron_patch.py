@@ -0,0 +1,74 @@
+import sys
+import types
+
+from unittest.mock import MagicMock
+
+import neutron_patch
+
+from test_utils import (
+    CharmTestCase
+)
+
+TO_PATCH = []
+
+
+def original():
+    pass
+
+
+def other():
+    pass
+
+
+class LazyModule(types.ModuleType):
+
+    def __getattr__(self, name):
+        raise ImportError(name)
+
+
+class TestPatch(CharmTestCase):
+
+    def setUp(self):
+        super(TestPatch, self).setUp(neutron_patch, TO_PATCH)
+        self.by_name = self._module('test_patch_by_name', func=original)
+        self.alias = self._module('test_patch_alias', alias=original)
+        self.unrelated = self._module('test_patch_unrelated', func=other)
+        self.lazy = self._module('test_patch_lazy', cls=LazyModule)
+        # Not a module, e.g. a mocked out dependency
+        self._add('test_patch_mock', MagicMock())
+        self._add('test_patch_none', None)
+
+    def _add(self, name, module):
+        sys.modules[name] = module
+        self.addCleanup(sys.modules.pop, name)
+
+    def _module(self, name, cls=types.ModuleType, **attrs):
+        module = cls(name)
+        vars(module).update(attrs)
+        self._add(name, module)
+        return module
+
+    def test_references(self):
+        self.assertEqual(neutron_patch.references([original], ['func']),
+                         [(self.by_name, 'func', original)])
+        found = neutron_patch.references([original, other],
+                                         ['func', 'alias'])
+        self.assertIn((self.alias, 'alias', original), found)
+        self.assertIn((self.unrelated, 'func', other), found)
+        self.assertEqual(len(found), 3)
+
+    def test_replace_restore(self):
+        found = neutron_patch.references([original], ['func', 'alias'])
+        replacements = []
+
+        def replacement(name, func):
+            replacements.append((name, func))
+            return other
+        neutron_patch.replace(found, replacement)
+        self.assertIs(self.by_name.func, other)
+        self.assertIs(self.alias.alias, other)
+        self.assertEqual(sorted(replacements),
+                         [('alias', original), ('func', original)])
+        neutron_patch.restore(found)
+        self.assertIs(self.by_name.func, original)
+        self.assertIs(self.alias.alias, original)
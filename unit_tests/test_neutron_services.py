@@ -0,0 +1,141 @@
+import datetime
+import subprocess
+
+from unittest.mock import MagicMock
+
+import charmhelpers.contrib.openstack.utils as os_utils
+import neutron_services
+from neutron_services import ServiceState
+
+from test_utils import (
+    CharmTestCase
+)
+
+TO_PATCH = [
+    'log',
+]
+
+SHOW_OUTPUT = """\
+ActiveState=active
+SubState=running
+ActiveEnterTimestamp=Sun 2026-10-18 10:00:00 UTC
+
+ActiveState=failed
+SubState=failed
+ActiveEnterTimestamp=
+
+"""
+
+
+class TestServiceStates(CharmTestCase):
+
+    def setUp(self):
+        super(TestServiceStates, self).setUp(neutron_services, TO_PATCH)
+        self.patch_object(neutron_services.host, 'init_is_systemd',
+                          return_value=True)
+        self.patch_object(neutron_services.host, 'service_running')
+        self.patch_object(neutron_services.subprocess, 'check_output',
+                          return_value=SHOW_OUTPUT)
+
+    def test_parse_show(self):
+        self.assertEqual(
+            neutron_services.parse_show(SHOW_OUTPUT, ['s1', 's2', 's3']),
+            {'s1': ServiceState('active', 'running',
+                                'Sun 2026-10-18 10:00:00 UTC'),
+             's2': ServiceState('failed', 'failed', ''),
+             's3': neutron_services.UNKNOWN})
+
+    def test_service_state(self):
+        state = ServiceState('active', 'running',
+                             'Sun 2026-10-18 10:00:00 UTC')
+        self.assertTrue(state.running)
+        self.assertEqual(state.started(),
+                         datetime.datetime(2026, 10, 18, 10, 0, 0))
+        state = ServiceState('activating', 'start', 'n/a')
+        self.assertFalse(state.running)
+        self.assertIsNone(state.started())
+        self.assertIsNone(neutron_services.UNKNOWN.started())
+
+    def test_service_states(self):
+        states = neutron_services.service_states(['s1', 's2'])
+        self.assertTrue(states['s1'].running)
+        self.assertFalse(states['s2'].running)
+        self.check_output.assert_called_once_with(
+            ['systemctl', 'show',
+             '--property=ActiveState,SubState,ActiveEnterTimestamp',
+             '--', 's1', 's2'],
+            universal_newlines=True)
+        self.assertEqual(neutron_services.service_states([]), {})
+        self.assertEqual(self.check_output.call_count, 1)
+
+    def test_service_states_error(self):
+        self.check_output.side_effect = subprocess.CalledProcessError(
+            1, 'systemctl', output='')
+        self.assertEqual(neutron_services.service_states(['s1']),
+                         {'s1': neutron_services.UNKNOWN})
+        self.assertTrue(self.log.called)
+
+    def test_service_states_not_systemd(self):
+        self.init_is_systemd.return_value = False
+        self.service_running.side_effect = lambda s: s == 's1'
+        states = neutron_services.service_states(['s1', 's2'])
+        self.assertTrue(states['s1'].running)
+        self.assertFalse(states['s2'].running)
+        self.assertFalse(self.check_output.called)
+
+    def test_batched_service_checks(self):
+        original = os_utils.service_running
+        with neutron_services.batched_service_checks(['s1', 's2']) as states:
+            self.assertEqual(sorted(states), ['s1', 's2'])
+            self.assertEqual(
+                os_utils._check_running_services(['s1', 's2']),
+                ([('s1', True), ('s2', False)], [True, False]))
+        self.assertIs(os_utils.service_running, original)
+        self.assertEqual(self.check_output.call_count, 1)
+
+
+class TestCheckRestartTimestamps(CharmTestCase):
+
+    def setUp(self):
+        super(TestCheckRestartTimestamps, self).setUp(neutron_services,
+                                                      TO_PATCH)
+        self.patch_object(neutron_services.host, 'init_is_systemd',
+                          return_value=True)
+        self.patch_object(neutron_services, 'service_states')
+        self.patch_object(neutron_services.deferred_events,
+                          'get_deferred_restarts')
+        self.patch_object(neutron_services.deferred_events,
+                          'clear_deferred_restarts')
+
+    def _event(self, service, timestamp):
+        return MagicMock(service=service, timestamp=timestamp)
+
+    def test_check_restart_timestamps(self):
+        requested = datetime.datetime(2026, 10, 18, 12, 0, 0)
+        self.get_deferred_restarts.return_value = [
+            self._event('s1', requested.timestamp()),
+            self._event('s2', requested.timestamp()),
+            self._event('s3', requested.timestamp())]
+        self.get_deferred_restarts.return_value.append(
+            self._event('s4', requested.timestamp()))
+        self.service_states.return_value = {
+            's1': ServiceState('active', 'running',
+                               'Sun 2026-10-18 10:00:00 UTC'),
+            's2': ServiceState('active', 'running',
+                               'Sun 2026-10-18 13:00:00 UTC'),
+            's3': ServiceState('inactive', 'dead', ''),
+            's4': ServiceState('failed', 'failed',
+                               'Sun 2026-10-18 13:00:00 UTC')}
+        neutron_services.check_restart_timestamps()
+        self.service_states.assert_called_once_with(['s1', 's2', 's3', 's4'])
+        self.clear_deferred_restarts.assert_called_once_with(['s2'])
+
+    def test_check_restart_timestamps_nothing_deferred(self):
+        self.get_deferred_restarts.return_value = []
+        neutron_services.check_restart_timestamps()
+        self.assertFalse(self.service_states.called)
+
+    def test_check_restart_timestamps_not_systemd(self):
+        self.init_is_systemd.return_value = False
+        neutron_services.check_restart_timestamps()
+        self.assertFalse(self.get_deferred_restarts.called)
@@ -0,0 +1,528 @@
+import os
+import shutil
+import stat
+import tempfile
+
+from unittest.mock import Mock, call, patch
+
+import charmhelpers.contrib.openstack.context as context
+import neutron_templating
+
+from test_utils import (
+    CharmTestCase
+)
+
+TO_PATCH = [
+    'log',
+]
+
+
+class CountingContext(context.OSContextGenerator):
+
+    calls = 0
+
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+        self.interfaces = [name]
+
+    def __call__(self):
+        CountingContext.calls += 1
+        return {self.name: self.value}
+
+
+class MTUContext(context.OSContextGenerator):
+    '''Context reading an interface it does not declare.'''
+
+    def __init__(self):
+        self.value = 1500
+
+    def __call__(self):
+        return {'dhcp': self.value}
+
+
+class TestNeutronConfigRenderer(CharmTestCase):
+
+    def setUp(self):
+        super(TestNeutronConfigRenderer, self).setUp(neutron_templating,
+                                                     TO_PATCH)
+        self.patch_object(neutron_templating.templating, 'log')
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.templates = os.path.join(self.tmp, 'templates')
+        os.mkdir(self.templates)
+        for name in ('a.conf', 'b.conf', 'c.conf'):
+            with open(os.path.join(self.templates, name), 'w') as f:
+                f.write('{{ gw }} {{ dhcp }}\n')
+        CountingContext.calls = 0
+        self.renderer = neutron_templating.NeutronConfigRenderer(
+            templates_dir=self.templates, openstack_release='ussuri')
+
+    def _path(self, name):
+        return os.path.join(self.tmp, name)
+
+    def _register(self):
+        for name in ('a.conf', 'b.conf', 'c.conf'):
+            self.renderer.register(self._path(name),
+                                   [CountingContext('gw', 1),
+                                    CountingContext('dhcp', 2)])
+
+    def test_write_all_evaluates_contexts_once(self):
+        self._register()
+        self.renderer.write_all()
+        self.assertEqual(CountingContext.calls, 2)
+        for name in ('a.conf', 'b.conf', 'c.conf'):
+            with open(self._path(name)) as f:
+                self.assertEqual(f.read(), '1 2')
+        # results do not outlive write_all
+        self.renderer.write_all()
+        self.assertEqual(CountingContext.calls, 4)
+
+    def test_write_does_not_cache(self):
+        self._register()
+        self.renderer.write(self._path('a.conf'))
+        self.renderer.write(self._path('b.conf'))
+        self.assertEqual(CountingContext.calls, 4)
+
+    def test_distinct_arguments_not_shared(self):
+        self.renderer.register(self._path('a.conf'),
+                               [CountingContext('gw', 1)])
+        self.renderer.register(self._path('b.conf'),
+                               [CountingContext('gw', 3)])
+        self.renderer.write_all()
+        self.assertEqual(CountingContext.calls, 2)
+        with open(self._path('b.conf')) as f:
+            self.assertEqual(f.read(), '3 ')
+
+    @patch.object(context, 'relation_ids')
+    def test_complete_contexts(self, _relation_ids):
+        _relation_ids.return_value = []
+        self._register()
+        self.assertEqual(set(self.renderer.complete_contexts()),
+                         {'dhcp', 'gw'})
+        self.assertEqual(CountingContext.calls, 2)
+        self.assertEqual(
+            self.renderer.get_incomplete_context_data(['gw']),
+            {'gw': {'related': False}})
+
+    @patch.object(neutron_templating.templating.OSConfigRenderer, 'write')
+    def test_nested_cache(self, _write):
+        with self.renderer.evaluation_cache():
+            cache = self.renderer.context_cache
+            self.renderer.write_all()
+            self.assertIs(self.renderer.context_cache, cache)
+        self.assertIsNone(self.renderer.context_cache)
+
+    def _read(self, name):
+        with open(self._path(name)) as f:
+            return f.read()
+
+    def _register_graph(self):
+        gw = CountingContext('gw', 1)
+        dhcp = CountingContext('dhcp', 2)
+        mtu = MTUContext()
+        self.renderer.context_relations = {MTUContext: ['dhcp']}
+        self.renderer.register(self._path('a.conf'), [gw])
+        self.renderer.register(self._path('b.conf'), [dhcp])
+        self.renderer.register(self._path('c.conf'), [gw, mtu])
+        return gw, dhcp, mtu
+
+    def test_files_for(self):
+        self._register_graph()
+        self.assertEqual(self.renderer.files_for(['dhcp']),
+                         [self._path('b.conf'), self._path('c.conf')])
+        self.assertEqual(self.renderer.files_for(['gw', 'amqp']),
+                         [self._path('a.conf'), self._path('c.conf')])
+        self.assertEqual(self.renderer.files_for(['amqp']), [])
+
+    def test_write_for(self):
+        self._register_graph()
+        self.renderer.write_for(['dhcp'])
+        # gw is evaluated once, for c.conf
+        self.assertEqual(CountingContext.calls, 2)
+        self.assertFalse(os.path.exists(self._path('a.conf')))
+        self.assertEqual(self._read('b.conf'), ' 2')
+        self.assertEqual(self._read('c.conf'), '1 1500')
+
+    def test_write_for_matches_write_all(self):
+        gw, dhcp, mtu = self._register_graph()
+        self.renderer.write_all()
+        dhcp.value = 3
+        mtu.value = 9000
+        self.renderer.write_for(['dhcp'])
+        rendered = {name: self._read(name)
+                    for name in ('a.conf', 'b.conf', 'c.conf')}
+        written = len(neutron_templating._written)
+        self.renderer.write_all()
+        # write_all finds nothing left to write
+        self.assertEqual(len(neutron_templating._written), written)
+        self.assertEqual(rendered, {'a.conf': '1 ', 'b.conf': ' 3',
+                                    'c.conf': '1 9000'})
+
+    def test_write_skips_unchanged(self):
+        self._register()
+        self.renderer.write_all()
+        path = self._path('a.conf')
+        st = os.stat(path)
+        written = len(neutron_templating._written)
+        with patch.object(neutron_templating, 'write_atomic') as _write:
+            self.renderer.write_all()
+            self.assertFalse(_write.called)
+        self.assertEqual(os.stat(path), st)
+        self.assertEqual(len(neutron_templating._written), written)
+
+    def test_write_changed(self):
+        self._register()
+        path = self._path('a.conf')
+        with open(path, 'w') as f:
+            f.write('old')
+        os.chmod(path, 0o640)
+        inode = os.stat(path).st_ino
+        self.renderer.write(path)
+        with open(path) as f:
+            self.assertEqual(f.read(), '1 2')
+        st = os.stat(path)
+        self.assertNotEqual(st.st_ino, inode)
+        self.assertEqual(stat.S_IMODE(st.st_mode), 0o640)
+        self.assertEqual(neutron_templating._written[-1], (path, b'old'))
+        self.assertEqual(sorted(os.listdir(self.tmp)), ['a.conf', 'templates'])
+
+    def test_write_follows_symlink(self):
+        self._register()
+        target = self._path('target.conf')
+        open(target, 'w').close()
+        os.symlink(target, self._path('a.conf'))
+        self.renderer.write(self._path('a.conf'))
+        self.assertTrue(os.path.islink(self._path('a.conf')))
+        with open(target) as f:
+            self.assertEqual(f.read(), '1 2')
+
+    def test_write_failure_keeps_file(self):
+        self._register()
+        path = self._path('a.conf')
+        with open(path, 'w') as f:
+            f.write('old')
+        with patch.object(neutron_templating.os, 'rename',
+                          side_effect=OSError):
+            with self.assertRaises(OSError):
+                self.renderer.write(path)
+        with open(path) as f:
+            self.assertEqual(f.read(), 'old')
+        self.assertEqual(sorted(os.listdir(self.tmp)), ['a.conf', 'templates'])
+
+    def test_write_unregistered(self):
+        with self.assertRaises(
+                neutron_templating.templating.OSConfigException):
+            self.renderer.write(self._path('a.conf'))
+
+    def test_file_digest_cached(self):
+        path = self._path('a.conf')
+        self.assertIsNone(neutron_templating.file_digest(path))
+        with open(path, 'w') as f:
+            f.write('x')
+        digest = neutron_templating.file_digest(path)
+        with patch('builtins.open') as _open:
+            self.assertEqual(neutron_templating.file_digest(path), digest)
+            self.assertFalse(_open.called)
+        with open(path, 'w') as f:
+            f.write('yy')
+        self.assertNotEqual(neutron_templating.file_digest(path), digest)
+
+
+class TestRestartOnChange(CharmTestCase):
+
+    def setUp(self):
+        super(TestRestartOnChange, self).setUp(neutron_templating, TO_PATCH)
+        self.patch_object(neutron_templating.os_utils, 'is_unit_paused_set',
+                          return_value=False)
+        self.patch_object(neutron_templating.host, 'service')
+        self.patch_object(neutron_templating.host, 'path_hash',
+                          side_effect=self._path_hash)
+        self.hashes = {}
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        templates = os.path.join(self.tmp, 'templates')
+        os.mkdir(templates)
+        for name in ('a.conf', 'b.conf'):
+            with open(os.path.join(templates, name), 'w') as f:
+                f.write('{{ gw }}\n')
+        with open(os.path.join(templates, 'c.ini'), 'w') as f:
+            f.write('# {{ note }}\n[DEFAULT]\ngw = {{ gw }}\n')
+        self.renderer = neutron_templating.NeutronConfigRenderer(
+            templates_dir=templates, openstack_release='ussuri')
+        self.a = os.path.join(self.tmp, 'a.conf')
+        self.b = os.path.join(self.tmp, 'b.conf')
+        self.other = os.path.join(self.tmp, 'other')
+        self.gw = CountingContext('gw', 1)
+        self.renderer.register(self.a, [self.gw])
+        self.renderer.register(self.b, [self.gw])
+        self.c = os.path.join(self.tmp, 'c.ini')
+        self.note = CountingContext('note', 'x')
+        self.renderer.register(self.c, [self.gw, self.note])
+        self.restart_map = {
+            self.a: ['svc-a', 'svc-common'],
+            self.b: ['svc-b', 'svc-common'],
+            self.c: ['svc-c'],
+            self.other: ['svc-other'],
+        }
+
+    def _path_hash(self, path):
+        return self.hashes.get(path)
+
+    def _hook(self, *paths, **kwargs):
+        @neutron_templating.restart_on_change(lambda: self.restart_map,
+                                              **kwargs)
+        def hook():
+            for path in paths:
+                if path in self.renderer.templates:
+                    self.renderer.write(path)
+                else:
+                    self.hashes[path] = 'changed'
+            return 'result'
+        return hook()
+
+    def test_restarts_written(self):
+        self.assertEqual(self._hook(self.a, self.other), 'result')
+        self.service.assert_has_calls([
+            call('restart', 'svc-a'),
+            call('restart', 'svc-common'),
+            call('restart', 'svc-other')])
+        self.assertEqual(self.service.call_count, 3)
+        # only the file not managed by the renderer is hashed
+        self.path_hash.assert_has_calls([call(self.other), call(self.other)])
+        self.assertEqual(self.path_hash.call_count, 2)
+
+    def test_unchanged_no_restart(self):
+        self._hook(self.a, self.b)
+        self.service.reset_mock()
+        self._hook(self.a, self.b)
+        self.assertFalse(self.service.called)
+
+    def test_paused(self):
+        self.is_unit_paused_set.return_value = True
+        self._hook(self.a)
+        self.assertFalse(self.service.called)
+        self.assertFalse(self.path_hash.called)
+
+    def test_deferred(self):
+        can_restart = Mock(side_effect=lambda svc, files: svc != 'svc-b')
+        post_restart = Mock()
+
+        @neutron_templating.restart_on_change(
+            self.restart_map, stopstart=True, can_restart_now_f=can_restart,
+            post_svc_restart_f=post_restart)
+        def hook():
+            self.renderer.write(self.b)
+        hook()
+        can_restart.assert_has_calls([call('svc-b', [self.b]),
+                                      call('svc-common', [self.b])])
+        self.service.assert_has_calls([call('stop', 'svc-common'),
+                                       call('start', 'svc-common')])
+        self.assertEqual(self.service.call_count, 2)
+        post_restart.assert_called_once_with('svc-common')
+
+    def test_option_diff(self):
+        self._hook(self.c)
+        self.service.reset_mock()
+        self.note.value = 'y'
+        self._hook(self.c, option_diff_paths=lambda: [self.c])
+        self.assertFalse(self.service.called)
+        self.assertTrue(self.log.called)
+        self.note.value = 'z'
+        self._hook(self.c)
+        self.service.assert_called_once_with('restart', 'svc-c')
+        self.service.reset_mock()
+        self.gw.value = 2
+        self._hook(self.c, option_diff_paths=[self.c])
+        self.service.assert_called_once_with('restart', 'svc-c')
+
+    def test_option_diff_new_file(self):
+        self._hook(self.c, option_diff_paths=[self.c])
+        self.service.assert_called_once_with('restart', 'svc-c')
+
+    def test_option_diff_first_content(self):
+        # a file written twice is compared with its content before the hook
+        self._hook(self.c)
+        self.service.reset_mock()
+
+        @neutron_templating.restart_on_change(self.restart_map,
+                                              option_diff_paths=[self.c])
+        def hook():
+            self.gw.value = 2
+            self.renderer.write(self.c)
+            self.gw.value = 1
+            self.note.value = 'y'
+            self.renderer.write(self.c)
+        hook()
+        self.assertFalse(self.service.called)
+
+    def test_service_sections(self):
+        self.restart_map[self.c] = ['svc-c', 'svc-agent']
+        sections = {'svc-agent': {self.c: {'agent'}}}
+        self._hook(self.c)
+        self.service.reset_mock()
+        self.gw.value = 2
+        self._hook(self.c, self.a, option_diff_paths=[self.c],
+                   service_sections=lambda: sections)
+        self.service.assert_has_calls([call('restart', 'svc-a'),
+                                       call('restart', 'svc-common'),
+                                       call('restart', 'svc-c')],
+                                      any_order=True)
+        self.assertEqual(self.service.call_count, 3)
+        self.service.reset_mock()
+        sections['svc-agent'][self.c] = {'default'}
+        self.gw.value = 3
+        self._hook(self.c, option_diff_paths=[self.c],
+                   service_sections=sections)
+        self.service.assert_has_calls([call('restart', 'svc-c'),
+                                       call('restart', 'svc-agent')],
+                                      any_order=True)
+        self.assertEqual(self.service.call_count, 2)
+
+    def _reload_hook(self, **kwargs):
+        self._hook(self.c)
+        self.service.reset_mock()
+        self.gw.value = 2
+        reload_options = {'svc-c': {self.c: {('DEFAULT', 'gw')}}}
+        self._hook(self.c, reload_options=lambda: reload_options, **kwargs)
+
+    def test_reload(self):
+        post_restart = Mock()
+        self._reload_hook(post_svc_restart_f=post_restart)
+        self.service.assert_called_once_with('reload', 'svc-c')
+        self.assertFalse(post_restart.called)
+
+    def test_reload_failed(self):
+        self.service.side_effect = lambda action, svc: action != 'reload'
+        self.patch_object(neutron_templating.host, 'init_is_systemd',
+                          return_value=False)
+        post_restart = Mock()
+        self._reload_hook(post_svc_restart_f=post_restart)
+        self.service.assert_has_calls([call('reload', 'svc-c'),
+                                       call('restart', 'svc-c')])
+        post_restart.assert_called_once_with('svc-c')
+
+    def test_reload_deferred(self):
+        can_reload = Mock(return_value=False)
+        can_restart = Mock(return_value=True)
+        self._reload_hook(can_reload_now_f=can_reload,
+                          can_restart_now_f=can_restart)
+        can_reload.assert_called_once_with('svc-c', [self.c])
+        self.assertFalse(can_restart.called)
+        self.assertFalse(self.service.called)
+
+    def test_not_reloadable(self):
+        self._hook(self.c)
+        self.service.reset_mock()
+        self.gw.value = 2
+        self.note.value = 'y'
+        reload_options = {'svc-c': {self.c: {('DEFAULT', 'debug')}},
+                          'svc-a': {self.a: {('DEFAULT', 'gw')}}}
+        self._hook(self.c, self.a, reload_options=reload_options)
+        self.service.assert_has_calls([call('restart', 'svc-a'),
+                                       call('restart', 'svc-common'),
+                                       call('restart', 'svc-c')],
+                                      any_order=True)
+        self.assertEqual(self.service.call_count, 3)
+
+    @patch.object(neutron_templating.subprocess, 'call')
+    @patch.object(neutron_templating.host, 'service_running')
+    @patch.object(neutron_templating.host, 'init_is_systemd')
+    def test_reload_service(self, _systemd, _running, _call):
+        self.assertTrue(neutron_templating.reload_service('svc'))
+        self.assertFalse(_call.called)
+        self.service.return_value = False
+        _systemd.return_value = True
+        _running.return_value = True
+        _call.return_value = 0
+        self.assertTrue(neutron_templating.reload_service('svc'))
+        _call.assert_called_once_with(['systemctl', 'kill', '--signal=HUP',
+                                       '--kill-who=main', 'svc'])
+        _running.return_value = False
+        self.assertFalse(neutron_templating.reload_service('svc'))
+
+    @patch.object(neutron_templating.deferred_events.hookenv, 'service_name')
+    @patch.object(neutron_templating.deferred_events, 'save_event')
+    @patch.object(neutron_templating.deferred_events, 'is_restart_permitted')
+    def test_check_and_record_reload_request(self, _permitted, _save_event,
+                                             _service_name):
+        _service_name.return_value = 'neutron-gateway'
+        _permitted.return_value = True
+        self.assertTrue(neutron_templating.check_and_record_reload_request(
+            'svc-c', [self.c]))
+        self.assertFalse(_save_event.called)
+        _permitted.return_value = False
+        self.assertFalse(neutron_templating.check_and_record_reload_request(
+            'svc-c', [self.c, self.c]))
+        event = _save_event.call_args[0][0]
+        self.assertEqual(event.service, 'svc-c')
+        self.assertEqual(event.action, 'reload')
+        self.assertEqual(event.reason,
+                         'Reloadable option(s) changed: {}'.format(self.c))
+
+    @patch.object(neutron_templating.host, 'service_restart')
+    @patch.object(neutron_templating, 'reload_service')
+    @patch.object(neutron_templating.deferred_events, 'clear_deferred_events')
+    @patch.object(neutron_templating.deferred_events, 'get_deferred_events')
+    def test_process_deferred_reloads(self, _events, _clear, _reload,
+                                      _restart):
+        event = neutron_templating.deferred_events.ServiceEvent
+        _events.return_value = [
+            event(1, 'svc-a', 'Reloadable option(s) changed', 'reload',
+                  'neutron-gateway'),
+            event(2, 'svc-b', 'Reloadable option(s) changed', 'reload',
+                  'neutron-gateway'),
+            event(3, 'svc-b', 'File(s) changed', 'restart',
+                  'neutron-gateway'),
+            event(4, 'svc-c', 'Reloadable option(s) changed', 'reload',
+                  'neutron-gateway'),
+        ]
+        _reload.side_effect = lambda svc: svc != 'svc-c'
+        self.assertEqual(neutron_templating.process_deferred_reloads(),
+                         ['svc-a', 'svc-c'])
+        _reload.assert_has_calls([call('svc-a'), call('svc-c')])
+        _restart.assert_called_once_with('svc-c')
+        _clear.assert_called_once_with(['svc-a', 'svc-c'], 'reload')
+
+
+class TestParseINI(CharmTestCase):
+
+    def setUp(self):
+        super(TestParseINI, self).setUp(neutron_templating, TO_PATCH)
+
+    def test_parse(self):
+        content = (b'# comment\n'
+                   b'[DEFAULT]\n'
+                   b'debug = True\n'
+                   b'transport_url = rabbit://u:p@10.0.0.1:5672/os\n'
+                   b'; other comment\n'
+                   b'\n'
+                   b'[agent]\n'
+                   b'extensions: fwaas\n'
+                   b'  qos\n'
+                   b'dnsmasq_flag = a=1\n'
+                   b'dnsmasq_flag = b=2\n'
+                   b'[empty]\n')
+        self.assertEqual(neutron_templating.parse_ini(content), {
+            'DEFAULT': {'debug': ['True'],
+                        'transport_url': ['rabbit://u:p@10.0.0.1:5672/os']},
+            'agent': {'extensions': ['fwaas\nqos'],
+                      'dnsmasq_flag': ['a=1', 'b=2']},
+        })
+
+    def test_options_changed(self):
+        old = '# url: a\n[DEFAULT]\nx = 1\ny = 2\n[agent]\nz = 3\n'
+        reordered = '[agent]\nz=3\n\n[DEFAULT]\n# url: b\ny = 2\nx = 1\n'
+        self.assertFalse(neutron_templating.options_changed(old, reordered))
+        self.assertTrue(neutron_templating.options_changed(
+            old, old.replace('z = 3', 'z = 4')))
+        self.assertTrue(neutron_templating.options_changed(
+            old, old + '[new]\nz = 3\n'))
+        self.assertTrue(neutron_templating.options_changed(None, old))
+        self.assertEqual(
+            neutron_templating.changed_options(
+                old, old.replace('z = 3', 'z = 4') + 'w = 5\n'),
+            {('agent', 'z'), ('agent', 'w')})
+        self.assertEqual(neutron_templating.changed_options(None, old),
+                         {('DEFAULT', 'x'), ('DEFAULT', 'y'), ('agent', 'z')})
+        self.assertFalse(neutron_templating.options_changed(None, None))
@@ -0,0 +1,131 @@
+import subprocess
+
+from multiprocessing.pool import ThreadPool
+from subprocess import check_output
+
+import charmhelpers.core.unitdata as unitdata
+import neutron_trace
+
+from test_utils import (
+    CharmTestCase
+)
+
+TO_PATCH = []
+
+
+def check_output_by_name():
+    return check_output(['true'])
+
+
+class TestHookTrace(CharmTestCase):
+
+    def setUp(self):
+        super(TestHookTrace, self).setUp(neutron_trace, TO_PATCH)
+        self.kv = unitdata.Storage(':memory:')
+        self.patch_object(neutron_trace.unitdata, 'kv', return_value=self.kv)
+
+    def test_trace_hook(self):
+        with neutron_trace.trace_hook('config-changed') as trace:
+            subprocess.check_output(['true'])
+            subprocess.check_call(['/bin/true', 'secret'])
+            subprocess.call(['false'])
+            subprocess.run('true --x', shell=True)
+            with self.assertRaises(subprocess.CalledProcessError):
+                subprocess.check_call(['false'])
+            with self.assertRaises(OSError):
+                subprocess.call(['/nonexistent/binary'])
+        caller = __name__ + '.test_trace_hook'
+        self.assertEqual(
+            [(s.command, s.returncode, s.caller) for s in trace.spans],
+            [('true', 0, caller),
+             ('true', 0, caller),
+             ('false', 1, caller),
+             ('true', 0, caller),
+             ('false', 1, caller),
+             ('binary', None, caller)])
+        # untraced again
+        subprocess.call(['true'])
+        self.assertEqual(len(trace.spans), 6)
+        summary = neutron_trace.history()[-1]
+        self.assertEqual(summary['hook'], 'config-changed')
+        self.assertEqual(summary['calls'], 6)
+        self.assertEqual(summary['failed'], 3)
+        self.assertEqual(
+            summary['sites'][caller + ' true'][0], 3)
+
+    def test_trace_imported_names(self):
+        with neutron_trace.trace_hook('install') as trace:
+            check_output_by_name()
+        self.assertEqual([s.caller for s in trace.spans],
+                         [__name__ + '.check_output_by_name'])
+        self.assertIs(check_output, subprocess.check_output)
+
+    def test_trace_threads(self):
+        def run_in_thread(_):
+            subprocess.check_call(['sleep', '0.2'])
+
+        pool = ThreadPool(4)
+        with neutron_trace.trace_hook('stop') as trace:
+            pool.map(run_in_thread, range(4))
+            subprocess.check_output(['true'])
+        pool.close()
+        pool.join()
+        # calls overlapping in other threads are spans of their own
+        self.assertEqual(sorted((s.command, s.caller) for s in trace.spans),
+                         [('sleep', __name__ + '.run_in_thread')] * 4 +
+                         [('true', __name__ + '.test_trace_threads')])
+
+    def test_disabled(self):
+        with neutron_trace.trace_hook('install', enabled=False) as trace:
+            self.assertIsNone(trace)
+            subprocess.call(['true'])
+        self.assertEqual(neutron_trace.history(), [])
+
+    def test_history_size(self):
+        self.patch_object(neutron_trace, 'HISTORY_SIZE', new=3)
+        for i in range(5):
+            with neutron_trace.trace_hook('hook-{}'.format(i)):
+                pass
+        self.assertEqual([s['hook'] for s in neutron_trace.history()],
+                         ['hook-2', 'hook-3', 'hook-4'])
+
+    def test_command_name(self):
+        self.assertEqual(neutron_trace.command_name(['/usr/bin/ip', 'l']),
+                         'ip')
+        self.assertEqual(neutron_trace.command_name(b'apt-get install'),
+                         'apt-get')
+        self.assertEqual(neutron_trace.command_name(None), '?')
+
+
+class TestHookStats(CharmTestCase):
+
+    def setUp(self):
+        super(TestHookStats, self).setUp(neutron_trace, TO_PATCH)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(neutron_trace.percentile(values, 50), 50)
+        self.assertEqual(neutron_trace.percentile(values, 99), 99)
+        self.assertEqual(neutron_trace.percentile([3, 1, 2], 90), 3)
+        self.assertEqual(neutron_trace.percentile([5], 0), 5)
+        self.assertIsNone(neutron_trace.percentile([], 50))
+
+    def test_hook_stats(self):
+        summaries = [
+            {'hook': 'update-status', 'duration': d, 'subprocess': d / 2,
+             'sites': {'hookenv.config_get config-get': [1, d / 2, d / 2]}}
+            for d in (1.0, 2.0, 3.0, 4.0)]
+        summaries.append(
+            {'hook': 'config-changed', 'duration': 30.0, 'subprocess': 25.0,
+             'sites': {'ovs.add_bridge ovs-vsctl': [5, 20.0, 8.0],
+                       'hookenv.config_get config-get': [1, 5.0, 5.0]}})
+        hooks, sites = neutron_trace.hook_stats(summaries, top=2)
+        self.assertEqual(hooks['update-status'], {
+            'count': 4, 'p50': 2.0, 'p90': 4.0, 'p99': 4.0, 'max': 4.0,
+            'subprocess-p50': 1.0})
+        self.assertEqual(hooks['config-changed']['count'], 1)
+        self.assertEqual(sites, [
+            {'site': 'ovs.add_bridge ovs-vsctl', 'calls': 5, 'total': 20.0,
+             'max': 8.0},
+            {'site': 'hookenv.config_get config-get', 'calls': 5,
+             'total': 10.0, 'max': 5.0}])
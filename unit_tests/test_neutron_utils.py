@@ -1,7 +1,16 @@
+import os
+import shutil
+import tempfile
+
 from unittest.mock import MagicMock, call, patch, ANY
 
 import charmhelpers.core.hookenv as hookenv
+import charmhelpers.core.unitdata as unitdata
+import neutron_contexts
 import neutron_utils
+from neutron_interfaces import Interface, InterfaceInventory
+from neutron_ovs import OVSDBSnapshot, decode_ovsdb
+from neutron_services import ServiceState
 try:
     import neutronclient
 except ImportError:
@@ -22,11 +31,10 @@ TO_PATCH = [
     'filter_missing_packages',
     'configure_installation_source',
     'log',
-    'add_bridge',
-    'add_bridge_port',
-    'add_ovsbridge_linuxbridge',
-    'get_bridges_and_ports_map',
-    'is_linuxbridge_interface',
+    'load_ovsdb_snapshot',
+    'apply_ovs_changes',
+    'interface_inventory',
+    'reset_interface_inventory',
     'headers_package',
     'full_restart',
     'os_release',
@@ -43,8 +51,6 @@ TO_PATCH = [
     'init_is_systemd',
     'os_application_version_set',
     'NeutronAPIContext',
-    'enable_ipfix',
-    'disable_ipfix',
     'disable_neutron_lbaas',
 ]
 
@@ -53,6 +59,15 @@ class TestNeutronUtils(CharmTestCase):
 
     def setUp(self):
         super(TestNeutronUtils, self).setUp(neutron_utils, TO_PATCH)
+        self.patch_object(neutron_contexts, 'config', name='contexts_config',
+                          side_effect=self.test_config.get)
+        self.interface_inventory.return_value = fake_inventory()
+        self.patch_object(neutron_contexts, 'interface_inventory',
+                          name='contexts_inventory',
+                          side_effect=lambda: self.interface_inventory())
+        self.ExternalPortContext.return_value = \
+            DummyExternalPortContext(return_value=None)
+        self.load_ovsdb_snapshot.return_value = OVSDBSnapshot({})
         self.headers_package.return_value = 'linux-headers-2.6.18'
         self._set_distrib_codename('trusty')
         self.maxDiff = None
@@ -275,6 +290,10 @@ class TestNeutronUtils(CharmTestCase):
         self.os_release.return_value = 'juno'
         self.assertTrue('keepalived' in neutron_utils.get_packages())
 
+    def _ovs_plan(self):
+        self.assertTrue(self.apply_ovs_changes.called)
+        return self.apply_ovs_changes.call_args[0][0]
+
     @patch('charmhelpers.contrib.network.ovs.charm_name')
     @patch('charmhelpers.contrib.openstack.context.config')
     def test_configure_ovs_starts_service_if_required(
@@ -302,22 +321,34 @@ class TestNeutronUtils(CharmTestCase):
         self.ExternalPortContext.return_value = \
             DummyExternalPortContext(return_value={'ext_port': 'eth0'})
         neutron_utils.configure_ovs()
-        self.add_bridge.assert_has_calls([
-            call('br-int', brdata=ANY),
-            call('br-ex', brdata=ANY),
-            call('br-data', brdata=ANY)
+        plan = self._ovs_plan()
+        self.assertEqual(plan.commands, [
+            ('--may-exist', 'add-br', 'br-int'),
+            ('set', 'bridge', 'br-int',
+             'external-ids:charm-neutron-gateway=managed'),
+            ('--may-exist', 'add-br', 'br-ex'),
+            ('set', 'bridge', 'br-ex',
+             'external-ids:charm-neutron-gateway=managed'),
+            ('--may-exist', 'add-br', 'br-data'),
+            ('set', 'bridge', 'br-data',
+             'external-ids:charm-neutron-gateway=managed'),
+            ('--may-exist', 'add-port', 'br-ex', 'eth0'),
+            ('set', 'Interface', 'eth0',
+             'external-ids:charm-neutron-gateway=br-ex'),
+            ('set', 'Port', 'eth0',
+             'external-ids:charm-neutron-gateway=br-ex'),
         ])
-        self.add_bridge_port.assert_called_with(
-            'br-ex', 'eth0', ifdata=ANY, portdata=ANY
-        )
+        self.assertEqual(plan.links, [('eth0', 'up'),
+                                      ('eth0', 'promisc', 'off')])
+        # ext-port is not a data-port, no need to reapply the MTU
+        self.assertFalse(self.service_restart.called)
 
-    @patch('charmhelpers.contrib.openstack.context.list_nics',
-           return_value=['eth0', 'eth0.100', 'eth0.200'])
     @patch('charmhelpers.contrib.network.ovs.charm_name')
     @patch('charmhelpers.contrib.openstack.context.config')
-    def test_configure_ovs_ovs_data_port(self, mock_config, charm_name, _nics):
+    def test_configure_ovs_ovs_data_port(self, mock_config, charm_name):
         charm_name.return_value = "neutron-gateway"
-        self.is_linuxbridge_interface.return_value = False
+        self.interface_inventory.return_value = fake_inventory(
+            'eth0', 'eth0.100', 'eth0.200')
         mock_config.side_effect = self.test_config.get
         self.config.side_effect = self.test_config.get
         self.test_config.set('plugin', 'ovs')
@@ -327,52 +358,86 @@ class TestNeutronUtils(CharmTestCase):
         # assumed)
         self.test_config.set('data-port', 'eth0')
         neutron_utils.configure_ovs()
-        self.add_bridge.assert_has_calls([
-            call('br-int', brdata=ANY),
-            call('br-ex', brdata=ANY),
-            call('br-data', brdata=ANY)
-        ])
-        calls = [call('br-data', 'eth0', promisc=True, ifdata=ANY,
-                      portdata=ANY)]
-        self.add_bridge_port.assert_has_calls(calls)
+        plan = self._ovs_plan()
+        self.assertIn(('--may-exist', 'add-br', 'br-data'), plan.commands)
+        self.assertIn(('--may-exist', 'add-port', 'br-data', 'eth0'),
+                      plan.commands)
+        self.assertEqual(plan.links, [('eth0', 'up'),
+                                      ('eth0', 'promisc', 'on')])
+        self.service_restart.assert_called_once_with('os-charm-phy-nic-mtu')
 
         # Now test with bridge:port format and bogus bridge
         self.test_config.set('data-port', 'br-foo:eth0')
-        self.add_bridge.reset_mock()
-        self.add_bridge_port.reset_mock()
+        self.apply_ovs_changes.reset_mock()
         neutron_utils.configure_ovs()
-        self.add_bridge.assert_has_calls([
-            call('br-int', brdata=ANY),
-            call('br-ex', brdata=ANY),
-            call('br-data', brdata=ANY)
-        ])
-        # Not called since we have a bogus bridge in data-ports
-        self.assertFalse(self.add_bridge_port.called)
+        plan = self._ovs_plan()
+        self.assertIn(('--may-exist', 'add-br', 'br-data'), plan.commands)
+        # Not added since we have a bogus bridge in data-ports
+        self.assertFalse([c for c in plan.commands if 'add-port' in c])
 
         # Now test with bridge:port format
         self.test_config.set('bridge-mappings', 'net1:br1')
         self.test_config.set('data-port', 'br1:eth0.100 br1:eth0.200')
-        self.add_bridge.reset_mock()
-        self.add_bridge_port.reset_mock()
+        self.apply_ovs_changes.reset_mock()
         neutron_utils.configure_ovs()
-        self.add_bridge.assert_has_calls([
-            call('br-int', brdata=ANY),
-            call('br-ex', brdata=ANY),
-            call('br1', brdata=ANY)
-        ])
-        calls = [
-            call('br1', 'eth0.100', promisc=True, ifdata=ANY, portdata=ANY),
-            call('br1', 'eth0.200', promisc=True, ifdata=ANY, portdata=ANY)]
-        self.add_bridge_port.assert_has_calls(calls, any_order=True)
+        plan = self._ovs_plan()
+        self.assertIn(('--may-exist', 'add-br', 'br1'), plan.commands)
+        self.assertIn(('--may-exist', 'add-port', 'br1', 'eth0.100'),
+                      plan.commands)
+        self.assertIn(('--may-exist', 'add-port', 'br1', 'eth0.200'),
+                      plan.commands)
+
+    @patch('charmhelpers.contrib.network.ovs.charm_name')
+    @patch('charmhelpers.contrib.openstack.context.config')
+    def test_configure_ovs_ovs_data_port_unchanged(
+            self, mock_config, charm_name):
+        charm_name.return_value = "neutron-gateway"
+        self.interface_inventory.return_value = fake_inventory(
+            'eth0', flags=0x103)
+        mock_config.side_effect = self.test_config.get
+        self.config.side_effect = self.test_config.get
+        self.test_config.set('plugin', 'ovs')
+        self.test_config.set('data-port', 'br-data:eth0')
+        self.ExternalPortContext.return_value = \
+            DummyExternalPortContext(return_value=None)
+        managed = ['map', [['charm-neutron-gateway', 'managed']]]
+        port_ids = ['map', [['charm-neutron-gateway', 'br-data']]]
+        self.load_ovsdb_snapshot.return_value = OVSDBSnapshot({
+            'Bridge': [
+                {'_uuid': 'b{}'.format(i), 'name': br,
+                 'ports': ['p1'] if br == 'br-data' else [],
+                 'external_ids': decode_ovsdb(managed), 'ipfix': []}
+                for i, br in enumerate(('br-int', 'br-ex', 'br-data'))],
+            'Port': [{'_uuid': 'p1', 'name': 'eth0',
+                      'external_ids': decode_ovsdb(port_ids)}],
+            'Interface': [{'_uuid': 'i1', 'name': 'eth0',
+                           'external_ids': decode_ovsdb(port_ids)}],
+        })
+        plan = neutron_utils.configure_ovs()
+        self.assertFalse(plan)
+        self.assertFalse(self.service_restart.called)
+
+    @patch('charmhelpers.contrib.network.ovs.charm_name')
+    @patch('charmhelpers.contrib.openstack.context.config')
+    def test_configure_ovs_dry_run(self, mock_config, charm_name):
+        charm_name.return_value = "neutron-gateway"
+        mock_config.side_effect = self.test_config.get
+        self.config.side_effect = self.test_config.get
+        self.test_config.set('plugin', 'ovs')
+        self.service_running.return_value = False
+        plan = neutron_utils.configure_ovs(dry_run=True)
+        self.assertIn(('--may-exist', 'add-br', 'br-int'), plan.commands)
+        self.assertFalse(self.full_restart.called)
+        self.assertFalse(self.apply_ovs_changes.called)
+        self.assertFalse(self.service_restart.called)
 
-    @patch('charmhelpers.contrib.openstack.context.list_nics',
-           return_value=['br-eth0'])
     @patch('charmhelpers.contrib.network.ovs.charm_name')
     @patch('charmhelpers.contrib.openstack.context.config')
     def test_configure_ovs_ovs_data_port_bridge(
-            self, mock_config, charm_name, _nics):
+            self, mock_config, charm_name):
         charm_name.return_value = "neutron-gateway"
-        self.is_linuxbridge_interface.return_value = True
+        self.interface_inventory.return_value = fake_inventory(
+            'br-eth0', linux_bridge=True)
         mock_config.side_effect = self.test_config.get
         self.config.side_effect = self.test_config.get
         self.test_config.set('plugin', 'ovs')
@@ -382,24 +447,16 @@ class TestNeutronUtils(CharmTestCase):
         # assumed)
         self.test_config.set('data-port', 'br-eth0')
         neutron_utils.configure_ovs()
+        plan = self._ovs_plan()
 
         # Also check that new bridges and ports are marked as managed by us:
-        expected_brdata = {
-            'external-ids': {'charm-neutron-gateway': 'managed'},
-        }
-        expected_ifdata = {
-            'external-ids': {'charm-neutron-gateway': 'br-data'},
-        }
-        expected_portdata = expected_ifdata
-
-        self.add_bridge.assert_has_calls([
-            call('br-int', brdata=expected_brdata),
-            call('br-ex', brdata=expected_brdata),
-            call('br-data', brdata=expected_brdata)
-        ])
-        calls = [call('br-data', 'br-eth0', ifdata=expected_ifdata,
-                      portdata=expected_portdata)]
-        self.add_ovsbridge_linuxbridge.assert_has_calls(calls)
+        for br in ('br-int', 'br-ex', 'br-data'):
+            self.assertIn(('set', 'bridge', br,
+                           'external-ids:charm-neutron-gateway=managed'),
+                          plan.commands)
+        self.assertEqual(
+            plan.linuxbridges,
+            [('br-data', 'br-eth0', {'charm-neutron-gateway': 'br-data'})])
 
     @patch('charmhelpers.contrib.network.ovs.charm_name')
     @patch('charmhelpers.contrib.openstack.context.config')
@@ -410,11 +467,14 @@ class TestNeutronUtils(CharmTestCase):
         self.test_config.set('plugin', 'ovs')
         self.test_config.set('ipfix-target', '127.0.0.1:80')
         neutron_utils.configure_ovs()
-        self.enable_ipfix.assert_has_calls([
-            call('br-int', '127.0.0.1:80'),
-            call('br-ex', '127.0.0.1:80'),
-            call('br-data', '127.0.0.1:80'),
-        ])
+        plan = self._ovs_plan()
+        for i, br in enumerate(('br-int', 'br-ex', 'br-data')):
+            self.assertIn(('set', 'Bridge', br, 'ipfix=@ipfix{}'.format(i)),
+                          plan.commands)
+            self.assertIn(('--id=@ipfix{}'.format(i), 'create', 'IPFIX',
+                           'targets="127.0.0.1:80"', 'sampling=64',
+                           'cache_active_timeout=60', 'cache_max_flows=128'),
+                          plan.commands)
 
     @patch.object(neutron_utils, 'DataPortContext')
     @patch('charmhelpers.contrib.network.ovs.charm_name')
@@ -425,10 +485,6 @@ class TestNeutronUtils(CharmTestCase):
         mock_config.side_effect = self.test_config.get
         self.config.side_effect = self.test_config.get
         self.test_config.set('plugin', 'ovs')
-        self.get_bridges_and_ports_map.return_value = {
-            'br-data': ['p4', 'p5'],
-            'br1': ['p6'],
-        }
         self.test_config.set(
             'data-port',
             'br-data:p4 br-data:p5 br1:p6')
@@ -442,14 +498,13 @@ class TestNeutronUtils(CharmTestCase):
                 'p5': 'br-data',
                 'p6': 'br1',
             })
-        self.is_linuxbridge_interface.return_value = False
         neutron_utils.configure_ovs()
         # Ensure that ext-port was ignored.
-        self.assertNotIn(call('br-ex', 'eth0', ifdata=ANY, portdata=ANY),
-                         self.add_bridge_port.call_args_list)
+        self.assertNotIn(('--may-exist', 'add-port', 'br-ex', 'eth0'),
+                         self._ovs_plan().commands)
 
     @patch.object(neutron_utils, 'register_configs')
-    @patch('charmhelpers.contrib.openstack.templating.OSConfigRenderer')
+    @patch.object(neutron_utils, 'NeutronConfigRenderer')
     def test_do_openstack_upgrade(self, mock_renderer,
                                   mock_register_configs):
         self.patch_object(neutron_utils, 'disable_nova_metadata',
@@ -463,8 +518,10 @@ class TestNeutronUtils(CharmTestCase):
         self.get_os_codename_install_source.return_value = 'havana'
         self.os_release.return_value = 'havana'
         self.filter_missing_packages.side_effect = lambda x: x
+        self.patch_object(neutron_utils, 'reset_derived_maps')
         neutron_utils.do_openstack_upgrade(mock_configs)
         mock_register_configs.assert_called_with('havana')
+        self.reset_derived_maps.assert_called_once_with()
         self.assertTrue(self.log.called)
         self.apt_update.assert_called_with(fatal=True)
         dpkg_opts = [
@@ -481,7 +538,7 @@ class TestNeutronUtils(CharmTestCase):
         self.apt_autoremove.assert_not_called()
 
     @patch.object(neutron_utils, 'register_configs')
-    @patch('charmhelpers.contrib.openstack.templating.OSConfigRenderer')
+    @patch.object(neutron_utils, 'NeutronConfigRenderer')
     def test_do_openstack_upgrade_rocky(self, mock_renderer,
                                         mock_register_configs):
         self.patch_object(neutron_utils, 'disable_nova_metadata',
@@ -517,7 +574,7 @@ class TestNeutronUtils(CharmTestCase):
         )
         self.service_restart.assert_called_once_with('neutron-metadata-agent')
 
-    @patch('charmhelpers.contrib.openstack.templating.OSConfigRenderer')
+    @patch.object(neutron_utils, 'NeutronConfigRenderer')
     def test_register_configs_ovs(self, mock_renderer):
         self.patch_object(neutron_utils, 'disable_nova_metadata',
                           return_value=False)
@@ -535,7 +592,7 @@ class TestNeutronUtils(CharmTestCase):
         for conf in confs:
             configs.register.assert_any_call(conf, ANY)
 
-    @patch('charmhelpers.contrib.openstack.templating.OSConfigRenderer')
+    @patch.object(neutron_utils, 'NeutronConfigRenderer')
     def test_register_configs_ovs_odl(self, mock_renderer):
         self.patch_object(neutron_utils, 'disable_nova_metadata',
                           return_value=False)
@@ -554,7 +611,7 @@ class TestNeutronUtils(CharmTestCase):
         for conf in confs:
             configs.register.assert_any_call(conf, ANY)
 
-    @patch('charmhelpers.contrib.openstack.templating.OSConfigRenderer')
+    @patch.object(neutron_utils, 'NeutronConfigRenderer')
     def test_register_configs_amqp_nova(self, mock_renderer):
         self.patch_object(neutron_utils, 'disable_nova_metadata',
                           return_value=False)
@@ -572,6 +629,91 @@ class TestNeutronUtils(CharmTestCase):
         for conf in confs:
             configs.register.assert_any_call(conf, ANY)
 
+    @patch.object(neutron_utils, 'deepcopy', wraps=neutron_utils.deepcopy)
+    def test_derived_maps_memoized(self, _deepcopy):
+        self.patch_object(neutron_utils, 'disable_nova_metadata',
+                          return_value=False)
+        self.config.return_value = 'ovs'
+        self.disable_neutron_lbaas.return_value = False
+        self.NeutronAPIContext.return_value = \
+            lambda: {'enable_l3ha': False}
+        self.os_release.return_value = 'icehouse'
+        _map = neutron_utils.restart_map()
+        copies = _deepcopy.call_count
+        self.assertEqual(neutron_utils.restart_map(), _map)
+        neutron_utils.services()
+        neutron_utils.get_packages()
+        neutron_utils.register_configs()
+        self.assertEqual(_deepcopy.call_count, copies)
+
+        # callers are free to modify what they get back
+        _map[neutron_utils.NEUTRON_CONF].append('foo')
+        neutron_utils.services().append('foo')
+        neutron_utils.get_packages().append('foo')
+        self.assertNotIn(
+            'foo', neutron_utils.restart_map()[neutron_utils.NEUTRON_CONF])
+        self.assertNotIn('foo', neutron_utils.services())
+        self.assertNotIn('foo', neutron_utils.get_packages())
+
+        # inputs are only read once per hook
+        releases = self.os_release.call_count
+        api_contexts = self.NeutronAPIContext.call_count
+        self.disable_neutron_lbaas.return_value = True
+        neutron_utils.restart_map()
+        neutron_utils.services()
+        self.assertEqual(self.os_release.call_count, releases)
+        self.assertEqual(self.NeutronAPIContext.call_count, api_contexts)
+        self.assertEqual(_deepcopy.call_count, copies)
+
+        # until they are reset, yielding fresh values
+        neutron_utils.reset_derived_maps()
+        self.assertNotEqual(neutron_utils.restart_map(), _map)
+        self.assertGreater(_deepcopy.call_count, copies)
+        self.assertGreater(self.os_release.call_count, releases)
+
+    def test_option_diff_paths(self):
+        self.config.side_effect = self.test_config.get
+        self.assertEqual(neutron_utils.option_diff_paths(), [])
+        self.test_config.set('restart-on-option-change', True)
+        self.assertEqual(neutron_utils.option_diff_paths(),
+                         neutron_utils.OPTION_DIFF_FILES)
+        self.assertNotIn(neutron_utils.NEUTRON_METADATA_AGENT_CONF,
+                         neutron_utils.option_diff_paths())
+        self.test_config.set('always-restart-files',
+                             '/etc/neutron/neutron.conf /etc/nova/nova.conf')
+        self.assertEqual(neutron_utils.option_diff_paths(),
+                         [neutron_utils.NEUTRON_L3_AGENT_CONF,
+                          neutron_utils.NEUTRON_DHCP_AGENT_CONF,
+                          neutron_utils.NEUTRON_OVS_AGENT_CONF])
+
+    def test_service_sections(self):
+        self.config.side_effect = self.test_config.get
+        self.assertEqual(neutron_utils.service_sections(), {})
+        self.test_config.set('restart-on-option-change', True)
+        self.assertEqual(neutron_utils.service_sections(), {
+            'neutron-metadata-agent': {
+                neutron_utils.NEUTRON_CONF: {'default', 'agent',
+                                             'oslo_messaging_rabbit'}}})
+        self.test_config.set('always-restart-files',
+                             '/etc/neutron/neutron.conf')
+        self.assertEqual(neutron_utils.service_sections(), {})
+
+    @patch.object(neutron_utils, 'restart_map')
+    def test_reload_options(self, _restart_map):
+        _restart_map.return_value = {
+            neutron_utils.NEUTRON_CONF: ['neutron-l3-agent',
+                                         'neutron-dhcp-agent'],
+            neutron_utils.NEUTRON_DHCP_AGENT_CONF: ['neutron-dhcp-agent'],
+            neutron_utils.NEUTRON_DNSMASQ_CONF: ['neutron-dhcp-agent'],
+        }
+        debug = {('DEFAULT', 'debug')}
+        self.assertEqual(neutron_utils.reload_options(), {
+            'neutron-l3-agent': {neutron_utils.NEUTRON_CONF: debug},
+            'neutron-dhcp-agent': {
+                neutron_utils.NEUTRON_CONF: debug,
+                neutron_utils.NEUTRON_DHCP_AGENT_CONF: debug},
+        })
+
     @patch.object(neutron_utils, 'get_packages')
     def test_restart_map_ovs(self, mock_get_packages):
         self.patch_object(neutron_utils, 'disable_nova_metadata',
@@ -675,7 +817,7 @@ class TestNeutronUtils(CharmTestCase):
 
         self.assertEqual(neutron_utils.restart_map(), ex_map)
 
-    @patch('charmhelpers.contrib.openstack.templating.OSConfigRenderer')
+    @patch.object(neutron_utils, 'NeutronConfigRenderer')
     def test_register_configs_nsx(self, mock_renderer):
         self.patch_object(neutron_utils, 'disable_nova_metadata',
                           return_value=False)
@@ -705,7 +847,7 @@ class TestNeutronUtils(CharmTestCase):
             any_order=True,
         )
 
-    @patch('charmhelpers.contrib.openstack.templating.OSConfigRenderer')
+    @patch.object(neutron_utils, 'NeutronConfigRenderer')
     def test_register_configs_pre_install(self, mock_renderer):
         self.patch_object(neutron_utils, 'disable_nova_metadata',
                           return_value=False)
@@ -845,6 +987,14 @@ class DummyNetworkServiceContext():
         return self.return_value
 
 
+def fake_inventory(*names, linux_bridge=False, flags=0):
+    return InterfaceInventory([
+        Interface(name=name, index=index, hwaddr='', mtu=1500, physical=False,
+                  master=None, bond_master=None, bridge_member=False,
+                  linux_bridge=linux_bridge, lower=[], flags=flags)
+        for index, name in enumerate(names, 1)])
+
+
 class DummyExternalPortContext():
 
     def __init__(self, return_value):
@@ -877,10 +1027,12 @@ class TestNeutronAgentReallocation(CharmTestCase):
                                                         TO_PATCH)
 
     def tearDown(self):
+        super(TestNeutronAgentReallocation, self).tearDown()
         # Reset cached cache
         hookenv.cache = {}
 
-    def test_assess_status(self):
+    @patch.object(neutron_utils, 'save_status_digest')
+    def test_assess_status(self, save_status_digest):
         with patch.object(neutron_utils, 'assess_status_func') as asf:
             callee = MagicMock()
             asf.return_value = callee
@@ -890,14 +1042,90 @@ class TestNeutronAgentReallocation(CharmTestCase):
             self.os_application_version_set.assert_called_with(
                 neutron_utils.VERSION_PACKAGE
             )
+            save_status_digest.assert_called_once_with()
+
+    def _status_digest(self):
+        kv = MagicMock()
+        store = {}
+        kv.get.side_effect = lambda k, default=None: store.get(k, default)
+        kv.set.side_effect = store.__setitem__
+        self.patch_object(neutron_utils.unitdata, 'kv', return_value=kv)
+        self.patch_object(neutron_utils, 'services',
+                          return_value=['s1', 'neutron-metadata-agent'])
+        self.patch_object(neutron_utils, 'STOPPED_SERVICES',
+                          new=['neutron-metadata-agent'])
+        self.patch_object(neutron_utils, 'is_unit_paused_set',
+                          return_value=False)
+        self.patch_object(neutron_utils, 'service_states', return_value={
+            's1': ServiceState('active', 'running', 'Sun 2026-10-18')})
+        self.patch_object(neutron_utils, 'dpkg_stamp',
+                          return_value=[1, 2])
+        self.patch_object(neutron_utils.deferred_events,
+                          'get_deferred_events', return_value=[])
+        self.patch_object(neutron_utils, 'relation_ids',
+                          side_effect=lambda r: {'amqp': ['amqp:1']}.get(
+                              r, []))
+        self.init_is_systemd.return_value = True
+        self.os_release.return_value = 'ussuri'
+        return store
+
+    def test_save_status_digest(self):
+        store = self._status_digest()
+        neutron_utils.save_status_digest()
+        self.assertEqual(store[neutron_utils.STATUS_DIGEST_KEY], {
+            'services': ['s1'],
+            'interfaces': ['amqp', 'ha', 'neutron-plugin-api',
+                           'quantum-network-service'],
+            'release': 'ussuri',
+            'inputs': {
+                'paused': False,
+                'running': {'s1': ['active', 'Sun 2026-10-18']},
+                'relations': {'amqp': ['amqp:1'], 'ha': [],
+                              'neutron-plugin-api': [],
+                              'quantum-network-service': []},
+                'deferred': [],
+                'dpkg': [1, 2],
+            }})
+        self.service_states.assert_called_once_with(['s1'])
+
+    def test_status_unchanged(self):
+        store = self._status_digest()
+        self.assertFalse(neutron_utils.status_unchanged())
+        neutron_utils.save_status_digest()
+        self.services.reset_mock()
+        self.assertTrue(neutron_utils.status_unchanged())
+        self.assertFalse(self.services.called)
+        self.service_states.return_value = {
+            's1': ServiceState('active', 'running', 'Sun 2026-10-19')}
+        self.assertFalse(neutron_utils.status_unchanged())
+        self.service_states.return_value = {
+            's1': ServiceState('failed', 'failed', 'Sun 2026-10-18')}
+        self.assertFalse(neutron_utils.status_unchanged())
+        self.service_states.return_value = {
+            's1': ServiceState('active', 'running', 'Sun 2026-10-18')}
+        self.relation_ids.side_effect = lambda r: []
+        self.assertFalse(neutron_utils.status_unchanged())
+        self.relation_ids.side_effect = None
+        self.relation_ids.return_value = []
+        neutron_utils.save_status_digest()
+        self.get_deferred_events.return_value = [
+            MagicMock(service='s1', action='reload')]
+        self.assertFalse(neutron_utils.status_unchanged())
+        self.init_is_systemd.return_value = False
+        self.assertFalse(neutron_utils.status_unchanged())
+        self.assertIn(neutron_utils.STATUS_DIGEST_KEY, store)
 
     @patch.object(neutron_utils, 'get_optional_interfaces')
     @patch.object(neutron_utils, 'sequence_status_check_functions')
     @patch.object(neutron_utils, 'REQUIRED_INTERFACES')
     @patch.object(neutron_utils, 'services')
-    @patch.object(neutron_utils, 'make_assess_status_func')
+    @patch.object(neutron_utils, 'deferred_reloads')
+    @patch.object(neutron_utils, 'status_set')
+    @patch.object(neutron_utils, '_determine_os_workload_status')
     def test_assess_status_func(self,
-                                make_assess_status_func,
+                                determine_status,
+                                status_set,
+                                deferred_reloads,
                                 services,
                                 REQUIRED_INTERFACES,
                                 sequence_functions,
@@ -906,15 +1134,33 @@ class TestNeutronAgentReallocation(CharmTestCase):
         REQUIRED_INTERFACES.copy.return_value = {'int': ['test 1']}
         get_optional_interfaces.return_value = {'opt': ['test 2']}
         sequence_functions.return_value = 'sequence_return'
-        neutron_utils.assess_status_func('test-config')
+        determine_status.return_value = ('active', 'Unit is ready')
+        deferred_reloads.return_value = []
+        status_func = neutron_utils.assess_status_func('test-config')
+        sequence_functions.assert_called_once_with(
+            neutron_utils.check_optional_relations,
+            neutron_utils.check_ext_port_data_port_config)
+        with patch.object(neutron_utils,
+                          'batched_service_checks') as batched:
+            self.assertIsNone(status_func())
+            batched.assert_called_once_with(['s1'])
         # ports=None whilst port checks are disabled.
-        make_assess_status_func.assert_called_once_with(
+        determine_status.assert_called_once_with(
             'test-config',
             {'int': ['test 1'], 'opt': ['test 2']},
             charm_func='sequence_return', services=['s1'], ports=None)
-        sequence_functions.assert_called_once_with(
-            neutron_utils.check_optional_relations,
-            neutron_utils.check_ext_port_data_port_config)
+        status_set.assert_called_once_with('active', 'Unit is ready')
+
+        # deferred reloads are listed after the charmhelpers message
+        status_set.reset_mock()
+        determine_status.return_value = (
+            'blocked', 'Services not running: s1. '
+            'Services queued for restart: s2')
+        deferred_reloads.return_value = ['s3', 's4']
+        message = ('Services not running: s1. Services queued for restart: '
+                   's2. Services queued for reload: s3, s4')
+        self.assertEqual(status_func(), message)
+        status_set.assert_called_once_with('blocked', message)
 
     def test_pause_unit_helper(self):
         with patch.object(neutron_utils, '_pause_resume_helper') as prh:
@@ -937,6 +1183,19 @@ class TestNeutronAgentReallocation(CharmTestCase):
             # ports=None whilst port checks are disabled.
             f.assert_called_once_with('assessor', services=['s1'], ports=None)
 
+    @patch.object(neutron_utils, 'neutron_netns')
+    @patch.object(neutron_utils, 'subprocess')
+    def test_cleanup_ovs_netns(self, _subprocess, _netns):
+        _netns.list_namespaces.return_value = ['qrouter-1']
+        _netns.teardown_namespaces.return_value = ['qrouter-1']
+        neutron_utils.cleanup_ovs_netns()
+        _subprocess.call.assert_called_once_with('neutron-ovs-cleanup')
+        # processes in the namespaces are left alone
+        _netns.teardown_namespaces.assert_called_once_with(
+            ['qrouter-1'], log=ANY)
+        self.log.assert_called_with(
+            'Unable to remove namespaces: qrouter-1', level='ERROR')
+
     @patch.object(neutron_utils, 'subprocess')
     @patch.object(neutron_utils, 'shutil')
     @patch('os.path.exists')
@@ -962,24 +1221,113 @@ class TestNeutronAgentReallocation(CharmTestCase):
             ['systemctl', 'daemon-reload']
         )
 
-    @patch.object(neutron_utils, 'context')
-    def test_configure_apparmor_mitaka(self, context):
+    def _patch_apparmor(self, mode='enforce'):
+        self.patch_object(neutron_utils.unitdata, 'kv',
+                          return_value=unitdata.Storage(':memory:'))
+        self.patch_object(neutron_utils, 'file_digest',
+                          side_effect=lambda path: 'digest-' + path)
+        self.patch_object(neutron_utils, '_apparmor_parser')
+        self.patch_object(neutron_utils, '_set_aa_mode_links')
+        self.patch_object(neutron_utils, 'status_set')
+        self.patch_object(neutron_utils.context, 'AppArmorContext')
+        self.AppArmorContext.return_value.return_value = {
+            'aa_profile_mode': mode}
+
+    def test_configure_apparmor_mitaka(self):
+        self._patch_apparmor()
         self.os_release.return_value = 'mitaka'
-        context.AppArmorContext = MagicMock()
         neutron_utils.configure_apparmor()
-        context.AppArmorContext.assert_any_call(
+        self.AppArmorContext.assert_any_call(
             neutron_utils.NEUTRON_LBAAS_AA_PROFILE
         )
 
-    @patch.object(neutron_utils, 'context')
-    def test_configure_apparmor_newton(self, context):
+    def test_configure_apparmor_newton(self):
+        self._patch_apparmor()
         self.os_release.return_value = 'newton'
-        context.AppArmorContext = MagicMock()
         neutron_utils.configure_apparmor()
-        context.AppArmorContext.assert_any_call(
+        self.AppArmorContext.assert_any_call(
             neutron_utils.NEUTRON_LBAASV2_AA_PROFILE
         )
 
+    def test_configure_apparmor_incremental(self):
+        self._patch_apparmor()
+        self.os_release.return_value = 'train'
+        neutron_utils.configure_apparmor()
+        self._apparmor_parser.assert_called_once_with(
+            ['--replace', '--write-cache'],
+            [p for p in neutron_utils.APPARMOR_PROFILES
+             if p != neutron_utils.NEUTRON_LBAAS_AA_PROFILE])
+        self._set_aa_mode_links.assert_any_call(
+            neutron_utils.NEUTRON_L3_AA_PROFILE, 'enforce')
+        # Nothing changed
+        self._apparmor_parser.reset_mock()
+        neutron_utils.configure_apparmor()
+        self.assertFalse(self._apparmor_parser.called)
+        # One profile changed
+        self.file_digest.side_effect = lambda path: (
+            'new' if path.endswith(neutron_utils.NEUTRON_L3_AA_PROFILE)
+            else 'digest-' + path)
+        neutron_utils.configure_apparmor()
+        self._apparmor_parser.assert_called_once_with(
+            ['--replace', '--write-cache'],
+            [neutron_utils.NEUTRON_L3_AA_PROFILE])
+        # Mode changed
+        self._apparmor_parser.reset_mock()
+        self.AppArmorContext.return_value.return_value = {
+            'aa_profile_mode': 'complain'}
+        neutron_utils.configure_apparmor()
+        self._apparmor_parser.assert_called_once_with(
+            ['--replace', '--write-cache', '--complain'], ANY)
+
+    def test_configure_apparmor_disable(self):
+        self._patch_apparmor(mode='disable')
+        self.os_release.return_value = 'train'
+        self._apparmor_parser.side_effect = \
+            neutron_utils.subprocess.CalledProcessError(1, 'apparmor_parser')
+        neutron_utils.configure_apparmor()
+        self._apparmor_parser.assert_called_once_with(['--remove'], ANY)
+        self.assertFalse(self.status_set.called)
+        self._apparmor_parser.reset_mock()
+        neutron_utils.configure_apparmor()
+        self.assertFalse(self._apparmor_parser.called)
+
+    def test_configure_apparmor_failed(self):
+        self._patch_apparmor()
+        self.os_release.return_value = 'train'
+        self._apparmor_parser.side_effect = \
+            neutron_utils.subprocess.CalledProcessError(1, 'apparmor_parser')
+        with self.assertRaises(neutron_utils.subprocess.CalledProcessError):
+            neutron_utils.configure_apparmor()
+        self.status_set.assert_called_once_with('blocked', ANY)
+        # Retried on the next run
+        self._apparmor_parser.side_effect = None
+        self._apparmor_parser.reset_mock()
+        neutron_utils.configure_apparmor()
+        self.assertTrue(self._apparmor_parser.called)
+
+    def test_configure_apparmor_no_context(self):
+        self._patch_apparmor()
+        self.os_release.return_value = 'train'
+        self.AppArmorContext.return_value.return_value = None
+        neutron_utils.configure_apparmor()
+        self.assertFalse(self._apparmor_parser.called)
+
+    def test_set_aa_mode_links(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.patch_object(neutron_utils, 'APPARMOR_DIR', new=tmpdir)
+        disabled = os.path.join(tmpdir, 'disable', 'profile')
+        complain = os.path.join(tmpdir, 'force-complain', 'profile')
+        neutron_utils._set_aa_mode_links('profile', 'disable')
+        self.assertEqual(os.readlink(disabled),
+                         os.path.join(tmpdir, 'profile'))
+        neutron_utils._set_aa_mode_links('profile', 'complain')
+        self.assertFalse(os.path.lexists(disabled))
+        self.assertTrue(os.path.islink(complain))
+        neutron_utils._set_aa_mode_links('profile', 'enforce')
+        self.assertFalse(os.path.lexists(complain))
+        self.assertFalse(os.path.lexists(disabled))
+
     @patch.object(neutron_utils, 'disable_nova_metadata')
     def test_deprecated_services(self, disable_nova_metadata):
         self.os_release.return_value = 'train'